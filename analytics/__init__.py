@@ -0,0 +1,5 @@
+"""Analysis helpers for the research dataset."""
+from analytics.dataset import Dataset, iter_dataset, load_dataset
+from analytics.snapshot import open_snapshot
+
+__all__ = ["Dataset", "iter_dataset", "load_dataset", "open_snapshot"]
@@ -0,0 +1,115 @@
+"""On-disk cache of analysis results.
+
+Results are keyed on the analysis name, its parameters, the database and the
+data version counter that every write to the research data bumps, so a
+cached result is never served for another database or once the data changed. Entries are pickles, which covers arrays
+as well as rendered figures kept as PNG bytes. The least recently used
+entries are evicted once the cache outgrows its size limit.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+
+from models import get_data_version
+from settings import ANALYTICS_CACHE_DIR, ANALYTICS_CACHE_BYTES
+
+
+class ResultCache(object):
+    """Pickled results on disk with least recently used eviction."""
+
+    def __init__(self, directory=ANALYTICS_CACHE_DIR, max_bytes=ANALYTICS_CACHE_BYTES):
+        """Create new instance."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, name, params, version, database=None):
+        """Key of an analysis run with ``params`` on a data version of a database."""
+        return hashlib.sha256(repr((name, params, version, database)).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        """File of a cache entry."""
+        return os.path.join(self.directory, key + ".pkl")
+
+    def get(self, key):
+        """Return ``(True, value)`` for a cached key and ``(False, None)`` otherwise."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            # The modification time orders entries for eviction.
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        return True, value
+
+    def put(self, key, value):
+        """Store a value and evict old entries if the cache is over its limit."""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Readers in other processes see either no entry or a complete one.
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def _entries(self):
+        """``(mtime, size, path)`` of every entry, oldest first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits its limit."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Delete every entry."""
+        if os.path.isdir(self.directory):
+            for _, _, path in self._entries():
+                os.remove(path)
+
+
+cache = ResultCache()
+
+
+def database_id(session):
+    """Identity of the database of a session: its URL without credentials, with SQLite paths made absolute."""
+    url = session.get_bind().engine.url
+    if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:"):
+        return "sqlite:///" + os.path.abspath(url.database)
+    return "{}://{}{}/{}".format(url.drivername, url.host or "", ":{}".format(url.port) if url.port else "",
+                                 url.database or "")
+
+
+def cached(name):
+    """Cache an analysis ``func(session, *args, **kwargs)`` per data version."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(session, *args, **kwargs):
+            key = cache.key(name, (args, sorted(kwargs.items())), get_data_version(session), database_id(session))
+            hit, value = cache.get(key)
+            if not hit:
+                value = func(session, *args, **kwargs)
+                cache.put(key, value)
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,284 @@
+"""k-means clustering of personality and genre profiles.
+
+Usage:
+    python -m analytics.clustering [--space personality|genres] [--k K | --select K ...]
+                                   [--minibatch] [--seed S] [--snapshot DIR] [--output DIR]
+
+Users are clustered on their standardized OCEAN scores ("personality") or
+their genre counts normalized to sum to one, without "Others" ("genres").
+Distances are computed block by block, so memory use does not grow with
+the number of users times the number of clusters; mini-batch k-means reads
+only ``batch_size`` random rows per step, which also suits a memory-mapped
+snapshot. Every run is deterministic given its seed. Assignments are saved
+as ``.npy`` files with a manifest holding the centers and the scaling.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from analytics.dataset import GENRES, TRAITS
+from settings import CLUSTER_DIR
+
+SPACES = ["personality", "genres"]
+# Rows per block of the distance computations
+BLOCK_SIZE = 8192
+# Rows k-means++ seeding and k selection work on
+SAMPLE_SIZE = 10000
+MAX_ITER = 100
+TOL = 1e-4
+BATCH_SIZE = 1024
+
+
+class Clustering(object):
+    """Result of a k-means run."""
+
+    def __init__(self, centers, labels, inertia, iterations):
+        """Create new instance."""
+        self.centers = centers
+        self.labels = labels
+        self.inertia = inertia
+        self.iterations = iterations
+
+    def __repr__(self):
+        """Verbose object name."""
+        return "<k='%s', inertia='%s', iterations='%s'>" % (len(self.centers), self.inertia, self.iterations)
+
+
+def features(data, space):
+    """Feature rows of the users of a dataset that have data in ``space``.
+
+    Returns the features, the user ids of the rows, and the mean and scale
+    that were removed from the raw values.
+    """
+    if space == "personality":
+        data = data.subset(data.has_traits)
+        values = data.traits.astype(np.float32)
+        mean = values.mean(axis=0)
+        scale = values.std(axis=0)
+        scale[scale == 0] = 1
+    elif space == "genres":
+        data = data.subset(data.has_genres & (data.genres[:, :-1].sum(axis=1) > 0))
+        values = data.normalized_genres().astype(np.float32)
+        mean = np.zeros(values.shape[1], dtype=np.float32)
+        scale = np.ones(values.shape[1], dtype=np.float32)
+    else:
+        raise ValueError("Unknown space {}".format(space))
+    return (values - mean) / scale, np.asarray(data.user_id), (mean, scale)
+
+
+def assign(X, centers, block_size=BLOCK_SIZE):
+    """Nearest center of every row and the squared distance to it."""
+    labels = np.empty(X.shape[0], dtype=np.int64)
+    distances = np.empty(X.shape[0], dtype=np.float64)
+    center_norms = (centers ** 2).sum(axis=1)
+    for start in range(0, X.shape[0], block_size):
+        block = np.asarray(X[start:start + block_size], dtype=np.float64)
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, without an (n, k, d) temporary.
+        d = center_norms - 2 * block.dot(centers.T)
+        labels[start:start + block_size] = d.argmin(axis=1)
+        distances[start:start + block_size] = np.maximum(
+            d[np.arange(len(block)), labels[start:start + block_size]] + (block ** 2).sum(axis=1), 0)
+    return labels, distances
+
+
+def _sums(X, labels, k):
+    """Sum of the rows of every cluster, and the cluster sizes."""
+    sums = np.stack([np.bincount(labels, weights=X[:, j], minlength=k) for j in range(X.shape[1])], axis=1)
+    return sums, np.bincount(labels, minlength=k)
+
+
+def _sample(X, size, rng):
+    """Up to ``size`` random rows of ``X``, in row order."""
+    if X.shape[0] <= size:
+        return np.asarray(X, dtype=np.float64)
+    return np.asarray(X[np.sort(rng.choice(X.shape[0], size, replace=False))], dtype=np.float64)
+
+
+def init_centers(X, k, rng, sample_size=SAMPLE_SIZE):
+    """k-means++ seeding on a random sample of the rows."""
+    sample = _sample(X, sample_size, rng)
+    if sample.shape[0] < k:
+        raise ValueError("Cannot make {} clusters of {} rows".format(k, sample.shape[0]))
+    centers = [sample[rng.randint(sample.shape[0])]]
+    closest = ((sample - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = closest.sum()
+        if total > 0:
+            index = min(np.searchsorted(np.cumsum(closest), rng.rand() * total), sample.shape[0] - 1)
+        else:
+            index = rng.randint(sample.shape[0])
+        centers.append(sample[index])
+        closest = np.minimum(closest, ((sample - sample[index]) ** 2).sum(axis=1))
+    return np.array(centers)
+
+
+def kmeans(X, k, seed=0, max_iter=MAX_ITER, tol=TOL):
+    """Full-batch k-means (Lloyd's algorithm) with k-means++ seeding."""
+    rng = np.random.RandomState(seed)
+    centers = init_centers(X, k, rng)
+    threshold = tol * float(np.var(_sample(X, SAMPLE_SIZE, rng), axis=0).mean())
+    for iteration in range(1, max_iter + 1):
+        labels, distances = assign(X, centers)
+        sums, counts = _sums(X, labels, k)
+        new = centers.copy()
+        new[counts > 0] = sums[counts > 0] / counts[counts > 0, None]
+        # An empty cluster restarts at the row farthest from its center.
+        for c in np.flatnonzero(counts == 0):
+            far = distances.argmax()
+            new[c] = X[far]
+            distances[far] = 0
+        shift = ((new - centers) ** 2).sum()
+        centers = new
+        if shift <= threshold:
+            break
+    labels, distances = assign(X, centers)
+    return Clustering(centers, labels, float(distances.sum()), iteration)
+
+
+def minibatch_kmeans(X, k, seed=0, batch_size=BATCH_SIZE, max_iter=MAX_ITER, tol=TOL):
+    """Mini-batch k-means: every step moves the centers toward a random batch of rows.
+
+    Each center moves by the mean of its batch rows weighted by the number
+    of rows it has seen so far, so the steps shrink as it settles.
+    """
+    rng = np.random.RandomState(seed)
+    centers = init_centers(X, k, rng)
+    threshold = tol * float(np.var(_sample(X, SAMPLE_SIZE, rng), axis=0).mean())
+    seen = np.zeros(k)
+    for iteration in range(1, max_iter + 1):
+        batch = np.asarray(X[np.sort(rng.randint(X.shape[0], size=batch_size))], dtype=np.float64)
+        labels, _ = assign(batch, centers)
+        sums, counts = _sums(batch, labels, k)
+        seen += counts
+        moved = counts > 0
+        old = centers.copy()
+        centers[moved] += (sums[moved] - counts[moved, None] * centers[moved]) / seen[moved, None]
+        if ((centers - old) ** 2).sum() <= threshold:
+            break
+    labels, distances = assign(X, centers)
+    return Clustering(centers, labels, float(distances.sum()), iteration)
+
+
+def silhouette(X, labels, block_size=512):
+    """Mean silhouette coefficient of the rows of ``X``, O(n^2) so use a sample."""
+    X = np.asarray(X, dtype=np.float64)
+    k = labels.max() + 1
+    onehot = np.zeros((X.shape[0], k))
+    onehot[np.arange(X.shape[0]), labels] = 1
+    sizes = onehot.sum(axis=0)
+    norms = (X ** 2).sum(axis=1)
+    scores = np.zeros(X.shape[0])
+    for start in range(0, X.shape[0], block_size):
+        block = slice(start, start + block_size)
+        d = np.sqrt(np.maximum(norms[block, None] - 2 * X[block].dot(X.T) + norms[None, :], 0))
+        per_cluster = d.dot(onehot)
+        own = labels[block]
+        rows = np.arange(len(own))
+        own_size = sizes[own]
+        a = np.divide(per_cluster[rows, own], own_size - 1, out=np.zeros(len(own)), where=own_size > 1)
+        mean_other = per_cluster / np.maximum(sizes, 1)
+        mean_other[rows, own] = np.inf
+        mean_other[:, sizes == 0] = np.inf
+        b = mean_other.min(axis=1)
+        s = np.divide(b - a, np.maximum(a, b), out=np.zeros(len(own)), where=np.maximum(a, b) > 0)
+        s[own_size <= 1] = 0
+        scores[block] = s
+    return float(scores.mean())
+
+
+def select_k(X, ks, seed=0, sample_size=SAMPLE_SIZE):
+    """Inertia and silhouette of k-means for every k, on a sample of the rows.
+
+    Returns one dict per k; the k with the highest silhouette is usually the
+    one to pick.
+    """
+    sample = _sample(X, sample_size, np.random.RandomState(seed))
+    scores = []
+    for k in ks:
+        result = kmeans(sample, k, seed)
+        scores.append({"k": k, "inertia": result.inertia, "silhouette": silhouette(sample, result.labels)})
+    return scores
+
+
+def save_clusters(directory, space, user_id, result, scaling, info):
+    """Write the assignments of a run to ``directory/space``."""
+    path = os.path.join(directory, space)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    np.save(os.path.join(path, "user_id.npy"), np.asarray(user_id, dtype=np.int64))
+    np.save(os.path.join(path, "labels.npy"), result.labels.astype(np.int32))
+    manifest = dict(info)
+    manifest.update({"space": space, "k": len(result.centers), "inertia": result.inertia,
+                     "iterations": result.iterations, "centers": result.centers.tolist(),
+                     "mean": scaling[0].tolist(), "scale": scaling[1].tolist(),
+                     "sizes": np.bincount(result.labels, minlength=len(result.centers)).tolist(),
+                     "columns": TRAITS if space == "personality" else GENRES[:-1]})
+    tmp = os.path.join(path, "manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(path, "manifest.json"))
+
+
+def load_clusters(directory, space, mmap_mode="r"):
+    """Manifest, user ids and labels of the saved run of ``space``."""
+    path = os.path.join(directory, space)
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    return (manifest, np.load(os.path.join(path, "user_id.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, "labels.npy"), mmap_mode=mmap_mode))
+
+
+def predict(manifest, values):
+    """Cluster of raw trait or normalized genre rows, with a saved manifest."""
+    X = (np.atleast_2d(np.asarray(values, dtype=np.float64)) - manifest["mean"]) / manifest["scale"]
+    return assign(X, np.array(manifest["centers"]))[0]
+
+
+def main():
+    """Command line entry point."""
+    from analytics.dataset import load_dataset
+    from analytics.snapshot import open_snapshot
+    from models import get_data_version, get_debug_session
+    from settings import DB_URL
+
+    parser = argparse.ArgumentParser(description="Cluster Genrenome users with k-means.")
+    parser.add_argument("--space", choices=SPACES, default="personality")
+    parser.add_argument("--k", type=int, default=None, help="Number of clusters to save")
+    parser.add_argument("--select", type=int, nargs="+", default=[2, 3, 4, 5, 6, 7, 8],
+                        help="Values of k to score when --k is not given")
+    parser.add_argument("--minibatch", action="store_true", help="Use mini-batch k-means")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--snapshot", default=None, help="Read the data from this snapshot directory")
+    parser.add_argument("--output", default=CLUSTER_DIR, help="Directory of the saved assignments")
+    parser.add_argument("--db", default=DB_URL, help="Database URL")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        data = open_snapshot(args.snapshot)
+        version = None
+    else:
+        session = get_debug_session(args.db)
+        data = load_dataset(session)
+        version = get_data_version(session)
+    X, user_id, scaling = features(data, args.space)
+
+    k = args.k
+    if k is None:
+        scores = select_k(X, args.select, args.seed)
+        for s in scores:
+            print("k={k}: inertia={inertia:.1f}, silhouette={silhouette:.3f}".format(**s))
+        k = max(scores, key=lambda s: s["silhouette"])["k"]
+
+    fit = minibatch_kmeans if args.minibatch else kmeans
+    result = fit(X, k, args.seed)
+    save_clusters(args.output, args.space, user_id, result, scaling,
+                  {"seed": args.seed, "method": fit.__name__, "data_version": version})
+    print("{} users in {} clusters of sizes {}, inertia {:.1f}, saved to {}".format(
+        len(user_id), k, np.bincount(result.labels, minlength=k).tolist(), result.inertia,
+        os.path.join(args.output, args.space)))
+
+
+if __name__ == "__main__":
+    main()
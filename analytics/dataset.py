@@ -0,0 +1,118 @@
+"""Research dataset loaded as aligned NumPy arrays."""
+import numpy as np
+from sqlalchemy import and_, func
+
+from models import User, Personality, GenreProf
+
+TRAITS = ["O", "C", "E", "A", "N"]
+GENRES = list(GenreProf.genres)
+# Genres of the analyses, without "Others"
+GENRE_LABELS = GENRES[:-1]
+
+
+class Dataset(object):
+    """Users joined with their personality and genre profile.
+
+    Row ``i`` of every array belongs to the user ``user_id[i]``. Users without
+    a quiz or a genre profile are kept and flagged through ``has_traits`` and
+    ``has_genres``; their missing values are stored as zeros.
+    """
+
+    def __init__(self, user_id, age, gender, traits, genres, has_traits, has_genres):
+        """Create new instance."""
+        self.user_id = user_id
+        self.age = age
+        self.gender = gender
+        self.traits = traits
+        self.genres = genres
+        self.has_traits = has_traits
+        self.has_genres = has_genres
+
+    def __len__(self):
+        """Number of users."""
+        return self.user_id.shape[0]
+
+    def __repr__(self):
+        """Verbose object name."""
+        return "<users='%s', traits='%s', genres='%s'>" % (len(self), self.has_traits.sum(), self.has_genres.sum())
+
+    def subset(self, mask):
+        """Return the users selected by a boolean mask or index array."""
+        return Dataset(self.user_id[mask], self.age[mask], self.gender[mask], self.traits[mask],
+                       self.genres[mask], self.has_traits[mask], self.has_genres[mask])
+
+    def complete(self):
+        """Return the users that have both a quiz and a genre profile."""
+        return self.subset(self.has_traits & self.has_genres)
+
+    def normalized_genres(self, drop_others=True):
+        """Genre counts divided by the number of annotated songs of each user."""
+        genres = self.genres.astype(float)
+        totals = genres.sum(axis=1, keepdims=True)
+        normalized = np.divide(genres, totals, out=np.zeros_like(genres), where=totals > 0)
+        if drop_others:
+            normalized = normalized[:, :-1]
+        return normalized
+
+
+def dataset_query(session, user_ids=None):
+    """Query users joined with their latest quiz row and their genre profile.
+
+    Users with several quiz rows are represented by their latest one. With
+    ``user_ids``, only those users are queried.
+    """
+    latest = session.query(func.max(Personality.id_)).group_by(Personality.user_id)
+    if user_ids is not None:
+        latest = latest.filter(Personality.user_id.in_(user_ids))
+    trait_columns = [getattr(Personality, t) for t in TRAITS]
+    genre_columns = [getattr(GenreProf, g) for g in GENRES]
+    query = session.query(User.id_, User.age, User.gender, *(trait_columns + genre_columns)).select_from(User)
+    query = query.outerjoin(Personality, and_(Personality.user_id == User.id_, Personality.id_.in_(latest)))
+    query = query.outerjoin(GenreProf, GenreProf.user_id == User.id_)
+    if user_ids is not None:
+        query = query.filter(User.id_.in_(user_ids))
+    return query.order_by(User.id_)
+
+
+def load_dataset(session):
+    """Load users, personality and genre profiles in one joined query."""
+    return _from_rows(dataset_query(session).all())
+
+
+def iter_dataset(session, chunk_size):
+    """Stream the dataset as consecutive chunks of at most ``chunk_size`` users."""
+    rows = []
+    for row in dataset_query(session).yield_per(chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield _from_rows(rows)
+            rows = []
+    if rows:
+        yield _from_rows(rows)
+
+
+def empty_dataset():
+    """Dataset without users, with the array shapes and types of a loaded one."""
+    return Dataset(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype="U1"),
+                   np.zeros((0, len(TRAITS)), dtype=np.int64), np.zeros((0, len(GENRES)), dtype=np.int64),
+                   np.zeros(0, dtype=bool), np.zeros(0, dtype=bool))
+
+
+def _from_rows(rows):
+    """Build a dataset from ``(id, age, gender, *traits, *genres)`` tuples."""
+    n_traits = len(TRAITS)
+    if len(rows) == 0:
+        return empty_dataset()
+
+    values = np.array([r[3:] for r in rows], dtype=float)
+    traits = values[:, :n_traits]
+    genres = values[:, n_traits:]
+    has_traits = ~np.isnan(traits).any(axis=1)
+    has_genres = ~np.isnan(genres).any(axis=1)
+
+    user_id = np.array([r[0] for r in rows], dtype=np.int64)
+    age = np.array([r[1] or 0 for r in rows], dtype=np.int64)
+    gender = np.array([r[2] or "U" for r in rows], dtype="U1")
+    return Dataset(user_id, age, gender,
+                   np.nan_to_num(traits).astype(np.int64), np.nan_to_num(genres).astype(np.int64),
+                   has_traits, has_genres)
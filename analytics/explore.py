@@ -0,0 +1,114 @@
+"""Interactive plots and tests of the research data.
+
+Usage:
+    python -m analytics.explore [--db URL] personalities|genres|ages|gender|dominant|pairs
+
+matplotlib and scipy are imported by the functions that use them, so the
+web app never pays for them. ``analytics.report`` renders the same figures
+to files without a display.
+"""
+import argparse
+
+from analytics.dataset import GENRE_LABELS
+from analytics.measures import AGE_LABELS, GENDER_LABELS, PAIR_LABELS
+from analytics.results import (age_genre_means, dominant_personality_table, gender_genre_means, genre_profile,
+                               pair_genre_counts, trait_pair_histogram)
+
+
+def cluster_personalities(session):
+    """Show how many users have each pair of top-two traits."""
+    import matplotlib.pyplot as plt
+    plt.bar(PAIR_LABELS, trait_pair_histogram(session))
+    plt.xlabel('Different combinations of 5 personality traits')
+    plt.ylabel('Frequencies')
+    plt.show()
+
+
+def cluster_genres(session):
+    """Show the genre totals and the genre correlation matrix."""
+    import matplotlib.pyplot as plt
+    import numpy as np
+    totals, corr = genre_profile(session)  # removing others
+
+    plt.bar(GENRE_LABELS, totals)
+    plt.xlabel('Different genres of music identified')
+    plt.ylabel('Normalized Frequencies')
+    plt.show()
+
+    fig, ax = plt.subplots()
+    im = ax.imshow(corr, cmap='hot', interpolation='nearest')
+    ax.set_xticks(np.arange(len(GENRE_LABELS)))
+    ax.set_yticks(np.arange(len(GENRE_LABELS)))
+
+    ax.set_xticklabels(GENRE_LABELS)
+    ax.set_yticklabels(GENRE_LABELS)
+
+    cbar = ax.figure.colorbar(im, ax=ax)
+    cbar.ax.set_ylabel('Correlation coefficients', rotation=-90, va="bottom")
+    plt.show()
+
+
+def cluster_ages(session):
+    """Show the genre profile of every age group."""
+    import matplotlib.pyplot as plt
+    for label, mean in zip(AGE_LABELS, age_genre_means(session)):
+        plt.bar(GENRE_LABELS, mean)
+        plt.xlabel('Different music genres')
+        plt.ylabel('Normalized Frequencies')
+        plt.title('Distribution of music genres for age group given by ' + label)
+        plt.show()
+
+
+def cluster_gender(session):
+    """Show the genre profile of every gender."""
+    import matplotlib.pyplot as plt
+    for label, mean in zip(GENDER_LABELS, gender_genre_means(session)):
+        plt.bar(GENRE_LABELS, mean)
+        plt.xlabel('Different music genres')
+        plt.ylabel('Normalized Frequencies')
+        plt.title('Distribution of music genres for gender given by ' + label)
+        plt.show()
+
+
+def dominant_personality_music(session, g1, g2):
+    """Chi-squared p-value of dominant trait group ``g1``/``g2`` against dominant genre group."""
+    from scipy.stats import chi2_contingency
+    genre_g1 = [0, 2, 5, 6]
+    genre_g2 = [3, 4, 1, 7]
+    arr = dominant_personality_table(session, (list(g1), list(g2)), (genre_g1, genre_g2))
+    chi2, pvalue, _, _ = chi2_contingency(arr)
+    return pvalue
+
+
+def corr_personality_genre(session):
+    """Chi-squared p-value of top-two trait pair against genre counts."""
+    from scipy.stats import chi2_contingency
+    chi2, pvalue, _, _ = chi2_contingency(pair_genre_counts(session))
+    return pvalue
+
+
+def main():
+    """Command line entry point."""
+    from models import get_debug_session
+    from settings import DB_URL
+
+    commands = {"personalities": cluster_personalities, "genres": cluster_genres,
+                "ages": cluster_ages, "gender": cluster_gender}
+    parser = argparse.ArgumentParser(description="Explore the Genrenome data.")
+    parser.add_argument("command", choices=sorted(commands) + ["dominant", "pairs"])
+    parser.add_argument("--db", default=DB_URL, help="Database URL")
+    args = parser.parse_args()
+
+    session = get_debug_session(args.db)
+    if args.command == "dominant":
+        # Permutation p-values of every split: python -m analytics.significance
+        for g1, g2 in [([0, 1, 2], [3, 4]), ([0, 1, 4], [2, 3]), ([0, 2, 4], [1, 3])]:
+            print(g1, g2, dominant_personality_music(session, g1, g2))
+    elif args.command == "pairs":
+        print(corr_personality_genre(session))
+    else:
+        commands[args.command](session)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Streaming export of the research dataset.
+
+Usage:
+    python -m analytics.export [--format csv|npz|parquet] [--songs] <output prefix>
+
+Users are written to ``<prefix>_users.<ext>`` and, with ``--songs``, their
+songs to ``<prefix>_songs.<ext>``. Rows are read ``chunk_size`` at a time
+with ``yield_per`` and written as they arrive, so memory use does not grow
+with the size of the database.
+"""
+import argparse
+import csv
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+from analytics.dataset import GENRES, TRAITS, empty_dataset, iter_dataset
+from models import Songs, get_debug_session
+from settings import DB_URL
+
+EXPORT_CHUNK_SIZE = 5000
+FORMATS = ["csv", "npz", "parquet"]
+
+
+def iter_user_columns(session, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream users as ordered dicts of column arrays, with one empty chunk for an empty table."""
+    empty = True
+    for chunk in iter_dataset(session, chunk_size):
+        empty = False
+        yield _user_columns(chunk)
+    if empty:
+        yield _user_columns(empty_dataset())
+
+
+def _user_columns(chunk):
+    """Column arrays of a dataset chunk."""
+    columns = OrderedDict()
+    columns["user_id"] = chunk.user_id
+    columns["age"] = chunk.age
+    columns["gender"] = chunk.gender
+    columns["has_traits"] = chunk.has_traits
+    columns["has_genres"] = chunk.has_genres
+    for i, trait in enumerate(TRAITS):
+        columns[trait] = chunk.traits[:, i]
+    for i, genre in enumerate(GENRES):
+        columns[genre] = chunk.genres[:, i]
+    return columns
+
+
+def iter_song_columns(session, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream songs as ordered dicts of column arrays, with one empty chunk for an empty table."""
+    query = session.query(Songs.id_, Songs.user_id, Songs.title, Songs.artist, Songs.genre).order_by(Songs.id_)
+    rows = []
+    empty = True
+    for row in query.yield_per(chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            empty = False
+            yield _song_columns(rows)
+            rows = []
+    if rows or empty:
+        yield _song_columns(rows)
+
+
+def _song_columns(rows):
+    """Column arrays of a list of song rows."""
+    columns = OrderedDict()
+    columns["song_id"] = np.array([r[0] for r in rows], dtype=np.int64)
+    columns["user_id"] = np.array([r[1] or 0 for r in rows], dtype=np.int64)
+    columns["title"] = np.array([r[2] or "" for r in rows], dtype="U50")
+    columns["artist"] = np.array([r[3] or "" for r in rows], dtype="U50")
+    columns["genre"] = np.array([r[4] or "" for r in rows], dtype="U50")
+    return columns
+
+
+def write_csv(path, chunks):
+    """Write column chunks as CSV rows. Returns the number of rows."""
+    rows = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        for i, columns in enumerate(chunks):
+            if i == 0:
+                writer.writerow(list(columns))
+            values = [c.tolist() for c in columns.values()]
+            writer.writerows(zip(*values))
+            rows += len(values[0])
+    return rows
+
+
+def write_npz(path, chunks):
+    """Write column chunks as one ``.npy`` array per column inside an ``.npz``.
+
+    Chunks are spooled to one raw file per column, and every column is then
+    copied into the archive behind a header holding the final row count.
+    Returns the number of rows.
+    """
+    spool = tempfile.mkdtemp(prefix="genrenome-export-")
+    dtypes = OrderedDict()
+    rows = 0
+    try:
+        for columns in chunks:
+            for name, values in columns.items():
+                if name not in dtypes:
+                    dtypes[name] = values.dtype
+                with open(os.path.join(spool, name), "ab") as f:
+                    f.write(np.ascontiguousarray(values, dtype=dtypes[name]).tobytes())
+            rows += len(next(iter(columns.values())))
+
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for name, dtype in dtypes.items():
+                header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (rows,)}
+                with archive.open(name + ".npy", "w", force_zip64=True) as f, \
+                        open(os.path.join(spool, name), "rb") as data:
+                    np.lib.format.write_array_header_1_0(f, header)
+                    shutil.copyfileobj(data, f)
+    finally:
+        shutil.rmtree(spool)
+    return rows
+
+
+def write_parquet(path, chunks):
+    """Write column chunks as Parquet row groups. Returns the number of rows."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow, use the npz format instead")
+
+    writer = None
+    rows = 0
+    try:
+        for columns in chunks:
+            table = pa.Table.from_arrays([pa.array(v) for v in columns.values()], names=list(columns))
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+WRITERS = {"csv": write_csv, "npz": write_npz, "parquet": write_parquet}
+
+
+def export(session, prefix, fmt="csv", songs=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Export users, and optionally songs, next to ``prefix``. Returns the written paths."""
+    tables = [("users", iter_user_columns)]
+    if songs:
+        tables.append(("songs", iter_song_columns))
+
+    paths = []
+    for name, columns in tables:
+        path = "{}_{}.{}".format(prefix, name, fmt)
+        rows = WRITERS[fmt](path, columns(session, chunk_size))
+        print("Wrote {} rows to {}".format(rows, path))
+        paths.append(path)
+    return paths
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Export the Genrenome research dataset.")
+    parser.add_argument("prefix", help="Path prefix of the exported files")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--songs", action="store_true", help="Also export the songs of every user")
+    parser.add_argument("--db", default=DB_URL, help="Database URL")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    session = get_debug_session(args.db)
+    export(session, args.prefix, args.format, args.songs, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
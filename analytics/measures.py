@@ -0,0 +1,68 @@
+"""Array operations behind the personality and genre analyses."""
+import numpy as np
+
+from analytics.dataset import TRAITS
+
+# Index of every unordered trait pair, in the order O&C, O&E, ..., A&N.
+TRAIT_PAIRS = [(i, j) for i in range(len(TRAITS)) for j in range(len(TRAITS)) if i < j]
+PAIR_LABELS = [TRAITS[i] + '&' + TRAITS[j] for i, j in TRAIT_PAIRS]
+_PAIR_CODE = np.full((len(TRAITS), len(TRAITS)), -1, dtype=np.int64)
+for _code, (_i, _j) in enumerate(TRAIT_PAIRS):
+    _PAIR_CODE[_i, _j] = _PAIR_CODE[_j, _i] = _code
+
+AGE_BINS = [20, 30]
+AGE_LABELS = ['Age <= 20', '20 < Age <= 30', 'Age > 30']
+GENDER_CODES = ['M', 'F']
+GENDER_LABELS = ['Male', 'Female']
+
+
+def top_two_traits(traits):
+    """Indices of the highest and second highest trait of every row."""
+    order = np.argsort(traits, axis=1, kind="stable")
+    return order[:, -1], order[:, -2]
+
+
+def trait_pair_codes(traits):
+    """Code of the unordered top-two trait pair of every row, see ``TRAIT_PAIRS``."""
+    first, second = top_two_traits(traits)
+    return _PAIR_CODE[first, second]
+
+
+def trait_pair_counts(traits):
+    """Number of rows whose top-two traits are each pair in ``TRAIT_PAIRS``."""
+    return np.bincount(trait_pair_codes(traits), minlength=len(TRAIT_PAIRS))
+
+
+def group_means(values, groups, n_groups):
+    """Mean row of ``values`` for every group code in ``range(n_groups)``."""
+    sums = np.zeros((n_groups, values.shape[1]))
+    np.add.at(sums, groups, values)
+    counts = np.bincount(groups, minlength=n_groups)
+    return np.divide(sums, counts[:, None], out=np.full_like(sums, np.nan), where=counts[:, None] > 0)
+
+
+def age_groups(age):
+    """Age group code of every row, see ``AGE_LABELS``."""
+    return np.digitize(age, AGE_BINS, right=True)
+
+
+def gender_groups(gender):
+    """Gender code of every row, see ``GENDER_LABELS``; -1 when unknown."""
+    codes = np.full(gender.shape[0], -1, dtype=np.int64)
+    for code, value in enumerate(GENDER_CODES):
+        codes[gender == value] = code
+    return codes
+
+
+def dominant_table(traits, genres, trait_groups, genre_groups):
+    """2x2 table of dominant trait group against dominant genre group."""
+    dom_trait = (traits[:, trait_groups[0]].sum(axis=1) <= traits[:, trait_groups[1]].sum(axis=1)).astype(int)
+    dom_genre = (genres[:, genre_groups[0]].sum(axis=1) <= genres[:, genre_groups[1]].sum(axis=1)).astype(int)
+    return np.bincount(2 * dom_trait + dom_genre, minlength=4).reshape(2, 2).astype(float)
+
+
+def pair_genre_table(traits, genres):
+    """Genre counts summed over users sharing the same top-two trait pair."""
+    table = np.zeros((len(TRAIT_PAIRS), genres.shape[1]))
+    np.add.at(table, trait_pair_codes(traits), genres)
+    return table
@@ -0,0 +1,135 @@
+"""Render the analysis figures to files.
+
+Usage:
+    python -m analytics.report [--output analysis] [--workers N] [--force]
+
+Figure data comes from the cached analyses of ``analytics.results``; the
+figures themselves are drawn with the non-interactive Agg backend in worker
+processes. A manifest in the output directory records a hash of the data of
+every figure, and figures whose data did not change are not drawn again.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from analytics.dataset import GENRE_LABELS
+from analytics.measures import AGE_LABELS, GENDER_LABELS, PAIR_LABELS
+from analytics.results import age_genre_means, gender_genre_means, genre_profile, trait_pair_histogram
+
+MANIFEST = ".report_manifest.json"
+REPORT_DIR = "analysis"
+
+
+def figures(session):
+    """Map every figure file name to its drawing function and arguments."""
+    totals, corr = genre_profile(session)
+    specs = OrderedDict()
+    specs["Personality clusters.png"] = ("bar", {
+        "labels": PAIR_LABELS, "values": trait_pair_histogram(session),
+        "xlabel": "Different combinations of 5 personality traits", "ylabel": "Frequencies"})
+    specs["gen_hist.png"] = ("bar", {
+        "labels": GENRE_LABELS, "values": totals,
+        "xlabel": "Different genres of music identified", "ylabel": "Normalized Frequencies"})
+    specs["coor.png"] = ("heatmap", {"labels": GENRE_LABELS, "values": corr})
+    for i, (label, mean) in enumerate(zip(AGE_LABELS, age_genre_means(session))):
+        specs["age_cluster{}.png".format(i)] = ("bar", {
+            "labels": GENRE_LABELS, "values": mean,
+            "xlabel": "Different music genres", "ylabel": "Normalized Frequencies",
+            "title": "Distribution of music genres for age group given by " + label})
+    for name, label, mean in zip(["male_cluster.png", "female_lcuster.png"], GENDER_LABELS,
+                                 gender_genre_means(session)):
+        specs[name] = ("bar", {
+            "labels": GENRE_LABELS, "values": mean,
+            "xlabel": "Different music genres", "ylabel": "Normalized Frequencies",
+            "title": "Distribution of music genres for gender given by " + label})
+    return specs
+
+
+def _draw(job):
+    """Draw one figure to a file, in a worker process."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    path, kind, spec = job
+    fig, ax = plt.subplots(figsize=(10, 6))
+    if kind == "bar":
+        ax.bar(spec["labels"], spec["values"])
+        ax.set_xlabel(spec["xlabel"])
+        ax.set_ylabel(spec["ylabel"])
+        if "title" in spec:
+            ax.set_title(spec["title"])
+    elif kind == "heatmap":
+        im = ax.imshow(spec["values"], cmap='hot', interpolation='nearest')
+        ax.set_xticks(np.arange(len(spec["labels"])))
+        ax.set_yticks(np.arange(len(spec["labels"])))
+        ax.set_xticklabels(spec["labels"])
+        ax.set_yticklabels(spec["labels"])
+        cbar = fig.colorbar(im, ax=ax)
+        cbar.ax.set_ylabel('Correlation coefficients', rotation=-90, va="bottom")
+    plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def _digest(kind, spec):
+    """Hash of everything a figure is drawn from."""
+    return hashlib.sha256(pickle.dumps((kind, sorted(spec.items())), protocol=2)).hexdigest()
+
+
+def render(session, output=REPORT_DIR, workers=None, force=False):
+    """Draw the figures whose data changed. Returns the paths drawn."""
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    manifest_path = os.path.join(output, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    jobs = []
+    digests = {}
+    for name, (kind, spec) in figures(session).items():
+        path = os.path.join(output, name)
+        digests[name] = _digest(kind, spec)
+        if force or manifest.get(name) != digests[name] or not os.path.exists(path):
+            jobs.append((path, kind, spec))
+
+    drawn = []
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            drawn = list(pool.map(_draw, jobs))
+
+    manifest.update(digests)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return drawn
+
+
+def main():
+    """Command line entry point."""
+    from models import get_debug_session
+    from settings import DB_URL
+
+    parser = argparse.ArgumentParser(description="Render the Genrenome analysis figures.")
+    parser.add_argument("--output", default=REPORT_DIR, help="Directory of the figures")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="Draw every figure even if its data is unchanged")
+    parser.add_argument("--db", default=DB_URL, help="Database URL")
+    args = parser.parse_args()
+
+    drawn = render(get_debug_session(args.db), args.output, args.workers, args.force)
+    print("Drew {} figures".format(len(drawn)))
+    for path in drawn:
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
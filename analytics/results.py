@@ -0,0 +1,52 @@
+"""Cached analyses of the research dataset."""
+import numpy as np
+
+from analytics.cache import cached
+from analytics.dataset import load_dataset
+from analytics.measures import (AGE_LABELS, GENDER_LABELS, age_groups, dominant_table, gender_groups,
+                                group_means, pair_genre_table, trait_pair_counts)
+
+
+@cached("trait_pair_counts")
+def trait_pair_histogram(session):
+    """Number of users whose top-two traits are each pair of ``TRAIT_PAIRS``."""
+    data = load_dataset(session)
+    return trait_pair_counts(data.traits[data.has_traits])
+
+
+@cached("genre_profile")
+def genre_profile(session):
+    """Summed normalized genre profiles and the genre correlation matrix."""
+    data = load_dataset(session)
+    gvecs = data.subset(data.has_genres).normalized_genres()
+    return gvecs.sum(axis=0), np.corrcoef(gvecs, rowvar=False)
+
+
+@cached("age_genre_means")
+def age_genre_means(session):
+    """Mean normalized genre profile of every age group in ``AGE_LABELS``."""
+    data = load_dataset(session)
+    data = data.subset((data.age != 0) & data.has_genres)
+    return group_means(data.normalized_genres(), age_groups(data.age), len(AGE_LABELS))
+
+
+@cached("gender_genre_means")
+def gender_genre_means(session):
+    """Mean normalized genre profile of every gender in ``GENDER_LABELS``."""
+    data = load_dataset(session)
+    data = data.subset((gender_groups(data.gender) >= 0) & data.has_genres)
+    return group_means(data.normalized_genres(), gender_groups(data.gender), len(GENDER_LABELS))
+
+
+@cached("dominant_table")
+def dominant_personality_table(session, trait_groups, genre_groups):
+    """2x2 table of dominant trait group against dominant genre group."""
+    data = load_dataset(session).complete()
+    return dominant_table(data.traits, data.genres, trait_groups, genre_groups)
+
+
+@cached("pair_genre_table")
+def pair_genre_counts(session):
+    """Genre counts, without "Others", summed per top-two trait pair."""
+    data = load_dataset(session).complete()
+    return pair_genre_table(data.traits, data.genres[:, :-1])
@@ -0,0 +1,49 @@
+"""Vectorized scoring of quiz answers."""
+import numpy as np
+
+import quiz
+from quiz import N_QUESTIONS, MIN_ANSWER, MAX_ANSWER
+
+# The weights and offsets of quiz.score_quiz, as arrays
+WEIGHTS = np.asarray(quiz.WEIGHTS)
+OFFSETS = np.asarray(quiz.OFFSETS)
+
+
+def validate_responses(responses):
+    """Describe the problems of every row of an (n, 50) answer array.
+
+    Missing answers are NaN. Returns a dict mapping the index of every
+    invalid row to a message naming the questions at fault.
+    """
+    responses = np.asarray(responses, dtype=float)
+    if responses.ndim != 2 or responses.shape[1] != N_QUESTIONS:
+        raise ValueError("Expected an (n, {}) array of answers, got {}".format(N_QUESTIONS, responses.shape))
+    missing = np.isnan(responses)
+    with np.errstate(invalid="ignore"):
+        out_of_range = ~missing & ((responses < MIN_ANSWER) | (responses > MAX_ANSWER) |
+                                   (responses != np.round(responses)))
+
+    errors = {}
+    for row in np.flatnonzero(missing.any(axis=1) | out_of_range.any(axis=1)):
+        problems = []
+        if missing[row].any():
+            problems.append("missing answers to questions {}".format(
+                ", ".join(str(q + 1) for q in np.flatnonzero(missing[row]))))
+        if out_of_range[row].any():
+            problems.append("answers out of range for questions {}".format(
+                ", ".join(str(q + 1) for q in np.flatnonzero(out_of_range[row]))))
+        errors[int(row)] = "; ".join(problems)
+    return errors
+
+
+def score_batch(responses):
+    """Score an (n, 50) array of answers to (n, 5) OCEAN scores.
+
+    Returns the scores and the errors of ``validate_responses``; rows with
+    errors are scored as NaN.
+    """
+    responses = np.asarray(responses, dtype=float)
+    errors = validate_responses(responses)
+    scores = np.nan_to_num(responses).dot(WEIGHTS) + OFFSETS
+    scores[list(errors)] = np.nan
+    return scores, errors
@@ -0,0 +1,237 @@
+"""Permutation tests of personality and genre association.
+
+Usage:
+    python -m analytics.significance [--permutations N] [--workers N] [--top N]
+
+``sweep`` repeats the test of ``analytics.explore.dominant_personality_music``
+for every split of the five traits and every split of the eight genres into
+two groups. The dominant trait group of every user is shuffled against the
+dominant genre group, and the p-value is the share of shuffles whose 2x2 table
+is at least as far from independence as the observed one. The same shuffles
+serve all splits at once through one matrix product per chunk, and chunks are
+spread over a process pool, each drawing its shuffles in batches that fit
+``PERMUTATION_BYTES``. P-values are then corrected for the number of tests.
+
+``pair_genre_test`` does the same for the top-two trait pair against genre
+counts table of ``analytics.explore.corr_personality_genre``.
+"""
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from analytics.dataset import GENRES, TRAITS, load_dataset
+from analytics.measures import TRAIT_PAIRS, trait_pair_codes
+from analytics.snapshot import open_snapshot
+
+N_PERMUTATIONS = 10000
+PERMUTATION_CHUNK = 250
+# Memory a worker may spend on one batch of shuffled rows
+PERMUTATION_BYTES = 64 * 1024 * 1024
+ADJUSTMENTS = ["fdr_bh", "holm", "bonferroni"]
+
+
+def splits(n):
+    """Every split of ``range(n)`` into two non-empty groups, each listed once."""
+    result = []
+    for size in range(1, n):
+        for first in itertools.combinations(range(n), size):
+            if 0 in first:
+                result.append((list(first), [i for i in range(n) if i not in first]))
+    return result
+
+
+def dominant_group(values, groups):
+    """1 where the second group of columns sums at least as high as the first, else 0."""
+    return (values[:, groups[0]].sum(axis=1) <= values[:, groups[1]].sum(axis=1)).astype(np.int8)
+
+
+def adjust_pvalues(pvalues, method="fdr_bh"):
+    """Correct p-values for multiple comparisons, ignoring NaNs."""
+    pvalues = np.asarray(pvalues, dtype=float)
+    adjusted = np.full_like(pvalues, np.nan)
+    valid = np.flatnonzero(~np.isnan(pvalues))
+    m = len(valid)
+    if m == 0:
+        return adjusted
+    order = valid[np.argsort(pvalues[valid], kind="stable")]
+    ranked = pvalues[order]
+    if method == "bonferroni":
+        values = ranked * m
+    elif method == "holm":
+        values = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    elif method == "fdr_bh":
+        values = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+    else:
+        raise ValueError("Unknown adjustment {}".format(method))
+    adjusted[order] = np.minimum(values, 1.0)
+    return adjusted
+
+
+def _chunks(n_permutations, seed):
+    """Split the permutations into (seed, size) chunks."""
+    sizes = [PERMUTATION_CHUNK] * (n_permutations // PERMUTATION_CHUNK)
+    if n_permutations % PERMUTATION_CHUNK:
+        sizes.append(n_permutations % PERMUTATION_CHUNK)
+    return [(seed + i, size) for i, size in enumerate(sizes)]
+
+
+def _map(func, jobs, workers):
+    """Run ``func`` over the jobs, on a process pool unless ``workers`` is 1."""
+    if workers == 1:
+        return [func(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, jobs))
+
+
+def _permutations(rng, size, n):
+    """``size`` random permutations of ``range(n)``, one per row."""
+    return rng.rand(size, n).argsort(axis=1)
+
+
+def _batches(seed, size, rows):
+    """The ``size`` permutations of a job, in batches that fit ``PERMUTATION_BYTES``.
+
+    Batches draw from one generator in turn, so the permutations do not
+    depend on the budget.
+    """
+    n = rows.shape[0]
+    # Random keys and argsort indices, then the shuffled rows
+    per_permutation = n * (16 + rows[0].nbytes)
+    batch = max(1, PERMUTATION_BYTES // max(per_permutation, 1))
+    rng = np.random.RandomState(seed)
+    for start in range(0, size, batch):
+        yield _permutations(rng, min(batch, size - start), n)
+
+
+def _count_split_extremes(job):
+    """Count shuffles at least as extreme as observed for every split pair."""
+    trait_dom, genre_dom, expected, observed, seed, size = job
+    extremes = np.zeros(observed.shape, dtype=np.int64)
+    for perms in _batches(seed, size, trait_dom):
+        counts = np.einsum("pnt,ng->ptg", trait_dom[perms], genre_dom)
+        extremes += (np.abs(counts - expected) >= observed - 1e-9).sum(axis=0)
+    return extremes
+
+
+def _chi2_statistic(tables):
+    """Pearson chi-square statistic of a stack of contingency tables."""
+    rows = tables.sum(axis=-1, keepdims=True)
+    cols = tables.sum(axis=-2, keepdims=True)
+    expected = rows * cols / tables.sum(axis=(-2, -1), keepdims=True)
+    terms = np.divide((tables - expected) ** 2, expected, out=np.zeros_like(expected), where=expected > 0)
+    return terms.sum(axis=(-2, -1))
+
+
+def _count_pair_extremes(job):
+    """Count shuffles whose pair by genre table is at least as extreme as observed."""
+    onehot, genres, observed, seed, size = job
+    extremes = 0
+    for perms in _batches(seed, size, onehot):
+        tables = np.einsum("pnk,ng->pkg", onehot[perms], genres)
+        extremes += int((_chi2_statistic(tables) >= observed - 1e-9).sum())
+    return extremes
+
+
+def _validate(data, n_permutations):
+    """Reject arguments no permutation test can run on."""
+    if n_permutations < 1:
+        raise ValueError("n_permutations must be at least 1, got {}".format(n_permutations))
+    if len(data) == 0:
+        raise ValueError("No users with both a quiz and a genre profile to test")
+
+
+def sweep(data, n_permutations=N_PERMUTATIONS, seed=0, workers=None, method="fdr_bh"):
+    """Test every trait split against every genre split.
+
+    ``data`` is a dataset of users having both a quiz and a genre profile.
+    Returns one dict per test, sorted by p-value, with the two trait groups,
+    the two genre groups, the 2x2 table, its permutation p-value and the
+    p-value adjusted with ``method``. Tests where a group never dominates
+    have a NaN p-value.
+    """
+    _validate(data, n_permutations)
+    genres = data.genres[:, :-1]
+    trait_splits = splits(len(TRAITS))
+    genre_splits = splits(genres.shape[1])
+    trait_dom = np.stack([1 - dominant_group(data.traits, s) for s in trait_splits], axis=1).astype(np.float32)
+    genre_dom = np.stack([1 - dominant_group(genres, s) for s in genre_splits], axis=1).astype(np.float32)
+
+    n = float(len(data))
+    observed = trait_dom.T.dot(genre_dom)
+    expected = np.outer(trait_dom.sum(axis=0), genre_dom.sum(axis=0)) / n
+    deviation = np.abs(observed - expected)
+
+    jobs = [(trait_dom, genre_dom, expected, deviation, s, size) for s, size in _chunks(n_permutations, seed)]
+    extremes = sum(_map(_count_split_extremes, jobs, workers or os.cpu_count()))
+    pvalues = (extremes + 1.0) / (n_permutations + 1.0)
+
+    trait_totals = trait_dom.sum(axis=0)
+    genre_totals = genre_dom.sum(axis=0)
+    degenerate = ((trait_totals == 0) | (trait_totals == n))[:, None] | ((genre_totals == 0) | (genre_totals == n))
+    pvalues[degenerate] = np.nan
+    adjusted = adjust_pvalues(pvalues.ravel(), method).reshape(pvalues.shape)
+
+    results = []
+    for i, (t1, t2) in enumerate(trait_splits):
+        for j, (g1, g2) in enumerate(genre_splits):
+            a = observed[i, j]
+            table = np.array([[a, trait_totals[i] - a],
+                              [genre_totals[j] - a, n - trait_totals[i] - genre_totals[j] + a]])
+            results.append({"traits": ([TRAITS[k] for k in t1], [TRAITS[k] for k in t2]),
+                            "genres": ([GENRES[k] for k in g1], [GENRES[k] for k in g2]),
+                            "table": table, "p_value": pvalues[i, j], "p_adjusted": adjusted[i, j]})
+    results.sort(key=lambda r: (np.isnan(r["p_value"]), r["p_value"]))
+    return results
+
+
+def pair_genre_test(data, n_permutations=N_PERMUTATIONS, seed=0, workers=None):
+    """Permutation test of the top-two trait pair against genre counts.
+
+    Returns the chi-square statistic of the observed table and its
+    permutation p-value.
+    """
+    _validate(data, n_permutations)
+    genres = data.genres[:, :-1].astype(np.float32)
+    onehot = np.eye(len(TRAIT_PAIRS), dtype=np.float32)[trait_pair_codes(data.traits)]
+    observed = _chi2_statistic(onehot.T.dot(genres))
+
+    jobs = [(onehot, genres, observed, s, size) for s, size in _chunks(n_permutations, seed)]
+    extremes = sum(_map(_count_pair_extremes, jobs, workers or os.cpu_count()))
+    return {"statistic": float(observed), "p_value": (extremes + 1.0) / (n_permutations + 1.0)}
+
+
+def main():
+    """Command line entry point."""
+    from models import get_debug_session
+    from settings import DB_URL
+
+    parser = argparse.ArgumentParser(description="Permutation tests of personality and genre association.")
+    parser.add_argument("--permutations", type=int, default=N_PERMUTATIONS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--adjust", choices=ADJUSTMENTS, default="fdr_bh")
+    parser.add_argument("--top", type=int, default=10, help="Number of splits to print")
+    parser.add_argument("--db", default=DB_URL, help="Database URL")
+    parser.add_argument("--snapshot", default=None, help="Read the data from this snapshot directory")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        data = open_snapshot(args.snapshot).complete()
+    else:
+        data = load_dataset(get_debug_session(args.db)).complete()
+    pair = pair_genre_test(data, args.permutations, args.seed, args.workers)
+    print("Top-two traits x genres: chi2={:.2f}, p={:.4f}".format(pair["statistic"], pair["p_value"]))
+
+    results = sweep(data, args.permutations, args.seed, args.workers, args.adjust)
+    print("{} trait x genre splits, {} permutations each".format(len(results), args.permutations))
+    for r in results[:args.top]:
+        print("{} vs {} | {} vs {}: p={:.4f}, adjusted={:.4f}".format(
+            "".join(r["traits"][0]), "".join(r["traits"][1]),
+            ",".join(r["genres"][0]), ",".join(r["genres"][1]), r["p_value"], r["p_adjusted"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Columnar snapshot of the research dataset.
+
+Usage:
+    python -m analytics.snapshot [--dir DIR] [--full] [--db URL]
+
+The dataset is written as one ``.npy`` file per column next to a
+``manifest.json`` naming the files, their dtypes and shapes, and the data
+version they were taken at. ``open_snapshot`` memory-maps the files, so
+analysis jobs and worker processes share one copy of the data in the page
+cache and never touch the database.
+
+A refresh only reads the users that changed since the last snapshot: users
+registered since, users with a new quiz, and users whose genre profile has a
+newer ``version``. Users deleted from the database are dropped. The columns
+are then written under a new generation and the manifest is replaced
+atomically, so readers see either the old or the new snapshot. The files
+of the previous generation are kept for readers that are opening it.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+from sqlalchemy import func
+
+from analytics.dataset import GENRES, TRAITS, Dataset, _from_rows, dataset_query, load_dataset
+from db import chunks
+from models import GenreProf, Personality, User, get_data_version, get_debug_session
+from settings import DB_URL, SNAPSHOT_DIR
+
+MANIFEST = "manifest.json"
+
+# On-disk dtype of every column
+DTYPES = {"user_id": np.int64, "age": np.int16, "gender": np.int8, "traits": np.int16, "genres": np.int32,
+          "has_traits": np.bool_, "has_genres": np.bool_}
+
+
+def read_manifest(directory=SNAPSHOT_DIR):
+    """Manifest of the snapshot in ``directory``, or None if there is none."""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def open_snapshot(directory=SNAPSHOT_DIR, mmap_mode="r"):
+    """Open the snapshot in ``directory`` as a dataset of memory-mapped arrays."""
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise IOError("No snapshot in {}".format(directory))
+    columns = dict((name, np.load(os.path.join(directory, column["file"]), mmap_mode=mmap_mode))
+                   for name, column in manifest["columns"].items())
+    genders = np.array(manifest["genders"], dtype="U1")
+    return Dataset(columns["user_id"], columns["age"], genders[columns["gender"]], columns["traits"],
+                   columns["genres"], columns["has_traits"], columns["has_genres"])
+
+
+def changed_users(session, manifest):
+    """Ids of the users whose rows changed since the snapshot of ``manifest``."""
+    queries = [session.query(User.id_).filter(User.id_ > manifest["max_user_id"]),
+               session.query(Personality.user_id).filter(Personality.id_ > manifest["max_personality_id"]),
+               session.query(GenreProf.user_id).filter(GenreProf.version > manifest["data_version"])]
+    return sorted(set(uid for query in queries for uid, in query if uid is not None))
+
+
+def _concat(a, b):
+    """Rows of two datasets, ordered by user id."""
+    data = Dataset(*[np.concatenate([getattr(a, c), getattr(b, c)]) for c in
+                     ["user_id", "age", "gender", "traits", "genres", "has_traits", "has_genres"]])
+    return data.subset(np.argsort(data.user_id, kind="mergesort"))
+
+
+def _write(directory, data, manifest, previous=None):
+    """Write the columns of ``data`` under a new generation, then its manifest.
+
+    Files of generations before ``previous`` are deleted.
+    """
+    generation = manifest["generation"]
+    genders, gender_codes = np.unique(data.gender, return_inverse=True)
+    arrays = {"user_id": data.user_id, "age": data.age, "gender": gender_codes, "traits": data.traits,
+              "genres": data.genres, "has_traits": data.has_traits, "has_genres": data.has_genres}
+
+    manifest["rows"] = len(data)
+    manifest["traits"] = TRAITS
+    manifest["genres"] = GENRES
+    manifest["genders"] = genders.tolist()
+    manifest["columns"] = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array, dtype=DTYPES[name])
+        file_name = "{}.{}.npy".format(name, generation)
+        np.save(os.path.join(directory, file_name), array)
+        manifest["columns"][name] = {"file": file_name, "dtype": array.dtype.str, "shape": list(array.shape)}
+
+    tmp = os.path.join(directory, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+
+    # Readers that already read the previous manifest can still open its
+    # files, and readers that mapped older files keep them until they close.
+    current = set(c["file"] for m in [manifest, previous] if m for c in m["columns"].values())
+    for name in os.listdir(directory):
+        if name.endswith(".npy") and name not in current:
+            os.remove(os.path.join(directory, name))
+
+
+def refresh(session, directory=SNAPSHOT_DIR, full=False):
+    """Bring the snapshot in ``directory`` up to date. Returns its manifest.
+
+    Writes a full snapshot when there is none yet or ``full`` is set, and
+    otherwise replaces only the rows of changed users.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    old = read_manifest(directory)
+    version = get_data_version(session)
+    if old is not None and not full and old["data_version"] == version:
+        old["changed"] = 0
+        return old
+
+    manifest = {"generation": old["generation"] + 1 if old else 1, "data_version": version,
+                "max_user_id": session.query(func.max(User.id_)).scalar() or 0,
+                "max_personality_id": session.query(func.max(Personality.id_)).scalar() or 0}
+    if old is None or full:
+        data = load_dataset(session)
+        manifest["changed"] = len(data)
+    else:
+        changed = changed_users(session, old)
+        rows = []
+        for ids in chunks(changed):
+            rows.extend(dataset_query(session, ids).all())
+        current = np.array([uid for uid, in session.query(User.id_)], dtype=np.int64)
+        snapshot = open_snapshot(directory)
+        keep = np.isin(snapshot.user_id, current) & ~np.isin(snapshot.user_id, changed)
+        data = _concat(snapshot.subset(keep), _from_rows(rows))
+        manifest["changed"] = len(changed)
+    _write(directory, data, manifest, old)
+    return manifest
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Write a columnar snapshot of the Genrenome dataset.")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="Directory of the snapshot")
+    parser.add_argument("--full", action="store_true", help="Rebuild the whole snapshot")
+    parser.add_argument("--db", default=DB_URL, help="Database URL")
+    args = parser.parse_args()
+
+    manifest = refresh(get_debug_session(args.db), args.dir, args.full)
+    print("Snapshot at data version {}: {} users, {} refreshed".format(
+        manifest["data_version"], manifest["rows"], manifest["changed"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Genre annotation of submitted songs."""
+from collections import Counter, defaultdict
+
+from sqlalchemy import func
+
+from db import chunks
+from models import Songs, GenreProf, KnownSong, bump_data_version
+from running_stats import record_changes, user_states
+from settings import ANNOTATE_PAGE_SIZE
+
+
+def annotation_queue(session, after=0, page_size=ANNOTATE_PAGE_SIZE):
+    """Return a page of unlabelled songs with ids above ``after``.
+
+    Returns the songs and the ``after`` value of the next page, which is None
+    on the last page. Paging on the song id keeps every page as cheap as the
+    first one, however deep into the queue it is.
+    """
+    songs = session.query(Songs).filter(Songs.genre == "Unknown", Songs.id_ > after) \
+        .order_by(Songs.id_).limit(page_size + 1).all()
+    if len(songs) > page_size:
+        return songs[:page_size], songs[page_size - 1].id_
+    return songs, None
+
+
+def backlog_size(session):
+    """Count the songs still waiting for a genre."""
+    return session.query(func.count(Songs.id_)).filter(Songs.genre == "Unknown").scalar()
+
+
+def parse_annotations(form):
+    """Map every song id in the annotation form to the genres chosen for it.
+
+    The form has one ``<song id>_<n>`` select per genre slot; slots left as
+    "Unknown" are ignored.
+    """
+    labels = defaultdict(list)
+    for field in sorted(form):
+        genre = form[field]
+        if genre == "Unknown" or genre not in GenreProf.genres:
+            continue
+        labels[int(field.split("_")[0])].append(genre)
+    return dict(labels)
+
+
+def apply_annotations(session, labels):
+    """Label songs and add their genres to the owners' profiles in one transaction.
+
+    ``labels`` maps song ids to the list of genres chosen for them. A song
+    keeps the last genre of its list, and every genre of the list counts once
+    towards the profile of the user that submitted the song. The labels are
+    remembered per song identity and copied to every unlabelled duplicate.
+    Returns the number of songs labelled, duplicates included.
+    """
+    if not labels:
+        return 0
+
+    labels = dict(labels)
+    owners = {}
+    known = {}
+    for ids in chunks(labels):
+        for sid, user_id, key in session.query(Songs.id_, Songs.user_id, Songs.song_key).filter(Songs.id_.in_(ids)):
+            owners[sid] = user_id
+            if key:
+                known[key] = labels[sid]
+    _remember_songs(session, known)
+
+    for keys in chunks(known):
+        duplicates = session.query(Songs.id_, Songs.user_id, Songs.song_key) \
+            .filter(Songs.song_key.in_(keys), Songs.genre == "Unknown")
+        for sid, user_id, key in duplicates:
+            if sid not in owners:
+                owners[sid] = user_id
+                labels[sid] = known[key]
+
+    _label_songs(session, owners, labels, bump_data_version(session))
+    session.commit()
+    return len(owners)
+
+
+def submit_songs(session, user_id, entries):
+    """Add a user's songs, labelling the ones already annotated elsewhere.
+
+    ``entries`` is a list of ``{"title": ..., "artist": ...}`` dicts. Known
+    songs skip the annotation queue. Returns the number of songs labelled.
+    """
+    songs = [Songs(user_id, **e) for e in entries]
+    session.add_all(songs)
+    session.flush()
+
+    known = _known_genres(session, set(s.song_key for s in songs if s.song_key))
+    labels = dict((s.id_, known[s.song_key]) for s in songs if s.song_key in known)
+    _label_songs(session, dict((sid, user_id) for sid in labels), labels, bump_data_version(session))
+    session.commit()
+    return len(labels)
+
+
+def label_known_songs(session, songs, version):
+    """Link songs copied in from another database to the known songs.
+
+    ``songs`` is a list of ``(song_key, genre)`` pairs of the copied songs.
+    The genres of annotated ones are remembered for keys that are not known
+    yet, then every unlabelled song of their keys is labelled, as
+    ``apply_annotations`` labels duplicates. Does not commit. Returns the
+    number of songs labelled.
+    """
+    keys = set(key for key, _ in songs if key)
+    known = _known_genres(session, keys)
+    annotated = dict((key, [genre]) for key, genre in songs
+                     if key and key not in known and genre in GenreProf.genres)
+    _remember_songs(session, annotated)
+    known.update(annotated)
+
+    owners = {}
+    labels = {}
+    for chunk in chunks(known):
+        unlabelled = session.query(Songs.id_, Songs.user_id, Songs.song_key) \
+            .filter(Songs.song_key.in_(chunk), Songs.genre == "Unknown")
+        for sid, user_id, key in unlabelled:
+            owners[sid] = user_id
+            labels[sid] = known[key]
+    _label_songs(session, owners, labels, version)
+    return len(owners)
+
+
+def _known_genres(session, keys):
+    """Map the song keys that were annotated before to their genres."""
+    known = {}
+    for chunk in chunks(keys):
+        for song in session.query(KnownSong).filter(KnownSong.key.in_(chunk)):
+            known[song.key] = song.get_genres()
+    return known
+
+
+def _remember_songs(session, known):
+    """Store the genres of annotated song keys, replacing older annotations."""
+    existing = {}
+    for keys in chunks(known):
+        existing.update(session.query(KnownSong.key, KnownSong.id_).filter(KnownSong.key.in_(keys)).all())
+
+    updates = [{"id_": existing[k], "genres": ",".join(g)} for k, g in known.items() if k in existing]
+    inserts = [{"key": k, "genres": ",".join(g)} for k, g in known.items() if k not in existing]
+    if updates:
+        session.bulk_update_mappings(KnownSong, updates)
+    if inserts:
+        session.bulk_insert_mappings(KnownSong, inserts)
+
+
+def _label_songs(session, owners, labels, version):
+    """Set song genres and increment the owners' genre profiles in bulk.
+
+    ``owners`` maps song ids to user ids and ``labels`` maps song ids to
+    genre lists. Changed profiles are marked with the data ``version`` and
+    the running statistics are updated. Does not commit.
+    """
+    if not owners:
+        return
+
+    by_genre = defaultdict(list)
+    increments = defaultdict(Counter)
+    for sid, user_id in owners.items():
+        by_genre[labels[sid][-1]].append(sid)
+        increments[user_id].update(labels[sid])
+
+    for genre, sids in by_genre.items():
+        for ids in chunks(sids):
+            session.query(Songs).filter(Songs.id_.in_(ids)).update({Songs.genre: genre}, synchronize_session=False)
+
+    states = user_states(session, increments)
+    changes = []
+    for user_id, (traits, genres) in states.items():
+        counts = [(genres[i] if genres else 0) + increments[user_id][g] for i, g in enumerate(GenreProf.genres)]
+        changes.append(((traits, genres), (traits, counts)))
+    record_changes(session, changes, version)
+
+    existing = set()
+    for ids in chunks(increments):
+        existing.update(uid for uid, in session.query(GenreProf.user_id).filter(GenreProf.user_id.in_(ids)))
+
+    new_profiles = []
+    for user_id in increments:
+        if user_id not in existing:
+            profile = dict.fromkeys(GenreProf.genres, 0)
+            profile.update(increments[user_id])
+            profile["user_id"] = user_id
+            profile["version"] = version
+            new_profiles.append(profile)
+    if new_profiles:
+        session.bulk_insert_mappings(GenreProf, new_profiles)
+
+    # One UPDATE per (genre, increment) pair instead of one per profile.
+    groups = defaultdict(list)
+    for user_id in existing:
+        for genre, count in increments[user_id].items():
+            groups[(genre, count)].append(user_id)
+    for (genre, count), user_ids in groups.items():
+        column = getattr(GenreProf, genre)
+        for ids in chunks(user_ids):
+            session.query(GenreProf).filter(GenreProf.user_id.in_(ids)).update(
+                {column: column + count, GenreProf.version: version}, synchronize_session=False)
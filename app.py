@@ -2,31 +2,53 @@
 from flask import Flask
 from flask import request
 from flask import session
-from flask import render_template, url_for, redirect, flash
-
-from gevent.pywsgi import WSGIServer
+from flask import render_template, url_for, redirect, flash, jsonify
+import assets
 
 from settings import DB_URL
 
-import pdb
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine, exists
+from sqlalchemy import exists
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
+from db import make_engine
 from models import User, Admin
-from models import Songs, GenreProf, Personality
-from settings import Key
+from models import Songs, GenreProf, Personality, bump_data_version
+from settings import Key, NEIGHBOURS
 import sys
 
+from metrics import metrics
 from quiz import quiz, score_quiz
+from passwords import needs_rehash
+from progress import get_progress, invalidate_progress
+from recommendations import index as neighbour_index
+from fragments import FragmentCacheExtension
+from running_stats import record_changes, summary, user_states
+from annotation import annotation_queue, backlog_size, parse_annotations, apply_annotations, submit_songs
 
 
 print("Setting up app...")
 app = Flask(__name__)
 app.secret_key = Key
+assets.init_app(app)
+app.jinja_env.add_extension(FragmentCacheExtension)
 print("Creating database link and session...")
-engine = create_engine(DB_URL)
+engine = make_engine(DB_URL)
 db_session = scoped_session(sessionmaker(bind=engine))
+metrics.init_app(app, engine)
+
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    """Return the request's connection to the pool."""
+    db_session.remove()
+
+
+@app.route('/favicon.ico')
+def favicon():
+    """Icon browsers ask for without a link."""
+    return redirect(url_for("static", filename="favicon.ico"))
 
 
 @app.route('/', methods=['GET', 'POST'])
@@ -36,12 +58,11 @@ def index():
     if 'admin' in session:
         return redirect(url_for("admin"))
     if 'user' in session:
+        progress = get_progress(session, db_session, session['user'])
         # Check if the user filled the quiz.
-        p = db_session.query(exists().where(Personality.user_id == session['user'])).scalar()
-        context["personality_check"] = p
+        context["personality_check"] = progress["personality"]
         # Check if the user provided 5 songs
-        s = db_session.query(Songs).filter(Songs.user_id == session['user']).all()
-        if len(s) >= 5:
+        if progress["songs"] >= 5:
             context["music_check"] = True
         return render_template("index.html", **context)
     else:
@@ -59,6 +80,39 @@ def admin():
         return redirect(url_for("index"))
 
 
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Request metrics page."""
+    context = {"index": True}
+    if 'admin' in session:
+        context["admin"] = True
+        context["metrics"] = metrics.snapshot()
+        return render_template("metrics.html", **context)
+    else:
+        return redirect(url_for("index"))
+
+
+@app.route('/admin/metrics.json')
+def admin_metrics_json():
+    """Request metrics as JSON."""
+    if 'admin' in session:
+        return jsonify(metrics.snapshot())
+    else:
+        return redirect(url_for("index"))
+
+
+@app.route('/admin/stats')
+def admin_stats():
+    """Running correlation statistics page."""
+    context = {"index": True}
+    if 'admin' in session:
+        context["admin"] = True
+        context["stats"] = summary(db_session)
+        return render_template("stats.html", **context)
+    else:
+        return redirect(url_for("index"))
+
+
 @app.route('/annotate', methods=['GET', 'POST'])
 def annotate():
     """Annotation Page."""
@@ -66,27 +120,17 @@ def annotate():
     if 'admin' in session:
         context["admin"] = True
         context["genre_list"] = GenreProf.genres
+        after = request.args.get("after", 0, type=int)
         if request.method == "GET":
-            songs = db_session.query(Songs).filter(Songs.genre == "Unknown").all()
+            songs, next_after = annotation_queue(db_session, after)
             context["toannotate"] = songs
+            context["after"] = after
+            context["next_after"] = next_after
+            context["remaining"] = backlog_size(db_session)
             return render_template("annotate.html", **context)
         if request.method == "POST":
-            for id_ in request.form:
-                sgenre = request.form[id_]
-                sid = int(id_.split("_")[0])
-                if sgenre != "Unknown":
-                    song = db_session.query(Songs).filter(Songs.id_ == sid).one()
-                    song.genre = sgenre
-                    profile = db_session.query(GenreProf).filter(GenreProf.user_id == song.user_id).all()
-                    if len(profile) < 1:
-                        profile = GenreProf(song.user_id)
-                        db_session.add(profile)
-                        db_session.commit()
-                    else:
-                        profile = profile[0]
-                    profile.add_genre(**{sgenre: 1})
-            db_session.commit()
-            return redirect(url_for("annotate"))
+            apply_annotations(db_session, parse_annotations(request.form))
+            return redirect(url_for("annotate", after=after))
     else:
         return redirect(url_for("index"))
 
@@ -110,15 +154,21 @@ def songs():
                 if num not in songs:
                     songs[num] = {}
                 songs[num][field] = request.form[k]
-            for s in songs:
-                print(s)
-                db_session.add(Songs(session['user'], **songs[s]))
-            db_session.commit()
+            submit_songs(db_session, session['user'], list(songs.values()))
+            invalidate_progress(session)
             return redirect(url_for('songs'))
     else:
         return redirect(url_for("login"))
 
 
+def _quiz_taken(context):
+    """Quiz page of a user who already took the quiz."""
+    invalidate_progress(session)
+    context["taken_quiz"] = True
+    context["score"] = {}
+    return render_template("quiz.html", **context)
+
+
 @app.route('/personality', methods=['GET', 'POST'])
 def personality():
     """Index Page."""
@@ -126,7 +176,7 @@ def personality():
     if 'admin' in session:
         return redirect(url_for("admin"))
     if 'user' in session:
-        p = db_session.query(exists().where(Personality.user_id == session['user'])).scalar()
+        p = get_progress(session, db_session, session['user'])["personality"]
         if p:
             context["taken_quiz"] = p
             return render_template("quiz.html", **context)
@@ -146,7 +196,7 @@ def personality():
 
             try:
                 ocean_score = score_quiz(score)
-            except KeyError:
+            except (KeyError, ValueError):
                 flash("You have not filled all the questions")
                 return render_template("quiz.html", **context)
 
@@ -158,19 +208,45 @@ def personality():
             user.age = request.form['age']
             user.gender = request.form['gender']
 
+            version = bump_data_version(db_session)
+            # Another session may have saved a quiz since the progress was read.
+            if db_session.query(exists().where(Personality.user_id == session["user"])).scalar():
+                db_session.rollback()
+                return _quiz_taken(context)
+            traits, genres = user_states(db_session, [session["user"]])[session["user"]]
             p = Personality(session["user"], ocean_score)
             db_session.add(p)
-            db_session.commit()
+            record_changes(db_session, [((traits, genres), (ocean_score, genres))], version)
+            try:
+                db_session.commit()
+            except IntegrityError:
+                db_session.rollback()
+                return _quiz_taken(context)
+            invalidate_progress(session)
             return redirect(url_for("personality"))
     else:
         return redirect(url_for("login"))
 
 
+@app.route('/recommendations')
+def recommendations():
+    """Genres of the users with the closest personality, as JSON."""
+    if 'user' in session:
+        k = request.args.get("k", NEIGHBOURS, type=int)
+        result = neighbour_index.recommend(db_session, session['user'], k)
+        if result is None:
+            return jsonify({"error": "Take the personality quiz first"}), 404
+        return jsonify(result)
+    else:
+        return redirect(url_for("login"))
+
+
 @app.route('/logout')
 def logout():
     """Logout."""
     session.pop('user', None)
     session.pop('admin', None)
+    invalidate_progress(session)
     flash("You have successfully logged out")
     return redirect(url_for('login'))
 
@@ -196,8 +272,13 @@ def login():
         if not user.validate_password(password):
             flash("Wrong password")
             return redirect(url_for('login'))
+        # Upgrade hashes made with an older bcrypt cost
+        if needs_rehash(user.password):
+            user.set_password(password)
+            db_session.commit()
         # Login session
         session['user'] = user.id_
+        invalidate_progress(session)
         # Check if user is admin
         if db_session.query(exists().where(Admin.user_id == user.id_)).scalar():
             session['admin'] = True
@@ -225,6 +306,7 @@ def register():
             return redirect(url_for('register'))
         new_user = User(username, password, name, email)
         db_session.add(new_user)
+        bump_data_version(db_session)
         db_session.commit()
         flash("You have successfully registered, please login")
         return redirect(url_for('login'))
@@ -238,13 +320,8 @@ if __name__ == "__main__":
     IP_addr = sys.argv[1]
     port = sys.argv[2]
     try:
-        print("Running server...")
+        print("Running development server, use serve.py in production...")
         app.run(host=IP_addr, debug=True, port=int(port))
-
-    # http_server = WSGIServer((IP_addr, int(port)), app)
-    # print("Server running on http://{}:{}".format(IP_addr, port))
-    # try:
-    #     http_server.serve_forever()
     except KeyboardInterrupt:
         print("Exiting server")
         sys.exit(0)
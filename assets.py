@@ -0,0 +1,190 @@
+"""Fingerprinted, precompressed static assets.
+
+Usage:
+    python assets.py [--static static]
+
+The build copies every static file to ``static/dist`` under a name holding a
+hash of its content, e.g. ``jquery/jquery.min.3f2a9c1b4d5e.js``, next to gzip
+and, when the brotli package is installed, brotli variants of text files,
+and writes a manifest mapping every file to its copy and content hash. Unminified files that have a minified
+sibling and source maps are left out. With Pillow installed, images larger
+than ``ASSET_MAX_IMAGE_SIZE`` are scaled down and icons keep only their
+small sizes.
+
+Once a manifest exists, ``url_for('static', filename=...)`` points at the
+fingerprinted copy, and the static view serves the smallest variant the
+client accepts with an immutable far-future ``Cache-Control`` and an ETag.
+Without a build, static files are served as before.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import Response, request
+
+from settings import ASSET_MAX_AGE, ASSET_MAX_IMAGE_SIZE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+COMPRESSIBLE = [".css", ".js", ".svg", ".ico", ".json", ".txt", ".html"]
+IMAGES = [".jpg", ".jpeg", ".png"]
+ICON_SIZES = [(16, 16), (32, 32), (48, 48)]
+# Browsers only fetch source maps for the developer tools.
+SKIPPED = [".map"]
+
+
+def _minified_exists(path):
+    """Check whether ``path`` is an unminified file with a ``.min`` sibling."""
+    base, ext = os.path.splitext(path)
+    return not base.endswith(".min") and os.path.exists(base + ".min" + ext)
+
+
+def optimize(name, data):
+    """Scale down a large image or trim an icon to small sizes, if Pillow is installed."""
+    ext = os.path.splitext(name)[1].lower()
+    if ext not in IMAGES + [".ico"]:
+        return data
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    image = Image.open(io.BytesIO(data))
+    out = io.BytesIO()
+    if ext == ".ico":
+        image = image.convert("RGBA")
+        image.save(out, format="ICO", sizes=[s for s in ICON_SIZES if s[0] <= image.size[0]])
+    elif max(image.size) > ASSET_MAX_IMAGE_SIZE:
+        image.thumbnail((ASSET_MAX_IMAGE_SIZE, ASSET_MAX_IMAGE_SIZE), Image.LANCZOS)
+        if ext == ".png":
+            image.save(out, format="PNG", optimize=True)
+        else:
+            image.convert("RGB").save(out, format="JPEG", quality=82, optimize=True, progressive=True)
+    else:
+        return data
+    return out.getvalue() if out.tell() < len(data) else data
+
+
+def _gzip(data):
+    """Gzip ``data`` reproducibly, without a timestamp."""
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def build(static_folder):
+    """Write the fingerprinted copies and their manifest. Returns the manifest."""
+    dist = os.path.join(static_folder, DIST)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder and DIST in dirs:
+            dirs.remove(DIST)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1] in SKIPPED or _minified_exists(path):
+                continue
+            with open(path, "rb") as f:
+                data = optimize(name, f.read())
+            relative = os.path.relpath(path, static_folder).replace(os.sep, "/")
+            base, ext = os.path.splitext(relative)
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            hashed = "{}/{}.{}{}".format(DIST, base, digest, ext)
+            target = os.path.join(static_folder, hashed)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            with open(target, "wb") as f:
+                f.write(data)
+            if ext.lower() in COMPRESSIBLE:
+                variants = [(".gz", _gzip(data))]
+                if brotli is not None:
+                    variants.append((".br", brotli.compress(data, quality=11)))
+                for suffix, compressed in variants:
+                    if len(compressed) < len(data):
+                        with open(target + suffix, "wb") as f:
+                            f.write(compressed)
+            manifest[relative] = {"file": hashed, "hash": digest}
+    with open(os.path.join(dist, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    """Manifest of the last build, or None if the assets were not built."""
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def serve(static_folder, filename, digest):
+    """Response with the smallest variant of a fingerprinted file the client accepts.
+
+    ``digest`` is the content hash of the file from the manifest.
+    """
+    path = os.path.join(static_folder, filename)
+    encoding = None
+    for name, suffix in [("br", ".br"), ("gzip", ".gz")]:
+        if request.accept_encodings[name] and os.path.exists(path + suffix):
+            encoding = name
+            path += suffix
+            break
+    with open(path, "rb") as f:
+        response = Response(f.read(), mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "public, max-age={}, immutable".format(ASSET_MAX_AGE)
+    # The content hash identifies the file, one ETag per encoding.
+    response.set_etag(digest + ("-" + encoding if encoding else ""))
+    return response.make_conditional(request)
+
+
+def init_app(app):
+    """Serve the built assets of ``app`` through its static endpoint."""
+    manifest = load_manifest(app.static_folder)
+    if manifest is None:
+        return
+    digests = dict((entry["file"], entry["hash"]) for entry in manifest.values())
+    send_static_file = app.view_functions["static"]
+
+    @app.url_defaults
+    def fingerprint(endpoint, values):
+        """Point static URLs at the fingerprinted copies."""
+        if endpoint == "static" and values.get("filename") in manifest:
+            values["filename"] = manifest[values["filename"]]["file"]
+
+    def static(filename):
+        """Serve fingerprinted copies with long-lived caching, other files as before."""
+        if filename in digests:
+            return serve(app.static_folder, filename, digests[filename])
+        return send_static_file(filename=filename)
+
+    app.view_functions["static"] = static
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed static assets.")
+    parser.add_argument("--static", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"),
+                        help="Static folder")
+    args = parser.parse_args()
+
+    manifest = build(args.static)
+    print("Built {} assets{}".format(len(manifest), "" if brotli else ", install brotli for .br variants"))
+
+
+if __name__ == "__main__":
+    main()
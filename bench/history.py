@@ -0,0 +1,34 @@
+"""Benchmark results recorded per git commit."""
+import json
+import os
+import subprocess
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+
+
+def git_commit():
+    """Current commit hash, or None outside of a git checkout."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(records):
+    """Append result records to ``RESULTS``."""
+    with open(RESULTS, "a") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def previous(commit):
+    """Latest record of every ``(users, name)`` made at another commit than ``commit``."""
+    records = {}
+    if os.path.exists(RESULTS):
+        with open(RESULTS) as f:
+            for line in f:
+                record = json.loads(line)
+                if record["commit"] != commit:
+                    records[(record.get("users"), record["name"])] = record
+    return records
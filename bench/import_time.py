@@ -0,0 +1,84 @@
+"""Start-up cost of a web worker.
+
+Usage:
+    python -m bench.import_time [--module app] [--repeat N] [--max-seconds S] [--max-rss MB] [--compare]
+
+Every run imports the module in a fresh interpreter and measures the import
+time and the peak resident memory of the process. The best time and the
+lowest peak of ``--repeat`` runs are appended to ``bench/results.jsonl``.
+The command fails when the module pulls in one of ``HEAVY_MODULES`` or goes
+over the given budgets, so a regression of worker start-up is noticed.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from bench.history import git_commit, previous, save
+
+# Analysis libraries the web app must not import
+HEAVY_MODULES = ["numpy", "scipy", "matplotlib", "pyarrow", "analytics"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module):
+    """Import ``module`` in a new interpreter, return its import time, peak RSS and heavy imports."""
+    output = subprocess.check_output([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                     cwd=ROOT, stderr=subprocess.DEVNULL)
+    # The last line is the probe's, the module may print while importing.
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def measure(module, repeat):
+    """Best import time and lowest peak RSS of ``repeat`` imports."""
+    runs = [probe(module) for _ in range(repeat)]
+    return {"seconds": min(r["seconds"] for r in runs), "rss_mb": min(r["rss_kb"] for r in runs) / 1024.0,
+            "heavy": sorted(set(m for r in runs for m in r["heavy"]))}
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Measure the import time and memory of the web app.")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail above this import time")
+    parser.add_argument("--max-rss", type=float, default=None, help="Fail above this peak RSS in MB")
+    parser.add_argument("--compare", action="store_true", help="Compare with the previous commit")
+    args = parser.parse_args()
+
+    result = measure(args.module, args.repeat)
+    commit = git_commit()
+    name = "import {}".format(args.module)
+    print("{:<24} {:8.3f}s {:8.1f}MB".format(name, result["seconds"], result["rss_mb"]))
+    if args.compare:
+        old = previous(commit).get((None, name))
+        if old is not None:
+            print("{:<24} {:8.3f}s {:8.1f}MB at {}".format("", old["seconds"], old["rss_mb"], old["commit"]))
+    save([{"commit": commit, "time": time.time(), "users": None, "name": name,
+           "seconds": result["seconds"], "rss_mb": result["rss_mb"]}])
+
+    failures = []
+    if result["heavy"]:
+        failures.append("imports {}".format(", ".join(result["heavy"])))
+    if args.max_seconds is not None and result["seconds"] > args.max_seconds:
+        failures.append("import takes more than {}s".format(args.max_seconds))
+    if args.max_rss is not None and result["rss_mb"] > args.max_rss:
+        failures.append("peak RSS is over {}MB".format(args.max_rss))
+    if failures:
+        print("{}: {}".format(args.module, "; ".join(failures)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
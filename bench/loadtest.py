@@ -0,0 +1,276 @@
+"""Concurrent load test of the volunteer and annotation flows.
+
+Usage:
+    python -m bench.loadtest [--sessions 50] [--concurrency 8] [--passes 5] [--users 1000] [--dir DIR]
+                             [--url http://host:port] [--admin admin] [--password synthetic] [--compare]
+
+Every volunteer session registers, logs in, posts a filled quiz and five
+songs, then logs out, while an admin pages through the annotation queue and
+labels it. ``--concurrency`` threads run the volunteer sessions.
+
+By default the app runs in this process on a copy of the synthetic database
+of ``--users`` users, so every run starts from the same data. Exceptions
+then reach the load test, and SQLite lock timeouts are counted apart from
+other errors; the password hashing and SQL time per route come from the
+app's request metrics. With ``--url`` the sessions go to a running server
+over HTTP and failures are only seen as 5xx responses.
+
+The p95 latency of every route is appended to ``bench/results.jsonl`` and
+``--compare`` prints it next to the results of the previous commit.
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, build_opener
+
+from bench.history import git_commit, previous, save
+from bench.synthetic import SYNTHETIC_PASSWORD
+from quiz import quiz
+
+LABELS = ["Rock", "Pop", "Rap", "Electronic", "Blues"]
+# Songs are drawn from a small pool, so later sessions submit songs that were already annotated.
+SONG_POOL = 300
+SONGS_PER_SESSION = 5
+PASSWORD = "loadtest"
+SONG_FIELD = re.compile(r'name="(\d+)_1"')
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    """Return redirects as responses instead of following them."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        """Do not follow."""
+        return None
+
+
+class HTTPClient(object):
+    """Browser session against a running server."""
+
+    def __init__(self, base_url):
+        """Create new instance."""
+        self.base_url = base_url.rstrip("/")
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        """Status code and body of a request."""
+        body = urlencode(data).encode() if data is not None else None
+        try:
+            response = self.opener.open(self.base_url + path, data=body if method == "POST" else None)
+        except HTTPError as error:
+            return error.code, error.read().decode("utf-8", "replace")
+        return response.status, response.read().decode("utf-8", "replace")
+
+
+class AppClient(object):
+    """Browser session against the app running in this process."""
+
+    def __init__(self, app):
+        """Create new instance."""
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        """Status code and body of a request."""
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+
+class Recorder(object):
+    """Latencies and failures of every route."""
+
+    def __init__(self):
+        """Create new instance."""
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def request(self, client, method, path, data=None):
+        """Send a request and record it. Returns the status and body, or None after an exception."""
+        route = "{} {}".format(method, path.split("?")[0])
+        outcome, result = "ok", None
+        start = time.perf_counter()
+        try:
+            result = client.request(method, path, data)
+            if result[0] >= 500:
+                outcome = "error"
+        except Exception as error:
+            outcome = "locked" if "database is locked" in str(error) else "error"
+        seconds = time.perf_counter() - start
+        with self.lock:
+            stats = self.routes.setdefault(route, {"seconds": [], "error": 0, "locked": 0})
+            stats["seconds"].append(seconds)
+            if outcome != "ok":
+                stats[outcome] += 1
+        return result if outcome == "ok" else None
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list."""
+    return values[min(len(values) - 1, max(0, int(q * len(values) + 0.5) - 1))] if values else 0.0
+
+
+def volunteer(client, recorder, username, rng):
+    """Register, take the quiz and submit songs. Returns whether every step succeeded."""
+    answers = dict((str(k), str(rng.randint(1, 5))) for k in quiz)
+    answers.update(age=str(rng.randint(16, 60)), gender=rng.choice(["M", "F"]))
+    songs = {}
+    for i in range(SONGS_PER_SESSION):
+        number = rng.randint(0, SONG_POOL - 1)
+        songs["title_{}".format(i)] = "Load song {}".format(number)
+        songs["artist_{}".format(i)] = "Load artist {}".format(number % 40)
+    steps = [("POST", "/register", {"name": username, "username": username, "email": username + "@load",
+                                    "password": PASSWORD, "confirm_password": PASSWORD}),
+             ("POST", "/login", {"username": username, "password": PASSWORD}),
+             ("POST", "/personality", answers),
+             ("POST", "/songs", songs),
+             ("GET", "/logout", None)]
+    for method, path, data in steps:
+        if recorder.request(client, method, path, data) is None:
+            return False
+    return True
+
+
+def annotator(client, recorder, username, password, passes, rng):
+    """Log in as admin and label ``passes`` pages of the annotation queue."""
+    if recorder.request(client, "POST", "/login", {"username": username, "password": password}) is None:
+        return
+    for _ in range(passes):
+        page = recorder.request(client, "GET", "/annotate")
+        if page is None:
+            continue
+        labels = dict(("{}_1".format(sid), rng.choice(LABELS)) for sid in SONG_FIELD.findall(page[1]))
+        recorder.request(client, "POST", "/annotate", labels)
+
+
+def _in_process_app(users, directory):
+    """Import the app bound to a fresh copy of the synthetic database."""
+    from bench.synthetic import generate
+    from migrate import upgrade
+
+    path = os.path.join(directory, "synthetic_{}.db".format(users))
+    if not os.path.exists(path):
+        generate("sqlite:///" + path, users)
+    copy = os.path.join(directory, "loadtest_{}.db".format(users))
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(copy + suffix):
+            os.remove(copy + suffix)
+    shutil.copy(path, copy)
+    # Databases generated by an older commit may lack newer tables and columns.
+    upgrade("sqlite:///" + copy)
+
+    # The app binds its database when it is imported.
+    import settings
+    settings.DB_URL = "sqlite:///" + copy
+    from app import app
+    from metrics import metrics
+    app.config["PROPAGATE_EXCEPTIONS"] = True
+    # The report covers slow requests, without logging each one.
+    metrics.slow_seconds = float("inf")
+    return app
+
+
+def run(sessions, concurrency, passes, url=None, users=1000, directory=tempfile.gettempdir(),
+        admin="admin", password=SYNTHETIC_PASSWORD, seed=0):
+    """Run the load test. Returns the recorder, the successful sessions and the wall time."""
+    if url:
+        def client():
+            return HTTPClient(url)
+    else:
+        app = _in_process_app(users, directory)
+
+        def client():
+            return AppClient(app)
+
+    recorder = Recorder()
+    token = "{:x}".format(int(time.time() * 1000))
+
+    def session(number):
+        return volunteer(client(), recorder, "load{}-{}".format(token, number), random.Random(seed + number))
+
+    start = time.perf_counter()
+    admin_thread = threading.Thread(target=annotator, args=(client(), recorder, admin, password, passes,
+                                                            random.Random(seed)))
+    admin_thread.start()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        succeeded = sum(pool.map(session, range(sessions)))
+    admin_thread.join()
+    return recorder, succeeded, time.perf_counter() - start
+
+
+def report(recorder, sessions, succeeded, seconds, concurrency):
+    """Print the throughput and latency of every route. Returns the result records."""
+    commit = git_commit()
+    requests = sum(len(s["seconds"]) for s in recorder.routes.values())
+    print("{} of {} sessions succeeded in {:.2f}s at concurrency {}: {:.2f} sessions/s, {:.1f} requests/s".format(
+        succeeded, sessions, seconds, concurrency, succeeded / seconds, requests / seconds))
+    print("{:<18} {:>8} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9}".format(
+        "route", "requests", "errors", "locked", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    records = []
+    for route, stats in sorted(recorder.routes.items()):
+        values = sorted(stats["seconds"])
+        p50, p95, p99 = [percentile(values, q) for q in (0.5, 0.95, 0.99)]
+        print("{:<18} {:>8} {:>7} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            route, len(values), stats["error"], stats["locked"], p50 * 1000, p95 * 1000, p99 * 1000,
+            values[-1] * 1000))
+        records.append({"commit": commit, "time": time.time(), "users": None,
+                        "name": "loadtest c{} {}".format(concurrency, route), "seconds": p95,
+                        "p50": p50, "p99": p99, "requests": len(values), "errors": stats["error"],
+                        "locked": stats["locked"]})
+    return records
+
+
+def report_metrics():
+    """Print the password hashing and SQL time per request of the in-process app."""
+    from metrics import metrics
+
+    print("{:<18} {:>10} {:>10} {:>10}".format("endpoint", "bcrypt ms", "SQL ms", "queries"))
+    for name, stats in sorted(metrics.snapshot()["endpoints"].items()):
+        n = float(max(stats["requests"], 1))
+        print("{:<18} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+            name, stats["hash_seconds"] * 1000 / n, stats["query_seconds"] * 1000 / n, stats["mean_queries"]))
+
+
+def compare(records):
+    """Print the records next to the latest results of another commit."""
+    old_records = previous(records[0]["commit"] if records else None)
+    for record in records:
+        old = old_records.get((record["users"], record["name"]))
+        if old is not None:
+            print("{:<28} p95 {:9.1f}ms -> {:9.1f}ms ({:+.0f}%) vs {}".format(
+                record["name"], old["seconds"] * 1000, record["seconds"] * 1000,
+                100.0 * (record["seconds"] - old["seconds"]) / max(old["seconds"], 1e-9), old["commit"]))
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Load test the Genrenome volunteer flow.")
+    parser.add_argument("--sessions", type=int, default=50, help="Volunteer sessions to run")
+    parser.add_argument("--concurrency", type=int, default=8, help="Volunteer sessions running at once")
+    parser.add_argument("--passes", type=int, default=5, help="Annotation pages the admin labels")
+    parser.add_argument("--url", help="Base URL of a running server, instead of the app in this process")
+    parser.add_argument("--users", type=int, default=1000, help="Size of the synthetic database")
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="Directory of the synthetic databases")
+    parser.add_argument("--admin", default="admin", help="Admin username")
+    parser.add_argument("--password", default=SYNTHETIC_PASSWORD, help="Admin password")
+    parser.add_argument("--compare", action="store_true", help="Compare with the previous commit")
+    args = parser.parse_args()
+
+    recorder, succeeded, seconds = run(args.sessions, args.concurrency, args.passes, args.url, args.users,
+                                       args.dir, args.admin, args.password)
+    records = report(recorder, args.sessions, succeeded, seconds, args.concurrency)
+    if not args.url:
+        report_metrics()
+    save(records)
+    if args.compare:
+        compare(records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Benchmarks of the analyses and hot routes on synthetic data.
+
+Usage:
+    python -m bench.run [--users 1000 100000 1000000] [--repeat N] [--dir DIR] [--compare]
+
+A synthetic database is generated for every size (and reused when it already
+exists in ``--dir``). Every benchmark reports the best of ``--repeat`` runs;
+benchmarks that write run on a fresh copy of the database every time, made
+outside the timing, so the cached database stays as generated.
+Results are appended to ``bench/results.jsonl`` with the current git commit,
+and ``--compare`` prints them next to the results of the previous commit.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from analytics import load_dataset, results
+from analytics.significance import sweep
+from annotation import annotation_queue, apply_annotations, backlog_size
+from bench.history import git_commit, previous, save
+from bench.synthetic import generate
+from migrate import upgrade
+from models import User, get_debug_session
+from progress import user_progress
+
+LABELS = ["Rock", "Pop", "Rap", "Electronic"]
+SWEEP_PERMUTATIONS = 200
+
+
+def best_of(func, repeat, setup=None):
+    """Best wall time of ``repeat`` calls, in seconds.
+
+    ``setup`` runs untimed before every call and its result is passed to ``func``.
+    """
+    times = []
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+class ScratchCopy(object):
+    """Fresh copies of a database for benchmarks that write to it."""
+
+    def __init__(self, path):
+        """Create new instance."""
+        self.path = path
+        self.copy = os.path.join(os.path.dirname(path), "scratch_" + os.path.basename(path))
+        self.session = None
+
+    def __call__(self):
+        """Session on a new copy, replacing the previous one."""
+        self.close()
+        shutil.copy(self.path, self.copy)
+        self.session = get_debug_session("sqlite:///" + self.copy)
+        return self.session
+
+    def close(self):
+        """Close the session and delete the copy."""
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.copy + suffix):
+                os.remove(self.copy + suffix)
+
+
+def benchmarks(session, rng, path):
+    """Map benchmark names to the functions they time, or ``(setup, function)`` pairs.
+
+    ``path`` is the file of the session's database.
+    """
+    data = load_dataset(session).complete()
+    user_ids = [u for u, in session.query(User.id_).limit(1000)]
+
+    def annotate(scratch):
+        songs, _ = annotation_queue(scratch)
+        apply_annotations(scratch, dict((s.id_, [LABELS[rng.randint(len(LABELS))]]) for s in songs))
+
+    def annotate_page():
+        annotation_queue(session)
+        backlog_size(session)
+
+    # The analyses run without their result cache, which would otherwise
+    # answer every run after the first.
+    return OrderedDict([
+        ("load_dataset", lambda: load_dataset(session)),
+        ("trait_pair_histogram", lambda: results.trait_pair_histogram.__wrapped__(session)),
+        ("genre_profile", lambda: results.genre_profile.__wrapped__(session)),
+        ("age_genre_means", lambda: results.age_genre_means.__wrapped__(session)),
+        ("gender_genre_means", lambda: results.gender_genre_means.__wrapped__(session)),
+        ("pair_genre_counts", lambda: results.pair_genre_counts.__wrapped__(session)),
+        ("significance_sweep", lambda: sweep(data, n_permutations=SWEEP_PERMUTATIONS, workers=1)),
+        ("annotation_page", annotate_page),
+        ("annotation_submit", (ScratchCopy(path), annotate)),
+        ("user_progress", lambda: user_progress(session, user_ids[rng.randint(len(user_ids))])),
+    ])
+
+
+def run(sizes, repeat, directory):
+    """Run every benchmark on every database size. Returns the result records."""
+    commit = git_commit()
+    records = []
+    for size in sizes:
+        path = os.path.join(directory, "synthetic_{}.db".format(size))
+        url = "sqlite:///" + path
+        if not os.path.exists(path):
+            generate(url, size)
+        # Databases generated by an older commit may lack newer tables and columns.
+        upgrade(url)
+        session = get_debug_session(url)
+        for name, func in benchmarks(session, np.random.RandomState(0), path).items():
+            setup, func = func if isinstance(func, tuple) else (None, func)
+            seconds = best_of(func, repeat, setup)
+            if setup is not None:
+                setup.close()
+            records.append({"commit": commit, "time": time.time(), "users": size, "name": name, "seconds": seconds})
+            print("{:>9} users  {:<24} {:10.6f}s".format(size, name, seconds))
+        session.close()
+    save(records)
+    return records
+
+
+def compare(records):
+    """Print the records next to the latest results of another commit."""
+    old_records = previous(records[0]["commit"] if records else None)
+    for record in records:
+        old = old_records.get((record["users"], record["name"]))
+        if old is not None:
+            print("{:>9} users  {:<24} {:10.6f}s -> {:10.6f}s ({:+.0f}%) vs {}".format(
+                record["users"], record["name"], old["seconds"], record["seconds"],
+                100.0 * (record["seconds"] - old["seconds"]) / max(old["seconds"], 1e-9), old["commit"]))
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark Genrenome on synthetic data.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="Directory of the synthetic databases")
+    parser.add_argument("--compare", action="store_true", help="Compare with the previous commit")
+    args = parser.parse_args()
+
+    records = run(args.users, args.repeat, args.dir)
+    if args.compare:
+        compare(records)
+
+
+if __name__ == "__main__":
+    main()
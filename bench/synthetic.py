@@ -0,0 +1,129 @@
+"""Synthetic Genrenome databases.
+
+Usage:
+    python -m bench.synthetic [--users N] [--duplicates RATE] [--labelled RATE] <database url>
+
+Every user gets a latent OCEAN profile from which the answers to the 50 quiz
+questions are drawn, and the answers are scored with
+``analytics.scoring.score_batch``.
+Genre preferences depend on the latent profile, so the analyses have an
+association to find. Each user submits five songs; with probability
+``duplicates`` a song is an already submitted popular song of the chosen
+genre, otherwise a new one. A ``labelled`` share of the distinct songs is
+annotated, and genre profiles count the genres of the labelled songs.
+
+All users share the password ``SYNTHETIC_PASSWORD``.
+"""
+import argparse
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+
+from analytics.scoring import score_batch
+from models import User, Admin, Songs, Personality, GenreProf, KnownSong, song_key
+from migrate import upgrade
+from passwords import hash_password
+from quiz import N_QUESTIONS, TRAITS, WEIGHTS
+
+SYNTHETIC_PASSWORD = "synthetic"
+SONGS_PER_USER = 5
+CHUNK_SIZE = 10000
+
+
+def _insert(connection, model, rows):
+    """Insert rows with one executemany per chunk."""
+    for i in range(0, len(rows), CHUNK_SIZE):
+        connection.execute(model.__table__.insert(), rows[i:i + CHUNK_SIZE])
+
+
+def answers(latent, rng):
+    """Draw quiz answers from latent trait levels, one row per user."""
+    raw = 3 + latent.dot(np.asarray(WEIGHTS).T) + rng.normal(0, 0.8, size=(latent.shape[0], N_QUESTIONS))
+    return np.clip(np.round(raw), 1, 5)
+
+
+def _song(number):
+    """Title and artist of a synthetic song."""
+    return "Song {}".format(number), "Artist {}".format(number % 997)
+
+
+def generate(url, n_users, duplicates=0.5, labelled=0.9, seed=0):
+    """Fill a fresh database with ``n_users`` synthetic volunteers and one admin."""
+    rng = np.random.RandomState(seed)
+    upgrade(url)
+    engine = create_engine(url)
+    genres = GenreProf.genres
+    password = hash_password(SYNTHETIC_PASSWORD)
+    taste = rng.normal(0, 0.8, size=(len(TRAITS), len(genres)))
+    start = time.time()
+
+    with engine.begin() as connection:
+        _insert(connection, User, [{"id_": 1, "username": "admin", "password": password, "name": "admin",
+                                    "email": "admin@genrenome", "age": 0, "gender": "U"}])
+        _insert(connection, Admin, [{"user_id": 1}])
+
+    # Song numbers of every genre in order of first submission, and whether
+    # each song was annotated.
+    catalog = [[] for _ in genres]
+    is_labelled = {}
+    for first in range(0, n_users, CHUNK_SIZE):
+        n = min(CHUNK_SIZE, n_users - first)
+        user_ids = np.arange(first, first + n) + 2
+        latent = rng.normal(0, 1, size=(n, len(TRAITS)))
+        scores, _ = score_batch(answers(latent, rng))
+        preference = latent.dot(taste)
+        preference = np.exp(preference - preference.max(axis=1, keepdims=True))
+        preference /= preference.sum(axis=1, keepdims=True)
+        slot_genre = (preference.cumsum(axis=1).repeat(SONGS_PER_USER, axis=0) <
+                      rng.rand(n * SONGS_PER_USER, 1)).sum(axis=1).clip(max=len(genres) - 1)
+
+        counts = np.zeros((n, len(genres)), dtype=np.int64)
+        songs = []
+        known = []
+        for slot, genre in enumerate(slot_genre):
+            if catalog[genre] and rng.rand() < duplicates:
+                # Zipf-like popularity: earlier songs of a genre come up more often.
+                number = catalog[genre][int(len(catalog[genre]) * rng.rand() ** 3)]
+            else:
+                number = first * SONGS_PER_USER + slot
+                catalog[genre].append(number)
+                is_labelled[number] = rng.rand() < labelled
+                if is_labelled[number]:
+                    known.append({"key": song_key(*_song(number)), "genres": genres[genre]})
+            title, artist = _song(number)
+            if is_labelled[number]:
+                counts[slot // SONGS_PER_USER, genre] += 1
+            songs.append({"user_id": int(user_ids[slot // SONGS_PER_USER]), "title": title, "artist": artist,
+                          "genre": genres[genre] if is_labelled[number] else "Unknown",
+                          "song_key": song_key(title, artist)})
+
+        with engine.begin() as connection:
+            _insert(connection, User, [{"id_": int(u), "username": "user{}".format(u), "password": password,
+                                        "name": "User {}".format(u), "email": "user{}@genrenome".format(u),
+                                        "age": int(a), "gender": g}
+                                       for u, a, g in zip(user_ids, rng.randint(15, 60, size=n),
+                                                          rng.choice(["M", "F", "U"], size=n, p=[.45, .45, .1]))])
+            _insert(connection, Personality, [dict([("user_id", int(u))] + [(t, int(v)) for t, v in zip(TRAITS, row)])
+                                              for u, row in zip(user_ids, scores)])
+            _insert(connection, Songs, songs)
+            _insert(connection, GenreProf, [dict([("user_id", int(u))] + [(g, int(c)) for g, c in zip(genres, row)])
+                                            for u, row in zip(user_ids, counts) if row.any()])
+            _insert(connection, KnownSong, known)
+        print("{} users, {:.1f}s".format(first + n, time.time() - start))
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Generate a synthetic Genrenome database.")
+    parser.add_argument("url", help="URL of a new database")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--duplicates", type=float, default=0.5, help="Share of songs that repeat a known song")
+    parser.add_argument("--labelled", type=float, default=0.9, help="Share of distinct songs annotated")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.url, args.users, args.duplicates, args.labelled, args.seed)
+
+
+if __name__ == "__main__":
+    main()
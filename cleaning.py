@@ -0,0 +1,129 @@
+"""Data cleaning rules applied as set-based deletes.
+
+Usage:
+    python cleaning.py [--dry-run] [--db URL] <rule> [<rule> ...]
+
+Every rule is a single ``DELETE ... WHERE`` statement. Rules that delete
+users first delete the rows of those users, so foreign keys hold throughout,
+and every rule ends with deletes of rows that were already without a user.
+The database is never loaded into Python. All rules of a run share one
+transaction, which is rolled back in dry-run mode after counting the rows
+that would go.
+"""
+import argparse
+from collections import OrderedDict
+
+from sqlalchemy import exists, func, inspect, or_
+
+from models import User, Admin, Songs, Personality, GenreProf, MergeMap, bump_data_version, get_debug_session
+from running_stats import recompute
+from settings import DB_URL
+
+# Tables whose rows belong to a user and go with it
+USER_TABLES = [Songs, Personality, GenreProf, MergeMap, Admin]
+
+
+def _not_admin():
+    """Users without admin rights, which are never cleaned."""
+    return ~exists().where(Admin.user_id == User.id_)
+
+
+def no_personality(session):
+    """Users who did not take quiz."""
+    return session.query(User).filter(~exists().where(Personality.user_id == User.id_), _not_admin())
+
+
+def no_songs(session):
+    """Users who did not give songs."""
+    return session.query(User).filter(~exists().where(Songs.user_id == User.id_), _not_admin())
+
+
+def invalid_songs(session):
+    """Songs that are blank."""
+    return session.query(Songs).filter(or_(Songs.title.is_(None), func.trim(Songs.title) == ""))
+
+
+def _user_tables(session):
+    """Models of ``USER_TABLES`` whose table exists."""
+    tables = inspect(session.get_bind()).get_table_names()
+    return [model for model in USER_TABLES if model.__tablename__ in tables]
+
+
+def delete_user_rows(session, users):
+    """Delete rows of the users selected by a query. Returns the count per table."""
+    user_ids = users.with_entities(User.id_)
+    counts = OrderedDict()
+    for model in _user_tables(session):
+        counts[model.__tablename__] = session.query(model).filter(model.user_id.in_(user_ids)) \
+            .delete(synchronize_session=False)
+    return counts
+
+
+def delete_orphans(session):
+    """Delete rows of users that do not exist. Returns the count per table."""
+    counts = OrderedDict()
+    for model in _user_tables(session):
+        counts[model.__tablename__] = session.query(model).filter(~exists().where(User.id_ == model.user_id)) \
+            .delete(synchronize_session=False)
+    return counts
+
+
+# Rules map to the query of the rows they delete; "orphans" only runs the
+# cleanup of rows left without a user that follows every rule.
+RULES = OrderedDict([
+    ("no_personality", no_personality),
+    ("no_songs", no_songs),
+    ("invalid_songs", invalid_songs),
+    ("orphans", None),
+])
+
+
+def clean(session, rules, dry_run=False):
+    """Apply cleaning rules in one transaction.
+
+    Returns an ordered dict mapping ``<rule>.<table>`` to the number of rows
+    deleted, or that would be deleted when ``dry_run`` is set. Rows removed
+    because their user went, or was already gone, are reported as
+    ``<rule>.<table> (orphaned)``.
+    """
+    report = OrderedDict()
+    try:
+        for rule in rules:
+            orphaned = OrderedDict()
+            if RULES[rule] is not None:
+                query = RULES[rule](session)
+                entity = query.column_descriptions[0]["entity"]
+                if entity is User:
+                    orphaned = delete_user_rows(session, query)
+                report[rule + "." + entity.__tablename__] = query.delete(synchronize_session=False)
+            for table, count in delete_orphans(session).items():
+                orphaned[table] = orphaned.get(table, 0) + count
+            for table, count in orphaned.items():
+                report[rule + "." + table + " (orphaned)"] = count
+    except Exception:
+        session.rollback()
+        raise
+    if dry_run:
+        session.rollback()
+    else:
+        bump_data_version(session)
+        recompute(session)
+        session.commit()
+    return report
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Delete invalid Genrenome data.")
+    parser.add_argument("rules", nargs="+", choices=list(RULES))
+    parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would be deleted")
+    parser.add_argument("--db", default=DB_URL, help="Database URL")
+    args = parser.parse_args()
+
+    report = clean(get_debug_session(args.db), args.rules, args.dry_run)
+    for step, count in report.items():
+        print("{}{}: {}".format("[dry run] " if args.dry_run else "", step, count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Database engine configuration."""
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+from settings import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, SQLITE_BUSY_TIMEOUT
+
+# Keep IN (...) lists below SQLite's bound parameter limit.
+CHUNK_SIZE = 500
+
+
+def chunks(values, size=CHUNK_SIZE):
+    """Split values into lists of at most ``size`` items, one per IN (...) list."""
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """Let SQLite readers and a writer work concurrently and wait on locks."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout={}".format(int(SQLITE_BUSY_TIMEOUT)))
+    cursor.close()
+
+
+def make_engine(url):
+    """Create an engine with the pool settings of ``settings.py``.
+
+    SQLite files get a pool of connections shareable across threads, each
+    running in WAL mode with ``synchronous=NORMAL`` and a busy timeout.
+    """
+    options = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW,
+               "pool_timeout": DB_POOL_TIMEOUT, "pool_recycle": DB_POOL_RECYCLE, "pool_pre_ping": True}
+    parsed = make_url(url)
+    sqlite = parsed.get_backend_name() == "sqlite"
+    if sqlite:
+        if parsed.database in (None, "", ":memory:"):
+            return create_engine(url)
+        options["poolclass"] = QueuePool
+        options["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT / 1000.0}
+
+    engine = create_engine(url, **options)
+    if sqlite:
+        event.listen(engine, "connect", _sqlite_pragmas)
+    return engine
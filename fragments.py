@@ -0,0 +1,94 @@
+"""Cache of rendered template fragments.
+
+Templates mark the parts that render the same for many requests:
+
+    {% cache "genre-options", genre_list %} ... {% endcache %}
+
+A fragment is rendered once for every combination of its key values and
+then served from a bounded in-process LRU. Key values should come from the
+server and take few values; request input would let clients fill the cache.
+Keys also hold the template name, a hash of the template source and the
+position of the fragment, so an edited template never serves fragments of
+its older version.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from settings import FRAGMENT_CACHE_SIZE
+
+
+class LRUCache(object):
+    """Thread-safe mapping that drops its least recently used items beyond ``size``."""
+
+    def __init__(self, size):
+        """Create new instance."""
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return ``(True, value)`` for a cached key and ``(False, None)`` otherwise."""
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return True, self.items[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used one when full."""
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        """Drop every item."""
+        with self.lock:
+            self.items.clear()
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja extension adding the ``{% cache name, *keys %}`` tag."""
+
+    tags = set(["cache"])
+
+    def __init__(self, environment):
+        """Create new instance."""
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=LRUCache(FRAGMENT_CACHE_SIZE))
+
+    def _template_key(self, name):
+        """Name and source hash of the template being parsed."""
+        source = ""
+        if name is not None and self.environment.loader is not None:
+            source = self.environment.loader.get_source(self.environment, name)[0]
+        return "{}:{}".format(name, hashlib.sha1(source.encode("utf-8")).hexdigest())
+
+    def parse(self, parser):
+        """Parse ``{% cache name, *keys %} body {% endcache %}``."""
+        lineno = next(parser.stream).lineno
+        keys = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            keys.append(parser.parse_expression())
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        template = nodes.Const("{}:{}".format(self._template_key(parser.name), lineno))
+        return nodes.CallBlock(self.call_method("_render", [template, nodes.List(keys)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render(self, template, keys, caller):
+        """Return the cached fragment, rendering it on a miss."""
+        key = hashlib.sha1(repr((template, keys)).encode("utf-8")).hexdigest()
+        hit, value = self.environment.fragment_cache.get(key)
+        if not hit:
+            value = caller()
+            self.environment.fragment_cache.put(key, value)
+        return value
@@ -0,0 +1,230 @@
+"""Merge the data of one Genrenome database into another.
+
+Usage:
+    python merge.py [--tag TAG] [--chunk-size N] <source database url> [target database url]
+
+Users, songs, personality scores and genre profiles of the source are copied
+into the target in batched transactions of about ``chunk_size`` rows. Merged
+users get new ids from the target, recorded in its ``merge_map`` table,
+through which the foreign keys of their other rows are remapped. Only the
+latest quiz of every user is copied. Merged songs are linked to the known
+songs of the target like submitted and annotated ones: songs annotated in
+the source become known, and unlabelled songs whose key is known are
+labelled and counted in their owners' genre profiles. Admin rights are not
+merged.
+
+A merge that stopped halfway can be run again: users already in
+``merge_map`` are skipped, and so are the rows of a table for users that
+already have rows in it, since every transaction copies all rows of its
+users.
+
+Merged users are recorded under a tag of the source, by default its URL
+without credentials and with SQLite paths made absolute, so a source is
+recognised whichever working directory it is merged from.
+
+A username or email that already exists in the target is suffixed with
+``_<source user id>``, shortened to fit its column, which keeps the merge
+deterministic for a given pair of databases.
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine, func, inspect
+from sqlalchemy.orm import sessionmaker
+
+from analytics.cache import database_id
+from annotation import label_known_songs
+from models import User, Songs, Personality, GenreProf, MergeMap, bump_data_version, song_key
+from migrate import upgrade
+from running_stats import recompute
+from settings import DB_URL
+
+MERGE_CHUNK_SIZE = 500
+
+
+def _stream(query, chunk_size):
+    """Yield the rows of a query as lists of at most ``chunk_size`` rows."""
+    rows = []
+    for row in query.yield_per(chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def _stream_by_user(query, chunk_size):
+    """Yield the rows of a query ordered by user id as lists that never split the rows of a user."""
+    rows = []
+    for row in query.yield_per(chunk_size):
+        if len(rows) >= chunk_size and row[0] != rows[-1][0]:
+            yield rows
+            rows = []
+        rows.append(row)
+    if rows:
+        yield rows
+
+
+class Progress(object):
+    """Report rows copied and throughput of one table."""
+
+    def __init__(self, table):
+        """Create new instance."""
+        self.table = table
+        self.rows = 0
+        self.start = time.time()
+
+    def update(self, rows):
+        """Count copied rows and print the running throughput."""
+        self.rows += rows
+        elapsed = max(time.time() - self.start, 1e-6)
+        print("{}: {} rows, {:.0f} rows/s".format(self.table, self.rows, self.rows / elapsed))
+
+
+def _suffixed(name, suffix, length):
+    """Name ending with ``_<suffix>``, shortened to at most ``length`` characters."""
+    suffix = "_{}".format(suffix)
+    if length is None:
+        return name + suffix
+    return name[:max(length - len(suffix), 0)] + suffix
+
+
+def _free_names(target, column, names, suffixes):
+    """Rename the ``names`` taken in the target column with their suffix."""
+    length = column.type.length
+    taken = set(v for v, in target.query(column).filter(column.in_([n for n in names if n is not None])))
+    free = []
+    for name, suffix in zip(names, suffixes):
+        candidate, attempt = name, 0
+        while candidate is not None and candidate in taken:
+            attempt += 1
+            candidate = _suffixed(name, suffix if attempt == 1 else "{}_{}".format(suffix, attempt), length)
+            taken.update(v for v, in target.query(column).filter(column == candidate))
+        taken.add(candidate)
+        free.append(candidate)
+    return free
+
+
+def _user_map(target, tag, user_ids):
+    """Map source user ids to target user ids."""
+    query = target.query(MergeMap.source_user_id, MergeMap.user_id) \
+        .filter(MergeMap.source == tag, MergeMap.source_user_id.in_(set(user_ids)))
+    return dict(query.all())
+
+
+def merge_users(source, target, tag, chunk_size=MERGE_CHUNK_SIZE):
+    """Copy users into the target, recording their new ids in ``merge_map``.
+
+    Users merged before are skipped.
+    """
+    progress = Progress("users")
+    query = source.query(User.id_, User.username, User.password, User.name,
+                         User.email, User.age, User.gender).order_by(User.id_)
+    for rows in _stream(query, chunk_size):
+        merged = _user_map(target, tag, [r.id_ for r in rows])
+        rows = [r for r in rows if r.id_ not in merged]
+        if not rows:
+            continue
+        ids = [r.id_ for r in rows]
+        usernames = _free_names(target, User.username, [r.username for r in rows], ids)
+        emails = _free_names(target, User.email, [r.email for r in rows], ids)
+
+        users = [{"username": usernames[i], "password": row.password, "name": row.name,
+                  "email": emails[i], "age": row.age, "gender": row.gender} for i, row in enumerate(rows)]
+        # The target assigns the ids, which keeps its id sequence in step. The
+        # chunk goes in one executemany and the ids are read back by the unique
+        # usernames; users without one cannot be found again and go one by one.
+        named = [user for user in users if user["username"] is not None]
+        target.bulk_insert_mappings(User, named)
+        new_ids = dict(target.query(User.username, User.id_).filter(User.username.in_([u["username"] for u in named])))
+        for user in named:
+            user["id_"] = new_ids[user["username"]]
+        target.bulk_insert_mappings(User, [user for user in users if user["username"] is None], return_defaults=True)
+        target.bulk_insert_mappings(MergeMap, [{"source": tag, "source_user_id": row.id_, "user_id": user["id_"]}
+                                               for row, user in zip(rows, users)])
+        bump_data_version(target)
+        target.commit()
+        progress.update(len(rows))
+
+
+def merge_rows(source, target, tag, model, names, chunk_size=MERGE_CHUNK_SIZE, default=None, derive=None,
+               only=None, after=None):
+    """Copy the ``names`` columns of a user owned table, remapping its ``user_id``.
+
+    Columns missing from an older source database are filled with
+    ``default`` and ``derive(row, data version)`` may add computed columns
+    to every row. ``only`` is an optional filter of the source rows, and
+    ``after(rows, data version)`` runs in the transaction of every chunk
+    once its rows are inserted. Rows of unknown users, and of users that
+    already have rows in the target table, are skipped.
+    """
+    progress = Progress(model.__tablename__)
+    available = set(c["name"] for c in inspect(source.get_bind()).get_columns(model.__tablename__))
+    present = [n for n in names if n in available]
+    query = source.query(model.user_id, *[getattr(model, n) for n in present]).order_by(model.user_id, model.id_)
+    if only is not None:
+        query = query.filter(only)
+    for rows in _stream_by_user(query, chunk_size):
+        users = _user_map(target, tag, [r[0] for r in rows])
+        copied = set(v for v, in target.query(model.user_id).filter(model.user_id.in_(set(users.values())))
+                     .distinct())
+        mappings = []
+        for row in rows:
+            if row[0] not in users or users[row[0]] in copied:
+                continue
+            mapping = dict.fromkeys(names, default)
+            mapping.update(zip(present, row[1:]))
+            mapping["user_id"] = users[row[0]]
+            mappings.append(mapping)
+        if not mappings:
+            continue
+        version = bump_data_version(target)
+        if derive is not None:
+            for mapping in mappings:
+                mapping.update(derive(mapping, version))
+        target.bulk_insert_mappings(model, mappings)
+        if after is not None:
+            after(mappings, version)
+        target.commit()
+        progress.update(len(mappings))
+
+
+def merge(source_url, target_url, chunk_size=MERGE_CHUNK_SIZE, tag=None):
+    """Merge the source database into the target database, recording its users under ``tag``."""
+    upgrade(target_url)
+    target_engine = create_engine(target_url)
+    source = sessionmaker(bind=create_engine(source_url))()
+    target = sessionmaker(bind=target_engine)()
+    tag = tag or database_id(source)
+
+    merge_users(source, target, tag, chunk_size)
+    # Databases from before the one quiz migration may hold several quizzes per user.
+    latest = source.query(func.max(Personality.id_)).group_by(Personality.user_id)
+    merge_rows(source, target, tag, Personality, ["O", "C", "E", "A", "N"], chunk_size,
+               only=Personality.id_.in_(latest))
+    merge_rows(source, target, tag, GenreProf, GenreProf.genres, chunk_size, default=0,
+               derive=lambda profile, version: {"version": version})
+    # Songs come last: labelling them from the known songs adds to the merged genre profiles.
+    merge_rows(source, target, tag, Songs, ["title", "artist", "genre"], chunk_size,
+               derive=lambda song, version: {"song_key": song_key(song["title"], song["artist"])},
+               after=lambda songs, version: label_known_songs(target, [(s["song_key"], s["genre"]) for s in songs],
+                                                              version))
+    bump_data_version(target)
+    recompute(target)
+    target.commit()
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Merge one Genrenome database into another.")
+    parser.add_argument("source", help="URL of the database to copy from")
+    parser.add_argument("target", nargs="?", default=DB_URL, help="URL of the database to copy into")
+    parser.add_argument("--chunk-size", type=int, default=MERGE_CHUNK_SIZE)
+    parser.add_argument("--tag", default=None, help="Name of the source in merge_map, by default its URL")
+    args = parser.parse_args()
+    merge(args.source, args.target, args.chunk_size, args.tag)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Per-endpoint request metrics.
+
+Every request records its latency, the SQL statements it ran and the time
+spent in them, and the time spent hashing passwords. Totals and a latency
+histogram are kept per endpoint in memory, per server process. Requests
+slower than ``SLOW_REQUEST_SECONDS`` are logged with their statements.
+"""
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+
+from settings import SLOW_REQUEST_SECONDS
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class EndpointStats(object):
+    """Totals of the requests to one endpoint."""
+
+    def __init__(self):
+        """Create new instance."""
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.max_queries = 0
+        self.hashes = 0
+        self.hash_seconds = 0.0
+
+    def add(self, seconds, status, state):
+        """Count one finished request."""
+        self.requests += 1
+        if status >= 500:
+            self.errors += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[sum(1 for bound in LATENCY_BUCKETS if seconds > bound)] += 1
+        self.queries += len(state["queries"])
+        self.query_seconds += state["query_seconds"]
+        self.max_queries = max(self.max_queries, len(state["queries"]))
+        self.hashes += state["hashes"]
+        self.hash_seconds += state["hash_seconds"]
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile of latency."""
+        rank = q * self.requests
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max_seconds
+
+    def as_dict(self):
+        """Plain dict of the totals, with means and percentiles."""
+        n = float(max(self.requests, 1))
+        return {"requests": self.requests, "errors": self.errors,
+                "mean_seconds": self.seconds / n, "max_seconds": self.max_seconds,
+                "p50_seconds": self.percentile(0.5), "p95_seconds": self.percentile(0.95),
+                "p99_seconds": self.percentile(0.99),
+                "histogram": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["inf"], self.buckets)),
+                "queries": self.queries, "mean_queries": self.queries / n, "max_queries": self.max_queries,
+                "query_seconds": self.query_seconds, "hashes": self.hashes, "hash_seconds": self.hash_seconds}
+
+
+class Metrics(object):
+    """Request metrics of a Flask app and its database engine."""
+
+    def __init__(self, slow_seconds=SLOW_REQUEST_SECONDS):
+        """Create new instance."""
+        self.slow_seconds = slow_seconds
+        self.endpoints = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+        # Thread local, and greenlet local once gevent patched threading.
+        self.local = threading.local()
+        self.logger = None
+
+    def init_app(self, app, engine):
+        """Hook into the request lifecycle of ``app`` and the statements of ``engine``."""
+        self.logger = app.logger
+        app.before_request(self.begin)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    def current(self):
+        """State of the request running in this thread, or None."""
+        return getattr(self.local, "request", None)
+
+    def begin(self):
+        """Start measuring a request."""
+        self.local.request = {"start": time.perf_counter(), "queries": [], "query_seconds": 0.0,
+                              "hashes": 0, "hash_seconds": 0.0}
+
+    def end(self, endpoint, status):
+        """Stop measuring the current request and add it to its endpoint."""
+        state = self.current()
+        if state is None:
+            return
+        self.local.request = None
+        seconds = time.perf_counter() - state["start"]
+        endpoint = endpoint or "<unmatched>"
+        with self.lock:
+            if endpoint not in self.endpoints:
+                self.endpoints[endpoint] = EndpointStats()
+            self.endpoints[endpoint].add(seconds, status, state)
+        if seconds >= self.slow_seconds and self.logger is not None:
+            self.logger.warning("Slow request %s %s: %.3fs, %d queries in %.3fs, %d hashes in %.3fs\n%s",
+                                request.method, request.path, seconds, len(state["queries"]),
+                                state["query_seconds"], state["hashes"], state["hash_seconds"],
+                                "\n".join("  {:.4f}s {}".format(s, q) for q, s in state["queries"]))
+
+    def _after_request(self, response):
+        """Record a request that produced a response."""
+        self.end(request.endpoint, response.status_code)
+        return response
+
+    def _teardown_request(self, exception=None):
+        """Record a request that failed before producing a response."""
+        if self.current() is not None:
+            self.end(request.endpoint, 500)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        """Remember when a statement started."""
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        """Add a finished statement to the current request."""
+        seconds = time.perf_counter() - conn.info["query_start"].pop()
+        state = self.current()
+        if state is not None:
+            state["queries"].append((statement, seconds))
+            state["query_seconds"] += seconds
+
+    def record_hash(self, seconds):
+        """Add the time of one password hash or check to the current request."""
+        state = self.current()
+        if state is not None:
+            state["hashes"] += 1
+            state["hash_seconds"] += seconds
+
+    def snapshot(self):
+        """Totals of every endpoint, by endpoint name."""
+        with self.lock:
+            endpoints = dict((name, stats.as_dict()) for name, stats in self.endpoints.items())
+        return {"uptime_seconds": time.time() - self.started, "slow_seconds": self.slow_seconds,
+                "buckets": LATENCY_BUCKETS, "endpoints": endpoints}
+
+
+metrics = Metrics()
@@ -0,0 +1,423 @@
+"""Versioned schema migrations and an audit of the hot queries.
+
+Usage:
+    python migrate.py [--db URL] upgrade [version]
+    python migrate.py [--db URL] downgrade <version>
+    python migrate.py [--db URL] status
+    python migrate.py [--db URL] audit
+
+Applied migrations are recorded in the ``schema_migrations`` table. Every
+migration runs in its own transaction together with its record, on SQLite
+as well as Postgres, so a failed one leaves the database at the previous
+version. Databases that were never migrated start at version 0, the schema
+of the first release; since some of them were patched by hand, every step
+checks the tables, columns and indexes it touches before changing them. An
+empty database gets the current schema and is marked as fully migrated.
+Migrations that change research data bump the data version and recompute
+the running statistics in the same transaction.
+
+``audit`` runs the queries behind the busiest pages inside a transaction
+that is rolled back, prints the query plan of every statement they send
+and flags the ones that scan a whole table.
+"""
+import argparse
+import re
+import time
+from collections import OrderedDict
+
+from sqlalchemy import bindparam, create_engine, event, exists, func, inspect, select
+from sqlalchemy.orm import sessionmaker
+
+from models import (Base, User, Admin, Songs, KnownSong, Personality, GenreProf, MergeMap, DataVersion, RunningStat,
+                    SchemaMigration, bump_data_version, song_key)
+from running_stats import MOMENTS, recompute
+from settings import DB_URL
+
+
+class Migration(object):
+    """Numbered schema change that can be applied and rolled back."""
+
+    def __init__(self, version, name, upgrade, downgrade):
+        """Create new instance."""
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        self.downgrade = downgrade
+
+    def __repr__(self):
+        """Verbose object name."""
+        return "<version='%s', name='%s'>" % (self.version, self.name)
+
+
+def migration_engine(url):
+    """Engine whose transactions include DDL statements, also on SQLite."""
+    engine = create_engine(url)
+    if engine.dialect.name == "sqlite":
+        # pysqlite only opens transactions before DML statements.
+        @event.listens_for(engine, "connect")
+        def autocommit(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def begin(connection):
+            connection.execute("BEGIN")
+    return engine
+
+
+def add_column(connection, model, name):
+    """Add a column declared on ``model`` unless the table has it."""
+    table = model.__table__
+    if name not in set(c["name"] for c in inspect(connection).get_columns(table.name)):
+        column = table.c[name]
+        connection.execute("ALTER TABLE {} ADD COLUMN {} {}".format(
+            table.name, column.name, column.type.compile(connection.dialect)))
+
+
+def drop_column(connection, model, name):
+    """Drop a column if the table has it; SQLite needs version 3.35 or later."""
+    table = model.__table__
+    if name in set(c["name"] for c in inspect(connection).get_columns(table.name)):
+        connection.execute("ALTER TABLE {} DROP COLUMN {}".format(table.name, name))
+
+
+def create_index(connection, model, name):
+    """Create an index declared on ``model`` unless it exists."""
+    if name not in set(i["name"] for i in inspect(connection).get_indexes(model.__tablename__)):
+        [index] = [i for i in model.__table__.indexes if i.name == name]
+        index.create(connection)
+
+
+def drop_index(connection, model, name):
+    """Drop an index if it exists."""
+    if name in set(i["name"] for i in inspect(connection).get_indexes(model.__tablename__)):
+        connection.execute("DROP INDEX {}".format(name))
+
+
+def create_table(connection, model):
+    """Create the table of ``model`` and its indexes unless it exists."""
+    model.__table__.create(connection, checkfirst=True)
+
+
+def drop_table(connection, model):
+    """Drop the table of ``model`` if it exists."""
+    model.__table__.drop(connection, checkfirst=True)
+
+
+def song_keys_up(connection):
+    """Key songs by identity and seed the known songs from the existing annotations."""
+    add_column(connection, Songs, "song_key")
+    create_index(connection, Songs, "ix_songs_song_key")
+    create_table(connection, KnownSong)
+
+    songs = Songs.__table__
+    rows = connection.execute(select([songs.c.id_, songs.c.title, songs.c.artist, songs.c.genre])
+                              .where(songs.c.song_key.is_(None))).fetchall()
+    keys = [{"song_id": id_, "key": song_key(title, artist)} for id_, title, artist, _ in rows]
+    if keys:
+        connection.execute(songs.update().where(songs.c.id_ == bindparam("song_id"))
+                           .values(song_key=bindparam("key")), keys)
+
+    votes = {}
+    for _, title, artist, genre in rows:
+        key = song_key(title, artist)
+        if key and genre != "Unknown":
+            votes.setdefault(key, []).append(genre)
+    known = set(k for k, in connection.execute(select([KnownSong.__table__.c.key])))
+    inserts = [{"key": k, "genres": max(sorted(set(g)), key=g.count)} for k, g in votes.items() if k not in known]
+    if inserts:
+        connection.execute(KnownSong.__table__.insert(), inserts)
+
+
+def song_keys_down(connection):
+    """Drop the song keys and known songs."""
+    drop_table(connection, KnownSong)
+    drop_index(connection, Songs, "ix_songs_song_key")
+    drop_column(connection, Songs, "song_key")
+
+
+def merge_map_up(connection):
+    """Record the users merged from other databases."""
+    create_table(connection, MergeMap)
+
+
+def merge_map_down(connection):
+    """Drop the merge records."""
+    drop_table(connection, MergeMap)
+
+
+def _seed_data_version(connection):
+    """Create the single data version row, which writers only ever update."""
+    table = DataVersion.__table__
+    if connection.execute(select([table.c.id_])).first() is None:
+        connection.execute(table.insert(), {"id_": 1, "version": 0})
+
+
+def data_version_up(connection):
+    """Count writes to the research data and mark changed genre profiles."""
+    create_table(connection, DataVersion)
+    _seed_data_version(connection)
+    add_column(connection, GenreProf, "version")
+    create_index(connection, GenreProf, "ix_genre_prof_version")
+
+
+def data_version_down(connection):
+    """Drop the data version."""
+    drop_index(connection, GenreProf, "ix_genre_prof_version")
+    drop_column(connection, GenreProf, "version")
+    drop_table(connection, DataVersion)
+
+
+def _seed_running_stats(connection):
+    """Compute the running statistics from the whole dataset unless they are stored."""
+    table = RunningStat.__table__
+    if connection.execute(select([func.count(table.c.id_)])).scalar() < len(MOMENTS) + 1:
+        # A session on the migration's connection joins its transaction.
+        session = sessionmaker(bind=connection)()
+        recompute(session)
+        session.commit()
+        session.close()
+
+
+def running_stats_up(connection):
+    """Store the running correlation statistics."""
+    create_table(connection, RunningStat)
+    _seed_running_stats(connection)
+
+
+def running_stats_down(connection):
+    """Drop the running statistics."""
+    drop_table(connection, RunningStat)
+
+
+def hot_indexes_up(connection):
+    """Index the song lookups by user and by genre."""
+    create_index(connection, Songs, "ix_songs_user_id")
+    create_index(connection, Songs, "ix_songs_genre")
+
+
+def hot_indexes_down(connection):
+    """Drop the song lookup indexes."""
+    drop_index(connection, Songs, "ix_songs_user_id")
+    drop_index(connection, Songs, "ix_songs_genre")
+
+
+def _data_changed(connection):
+    """Bump the data version and recompute the running statistics after a migration changed research data."""
+    session = sessionmaker(bind=connection)()
+    bump_data_version(session)
+    recompute(session)
+    session.commit()
+    session.close()
+
+
+def one_quiz_up(connection):
+    """Keep the latest quiz of every user and allow no second one."""
+    personality = Personality.__table__
+    latest = select([func.max(personality.c.id_)]).group_by(personality.c.user_id)
+    removed = connection.execute(personality.delete().where(~personality.c.id_.in_(latest))).rowcount
+    if removed:
+        print("Deleted {} older quiz rows".format(removed))
+        _data_changed(connection)
+    create_index(connection, Personality, "ix_personality_user_id")
+
+
+def one_quiz_down(connection):
+    """Allow several quizzes per user again; deleted quiz rows are not restored."""
+    drop_index(connection, Personality, "ix_personality_user_id")
+
+
+MIGRATIONS = [
+    Migration(1, "song keys and known songs", song_keys_up, song_keys_down),
+    Migration(2, "merge map", merge_map_up, merge_map_down),
+    Migration(3, "data version", data_version_up, data_version_down),
+    Migration(4, "running statistics", running_stats_up, running_stats_down),
+    Migration(5, "song indexes by user and genre", hot_indexes_up, hot_indexes_down),
+    Migration(6, "one quiz per user", one_quiz_up, one_quiz_down),
+]
+HEAD = MIGRATIONS[-1].version
+
+# Tables of a few rows, which are read whole on purpose
+SMALL_TABLES = [DataVersion.__tablename__, RunningStat.__tablename__, SchemaMigration.__tablename__]
+
+
+def current_version(connection):
+    """Latest migration applied to the database, 0 if none."""
+    create_table(connection, SchemaMigration)
+    return connection.execute(select([func.max(SchemaMigration.__table__.c.version)])).scalar() or 0
+
+
+def _record(connection, migration):
+    """Mark a migration as applied."""
+    connection.execute(SchemaMigration.__table__.insert(), {"version": migration.version, "name": migration.name,
+                                                            "applied_at": int(time.time())})
+
+
+def upgrade(url=DB_URL, target=HEAD):
+    """Apply the migrations up to ``target``. Returns the versions applied."""
+    engine = migration_engine(url)
+    with engine.begin() as connection:
+        if "users" not in inspect(connection).get_table_names():
+            Base.metadata.create_all(connection)
+            _seed_data_version(connection)
+            _seed_running_stats(connection)
+            for migration in MIGRATIONS:
+                _record(connection, migration)
+            print("Created the schema at version {}".format(HEAD))
+            return [m.version for m in MIGRATIONS]
+        version = current_version(connection)
+
+    applied = []
+    for migration in MIGRATIONS:
+        if version < migration.version <= target:
+            with engine.begin() as connection:
+                print("Applying {} {}".format(migration.version, migration.name))
+                migration.upgrade(connection)
+                _record(connection, migration)
+            applied.append(migration.version)
+    # Databases upgraded before the migrations seeded these rows may lack them.
+    with engine.begin() as connection:
+        version = current_version(connection)
+        if version >= 3:
+            _seed_data_version(connection)
+        if version >= 4:
+            _seed_running_stats(connection)
+    return applied
+
+
+def downgrade(url, target):
+    """Roll back the migrations above ``target``. Returns the versions rolled back."""
+    engine = migration_engine(url)
+    with engine.begin() as connection:
+        version = current_version(connection)
+
+    rolled_back = []
+    for migration in reversed(MIGRATIONS):
+        if target < migration.version <= version:
+            with engine.begin() as connection:
+                print("Rolling back {} {}".format(migration.version, migration.name))
+                migration.downgrade(connection)
+                connection.execute(SchemaMigration.__table__.delete()
+                                   .where(SchemaMigration.__table__.c.version == migration.version))
+            rolled_back.append(migration.version)
+    return rolled_back
+
+
+def status(url=DB_URL):
+    """Print every migration and whether it was applied."""
+    with migration_engine(url).begin() as connection:
+        version = current_version(connection)
+    for migration in MIGRATIONS:
+        print("{} {:>3} {}".format("applied" if migration.version <= version else "pending",
+                                   migration.version, migration.name))
+
+
+def hot_paths(session):
+    """Map the busiest pages to functions running their queries."""
+    from annotation import annotation_queue, apply_annotations, backlog_size, submit_songs
+    from progress import user_progress
+    from running_stats import user_states
+
+    user_id = session.query(Songs.user_id).filter(Songs.user_id.isnot(None)).limit(1).scalar() or 1
+    username = session.query(User.username).filter(User.id_ == user_id).scalar() or ""
+
+    def annotate():
+        songs, _ = annotation_queue(session)
+        backlog_size(session)
+        apply_annotations(session, dict((s.id_, ["Rock"]) for s in songs[:5]))
+
+    return OrderedDict([
+        ("login", lambda: (session.query(User).filter(User.username == username).all(),
+                           session.query(exists().where(Admin.user_id == user_id)).scalar())),
+        ("register", lambda: session.query(exists().where(User.username == username)).scalar()),
+        ("progress", lambda: user_progress(session, user_id)),
+        ("songs page", lambda: session.query(Songs).filter(Songs.user_id == user_id).all()),
+        ("songs submit", lambda: submit_songs(session, user_id, [{"title": "Audit", "artist": "Audit"}])),
+        ("quiz submit", lambda: user_states(session, [user_id])),
+        ("annotation", annotate),
+    ])
+
+
+def query_plan(connection, statement, parameters):
+    """Query plan of a statement, as lines paired with the table they scan in full or None."""
+    cursor = connection.connection.cursor()
+    if connection.dialect.name == "sqlite":
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        lines = [(row[-1], re.match(r"SCAN (TABLE )?(\w+)$", row[-1])) for row in cursor.fetchall()]
+        plan = [(line, match.group(2) if match else None) for line, match in lines]
+    else:
+        cursor.execute("EXPLAIN " + statement, parameters)
+        lines = [(row[0], re.search(r"Seq Scan on (\w+)", row[0])) for row in cursor.fetchall()]
+        plan = [(line, match.group(1) if match else None) for line, match in lines]
+    cursor.close()
+    return plan
+
+
+def audit(url=DB_URL):
+    """Print the plans of the hot queries, flagging full table scans. Returns the number flagged."""
+    with migration_engine(url).begin() as connection:
+        version = current_version(connection)
+    if version < HEAD:
+        raise ValueError("The database is at version {}, upgrade it to {} first".format(version, HEAD))
+    engine = create_engine(url)
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = sessionmaker(bind=connection)()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(" ", 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            statements.append((statement, parameters))
+
+    flagged = 0
+    try:
+        for name, run in hot_paths(session).items():
+            statements[:] = []
+            event.listen(engine, "before_cursor_execute", capture)
+            try:
+                run()
+            finally:
+                event.remove(engine, "before_cursor_execute", capture)
+            print("== {}".format(name))
+            for statement, parameters in statements:
+                print("  {}".format(" ".join(statement.split())[:120]))
+                for line, scanned in query_plan(connection, statement, parameters):
+                    if scanned in SMALL_TABLES:
+                        scanned = None
+                    flagged += scanned is not None
+                    print("    {}{}".format(line, "  <-- full scan of " + scanned if scanned else ""))
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+    print("{} full table scans".format(flagged))
+    return flagged
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Migrate the Genrenome database schema.")
+    parser.add_argument("--db", default=DB_URL, help="Database URL")
+    commands = parser.add_subparsers(dest="command")
+    command = commands.add_parser("upgrade", help="Apply the pending migrations")
+    command.add_argument("version", type=int, nargs="?", default=HEAD)
+    command = commands.add_parser("downgrade", help="Roll back the migrations above a version")
+    command.add_argument("version", type=int)
+    commands.add_parser("status", help="List the migrations")
+    commands.add_parser("audit", help="Flag full table scans in the hot queries")
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        upgrade(args.db, args.version)
+        status(args.db)
+    elif args.command == "downgrade":
+        downgrade(args.db, args.version)
+        status(args.db)
+    elif args.command == "audit":
+        if audit(args.db):
+            raise SystemExit(1)
+    else:
+        status(args.db)
+
+
+if __name__ == "__main__":
+    main()
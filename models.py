@@ -1,13 +1,10 @@
 """Models for Hydra Classes."""
-import numpy as np
-import matplotlib.pyplot as plt
-import os
-import pdb
 from settings import DB_URL
 from sqlalchemy import create_engine, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, exists
-from passlib.hash import bcrypt
+from sqlalchemy import Column, Index, Integer, String, Text, exists
+from passwords import hash_password, verify_password
+from db import make_engine
 from sqlalchemy.orm import sessionmaker
 
 Base = declarative_base()
@@ -32,7 +29,7 @@ class User(Base):
     def __init__(self, username, password, name, email):
         """Create new instance."""
         self.username = username
-        self.password = bcrypt.encrypt(password)
+        self.password = hash_password(password)
         self.name = name
         self.email = email
         self.age = 0
@@ -40,7 +37,11 @@ class User(Base):
 
     def validate_password(self, password):
         """Check encrypted password."""
-        return bcrypt.verify(password, self.password)
+        return verify_password(password, self.password)
+
+    def set_password(self, password):
+        """Replace the encrypted password."""
+        self.password = hash_password(password)
 
     def __repr__(self):
         """Verbose object name."""
@@ -67,16 +68,29 @@ class Admin(Base):
         return "<userid='%s'>" % (self.user_id)
 
 
+def song_key(title, artist):
+    """Identity of a song that ignores case, whitespace and punctuation.
+
+    Returns None for songs without a title.
+    """
+    title = "".join(c for c in (title or "").casefold() if c.isalnum())
+    artist = "".join(c for c in (artist or "").casefold() if c.isalnum())
+    if title == "":
+        return None
+    return (artist + "|" + title)[:120]
+
+
 class Songs(Base):
     """Model prefered songs of a user."""
 
     __tablename__ = "songs"
 
     id_ = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id_"), unique=False)
+    user_id = Column(Integer, ForeignKey("users.id_"), index=True)
     title = Column(String(50))
     artist = Column(String(50))
-    genre = Column(String(50))
+    genre = Column(String(50), index=True)
+    song_key = Column(String(120), index=True)
 
     def __init__(self, user_id, title, artist):
         """Create new instance."""
@@ -84,19 +98,43 @@ class Songs(Base):
         self.title = title
         self.artist = artist
         self.genre = "Unknown"
+        self.song_key = song_key(title, artist)
 
     def __repr__(self):
         """Verbose object name."""
         return "<userid='%s', artist='%s', title='%s'>" % (self.user_id, self.artist, self.title)
 
 
+class KnownSong(Base):
+    """Model for the genres annotated for a song, shared by all its copies."""
+
+    __tablename__ = "known_songs"
+
+    id_ = Column(Integer, primary_key=True)
+    key = Column(String(120), unique=True)
+    genres = Column(String(100))
+
+    def __init__(self, key, genres):
+        """Create new instance."""
+        self.key = key
+        self.genres = ",".join(genres)
+
+    def __repr__(self):
+        """Verbose object name."""
+        return "<key='%s', genres='%s'>" % (self.key, self.genres)
+
+    def get_genres(self):
+        return self.genres.split(",")
+
+
 class Personality(Base):
     """Model for OCEAN score."""
 
     __tablename__ = "personality"
 
     id_ = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id_"))
+    # One quiz per user
+    user_id = Column(Integer, ForeignKey("users.id_"), index=True, unique=True)
     O = Column(Integer)
     C = Column(Integer)
     E = Column(Integer)
@@ -124,6 +162,8 @@ class GenreProf(Base):
 
     id_ = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id_"), unique=True)
+    # Data version of the last change to the profile
+    version = Column(Integer, index=True)
     genres = ["Blues", "Contemporary", "Country", "Electronic", "Rap", "Pop", "Reggae", "Rock", "Others"]
 
     Blues = Column(Integer)
@@ -172,9 +212,104 @@ class GenreProf(Base):
         return vector
 
 
+class MergeMap(Base):
+    """Model mapping users merged from another database to their new ids."""
+
+    __tablename__ = "merge_map"
+    __table_args__ = (Index("ix_merge_map_source_user", "source", "source_user_id", unique=True),)
+
+    id_ = Column(Integer, primary_key=True)
+    source = Column(String(200))
+    source_user_id = Column(Integer)
+    user_id = Column(Integer, ForeignKey("users.id_"))
+
+    def __init__(self, source, source_user_id, user_id):
+        """Create new instance."""
+        self.source = source
+        self.source_user_id = source_user_id
+        self.user_id = user_id
+
+    def __repr__(self):
+        """Verbose object name."""
+        return "<source='%s', source_user_id='%s', userid='%s'>" % (self.source, self.source_user_id, self.user_id)
+
+
+class DataVersion(Base):
+    """Model for a counter bumped by every write to the research data."""
+
+    __tablename__ = "data_version"
+
+    id_ = Column(Integer, primary_key=True)
+    version = Column(Integer)
+
+    def __repr__(self):
+        """Verbose object name."""
+        return "<version='%s'>" % (self.version)
+
+
+class RunningStat(Base):
+    """Model for running statistics of the research data, see running_stats.py."""
+
+    __tablename__ = "running_stats"
+
+    id_ = Column(Integer, primary_key=True)
+    name = Column(String(50), unique=True)
+    count = Column(Integer)
+    # JSON encoded means and co-moments, or counts of a contingency table
+    data = Column(Text)
+    # Data version of the last update
+    version = Column(Integer)
+
+    def __init__(self, name):
+        """Create new instance."""
+        self.name = name
+        self.count = 0
+
+    def __repr__(self):
+        """Verbose object name."""
+        return "<name='%s', count='%s'>" % (self.name, self.count)
+
+
+class SchemaMigration(Base):
+    """Model for the schema migrations applied to the database, see migrate.py."""
+
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    applied_at = Column(Integer)
+
+    def __init__(self, version, name, applied_at):
+        """Create new instance."""
+        self.version = version
+        self.name = name
+        self.applied_at = applied_at
+
+    def __repr__(self):
+        """Verbose object name."""
+        return "<version='%s', name='%s'>" % (self.version, self.name)
+
+
+def get_data_version(session):
+    """Current version of the research data."""
+    return session.query(DataVersion.version).scalar() or 0
+
+
+def bump_data_version(session):
+    """Mark the research data as changed, as part of the session's transaction.
+
+    Returns the new version. The row is created by the migrations, so
+    concurrent writers only ever update it.
+    """
+    if session.query(DataVersion).update({DataVersion.version: DataVersion.version + 1},
+                                         synchronize_session=False) == 0:
+        raise RuntimeError("The database has no data version, run python migrate.py upgrade")
+    return get_data_version(session)
+
+
 def get_debug_session(DB_URL):
     """Get a DB session for debugging."""
-    engine = create_engine(DB_URL)
+    engine = make_engine(DB_URL)
     Session = sessionmaker(bind=engine)
     session = Session()
     return session
@@ -182,9 +317,11 @@ def get_debug_session(DB_URL):
 
 def setup(DB_URL):
     """Setup."""
+    from migrate import upgrade
+
     # Create database tables
+    upgrade(DB_URL)
     engine = create_engine(DB_URL)
-    Base.metadata.create_all(engine)
     Session = sessionmaker(bind=engine)
     session = Session()
     # Add admin
@@ -198,288 +335,8 @@ def setup(DB_URL):
     return session
 
 
-def combine_users():
-    """Merge two data from two different databases into one."""
-    sess_aws = get_debug_session("sqlite:///database.db")
-    sess_preon = get_debug_session("sqlite:///preon_data.db")
-    preon_users = sess_preon.query(User).all()
-
-    print("# create users and add them temporarily")
-    new_users = []
-    map_dict = {}
-    for i, u in enumerate(preon_users):
-        map_dict[u.id_] = i
-        user = User(u.username, "pass", u.name, u.email)
-        user.age = u.age
-        user.gender = u.gender
-        new_users.append(user)
-        sess_aws.add(user)
-
-    sess_aws.flush()
-    # pdb.set_trace()
-
-    print("# Songs of all users")
-    new_songs = []
-    preon_songs = sess_preon.query(Songs).all()
-    for s in preon_songs:
-        try:
-            uid = new_users[map_dict[s.user_id]].id_
-        except KeyError:
-            continue
-        song = Songs(uid, s.title, s.artist)
-        new_songs.append(song)
-
-    print("# Personality of all users")
-    new_pers = []
-    preon_pers = sess_preon.query(Personality).all()
-    for p in preon_pers:
-        try:
-            uid = new_users[map_dict[p.user_id]].id_
-        except KeyError:
-            continue
-        pers = Personality(uid, [p.O, p.C, p.E, p.A, p.N])
-        new_pers.append(pers)
-
-    pdb.set_trace()
-
-
-def clean_data_no_personality():
-    """Delete users who did not take quiz."""
-    session = get_debug_session(DB_URL)
-    users = session.query(User).all()
-    personality = session.query(Personality).all()
-    uids_all = set([u.id_ for u in users])
-    uids_valid = set([u.user_id for u in personality])
-    uids_invalid = uids_all - uids_valid
-
-    for id_ in uids_invalid:
-        u = session.query(User).filter(User.id_ == id_).one()
-        session.delete(u)
-    session.commit()
-
-
-def clean_data_invalid_songs():
-    """Delete songs that are blank."""
-    session = get_debug_session(DB_URL)
-    songs = session.query(Songs).all()
-    for s in songs:
-        if s.title.strip() == "":
-            session.delete(s)
-    session.commit()
-
-
-def clean_data_no_songs():
-    """Delete users who did not give songs."""
-    session = get_debug_session(DB_URL)
-    users = session.query(User).all()
-    songs = session.query(Songs).all()
-    uids_all = set([u.id_ for u in users])
-    uids_valid = set([u.user_id for u in songs])
-    uids_invalid = uids_all - uids_valid
-
-    for id_ in uids_invalid:
-        u = session.query(User).filter(User.id_ == id_).one()
-        session.delete(u)
-    session.commit()
-
-
-def cluster_personalities():
-    users = session.query(Personality).all()
-    arr = np.zeros((5 ,5))
-    codes = ['O', 'C', 'E', 'A', 'N']
-    for each in users:
-        pvec = each.get_vector()
-        ids = np.argsort(pvec)
-        arr[ids[-1], ids[-2]] += 1
-        arr[ids[-2], ids[-1]] += 1
-
-    hist = []
-    labels = []
-    for i in range(5):
-        for j in range(5):
-            if i<j:
-                hist.append(arr[i,j])
-                labels.append(codes[i]+'&'+codes[j])
-
-    plt.bar(labels, hist)
-    plt.xlabel('Different combinations of 5 personality traits')
-    plt.ylabel('Frequencies')
-    plt.show()
-    pdb.set_trace()
-
-def cluster_genres():
-    users_genres = session.query(GenreProf).all()
-    genres = ["Blues", "Contemporary", "Country", "Electronic", "Rap", "Pop", "Reggae", "Rock"]
-    gvecs = []
-    for user in users_genres:
-        gvec = user.get_vector()
-        gvec = np.array(gvec)/ sum(gvec)
-        gvecs.append(gvec[:-1])  ## removing others
-    
-    gvecs = np.array(gvecs)
-    plt.bar(genres, gvecs.sum(axis=0))
-    plt.xlabel('Different genres of music identified')
-    plt.ylabel('Normalized Frequencies')
-    plt.show()
-    
-    gvecs = np.transpose(gvecs)
-    corr = np.corrcoef(gvecs)
-
-    fig, ax = plt.subplots()
-    im = ax.imshow(corr, cmap='hot', interpolation='nearest')
-    ax.set_xticks(np.arange(len(genres)))
-    ax.set_yticks(np.arange(len(genres)))
-
-    ax.set_xticklabels(genres)
-    ax.set_yticklabels(genres)
-
-    cbar = ax.figure.colorbar(im, ax=ax)
-    cbar.ax.set_ylabel('Correlation coefficients', rotation=-90, va="bottom")
-    plt.show()
-    pdb.set_trace()
-
-
-def cluster_ages():
-    users = session.query(User).all()
-    age_clusters = {'0':[], '1':[], '2':[]}
-    for user in users:
-        if user.age!=0:
-            gvec = session.query(GenreProf).filter_by(user_id = user.id_).first().get_vector()
-            gvec = np.array(gvec)/ sum(gvec)
-            if user.age <= 20:
-                age_clusters['0'].append(gvec[:-1]) 
-            elif user.age <= 30:
-                age_clusters['1'].append(gvec[:-1])
-            else:
-                age_clusters['2'].append(gvec[:-1])
-    
-    genres = ["Blues", "Contemporary", "Country", "Electronic", "Rap", "Pop", "Reggae", "Rock"]
-    cluster_codes = ['Age <= 20', '20 < Age <= 30', 'Age > 30']
-
-    for cluster in age_clusters.keys():
-        gvecs = np.array(age_clusters[cluster])
-        plt.bar(genres, gvecs.sum(axis=0)/gvecs.shape[0])
-        plt.xlabel('Different music genres')
-        plt.ylabel('Normalized Frequencies')
-        plt.title('Distribution of music genres for age group given by '+cluster_codes[int(cluster)])
-        plt.show()
-
-    pdb.set_trace()
-
-def cluster_gender():
-    users = session.query(User).all()
-    age_clusters = {'0':[], '1':[]}
-    for user in users:
-        if user.gender!='U':
-            gvec = session.query(GenreProf).filter_by(user_id = user.id_).first().get_vector()
-            gvec = np.array(gvec)/ sum(gvec)
-            if user.gender == 'M':
-                age_clusters['0'].append(gvec[:-1]) 
-            elif user.gender <= 'F':
-                age_clusters['1'].append(gvec[:-1])
-            
-    genres = ["Blues", "Contemporary", "Country", "Electronic", "Rap", "Pop", "Reggae", "Rock"]
-    cluster_codes = ['Male', 'Female']
-
-    for cluster in age_clusters.keys():
-        gvecs = np.array(age_clusters[cluster])
-        plt.bar(genres, gvecs.sum(axis=0)/gvecs.shape[0])
-        plt.xlabel('Different music genres')
-        plt.ylabel('Normalized Frequencies')
-        plt.title('Distribution of music genres for gender given by '+cluster_codes[int(cluster)])
-        plt.show()
-
-    pdb.set_trace()
-
-
-def dominant_personality_music(g1, g2):
-
-    genre_g1 = [0, 2, 5, 6]
-    genre_g2 = [3, 4, 1, 7]
-    upersonalities = session.query(Personality).all()
-    ugenre_profiles = session.query(GenreProf).all()
-    arr = np.zeros((2, 2))
-    for pvec in upersonalities:
-        user_id = pvec.user_id
-        pvec = np.array(pvec.get_vector())
-        pvec_g1 = pvec[g1].sum()
-        pvec_g2 = pvec[g2].sum()
-        if pvec_g1 > pvec_g2:
-            dom_pvec = 0
-        else:
-            dom_pvec = 1
-
-        try:
-            gvec = session.query(GenreProf).filter_by(user_id = user_id).first().get_vector()
-            gvec = np.array(gvec)
-            gvec_g1 = gvec[genre_g1].sum()
-            gvec_g2 = gvec[genre_g2].sum()
-            if gvec_g1 > gvec_g2:
-                dom_gvec = 0
-            else:
-                dom_gvec = 1
-            
-            arr[dom_pvec, dom_gvec] += 1
-        except:
-            continue
-
-    from scipy.stats import chi2_contingency
-    chi2, pvalue, _, _ = chi2_contingency(arr)
-    #pdb.set_trace()
-    return pvalue
-
-def corr_personality_genre():
-    codes = {'0_1':0, '0_2':1, '0_3':2, '0_4':3, '1_2':4, '1_3':5, '1_4':6, '2_3':7, '2_4':8, '3_4':9} 
-    upersonalities = session.query(Personality).all()
-    ugenre_profiles = session.query(GenreProf).all()
-    arr = np.zeros((10, 8))
-    for pvec in upersonalities:
-        user_id = pvec.user_id
-        pvec = np.array(pvec.get_vector())
-        ids = np.argsort(pvec)
-        id1, id2 = ids[-1], ids[-2]
-        if id1>id2:
-            code = '{}_{}'.format(id2, id1)
-        else:
-            code = '{}_{}'.format(id1, id2)
-
-        try:
-            gvec = session.query(GenreProf).filter_by(user_id = user_id).first().get_vector()
-            gvec = np.array(gvec)
-            arr[codes[code]] += gvec[:-1]
-        except:
-            continue
-    pdb.set_trace()
-    from scipy.stats import chi2_contingency
-    chi2, pvalue, _, _ = chi2_contingency(arr)
-    #pdb.set_trace()
-    return pvalue
-
-    
-    
-
-
 if __name__ == "__main__":
     # session = setup(DB_URL)
     session = get_debug_session(DB_URL)
-    
-    corr_personality_genre()
-
-    #p = dominant_personality_music([0, 1, 2], [3, 4]) # 0.1774461657461066
-    #print (p)
-    #p = dominant_personality_music([0, 1, 3], [2, 4]) ##invalid
-    #print (p)
-    #p = dominant_personality_music([0, 1, 4], [2, 3]) ## pvalue: 0.7031687608980215
-    #print (p)
-    #p = dominant_personality_music([0, 2, 4], [1, 3])  ## pvalue: 0.6615391927567419
-    #print (p)
-
-    # cluster_personalities()
-    # cluster_genres()
-    # cluster_ages()
-    # cluster_gender() 
-
-    # combine_users()
-    # clean_data_invalid_songs()
-    # clean_data_no_songs()
-    pdb.set_trace()
+    # Plots and tests of the data: python -m analytics.explore
+    # Schema upgrades of an existing database: python migrate.py upgrade
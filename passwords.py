@@ -0,0 +1,66 @@
+"""Password hashing on a bounded worker pool.
+
+bcrypt is CPU bound and releases the GIL, so hashes run on worker threads.
+Requests served by gevent greenlets wait on a gevent thread pool, which lets
+the event loop keep serving other requests in the meantime.
+"""
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.hash import bcrypt
+
+from metrics import metrics
+from settings import BCRYPT_ROUNDS, HASH_WORKERS
+
+hasher = bcrypt.using(rounds=BCRYPT_ROUNDS)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _run(func, *args):
+    """Run ``func`` on the hashing pool and wait for its result."""
+    start = time.perf_counter()
+    try:
+        return _submit(func, *args)
+    finally:
+        metrics.record_hash(time.perf_counter() - start)
+
+
+def _pool(kind):
+    """Pool of a kind of worker, created on first use."""
+    if kind not in _pools:
+        with _pools_lock:
+            if kind not in _pools:
+                if kind == "gevent":
+                    from gevent.threadpool import ThreadPool
+                    _pools[kind] = ThreadPool(HASH_WORKERS)
+                else:
+                    _pools[kind] = ThreadPoolExecutor(max_workers=HASH_WORKERS)
+    return _pools[kind]
+
+
+def _submit(func, *args):
+    """Run ``func`` on the pool of the current kind of worker."""
+    # Only a process that imported gevent can be running greenlets.
+    gevent = sys.modules.get("gevent")
+    if gevent is not None and isinstance(gevent.getcurrent(), gevent.Greenlet):
+        return _pool("gevent").apply(func, args)
+    return _pool("threads").submit(func, *args).result()
+
+
+def hash_password(password):
+    """Hash a password with the configured bcrypt cost."""
+    return _run(hasher.hash, password)
+
+
+def verify_password(password, hashed):
+    """Check a password against its stored hash."""
+    return _run(hasher.verify, password, hashed)
+
+
+def needs_rehash(hashed):
+    """Check whether a stored hash was made with a different bcrypt cost."""
+    return hasher.needs_update(hashed)
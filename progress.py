@@ -0,0 +1,35 @@
+"""Progress of a user through the quiz and song tasks."""
+from sqlalchemy import exists, func
+
+from models import Songs, Personality
+
+# Key of the cached quiz completion in the Flask session
+PROGRESS_KEY = "quiz_taken"
+
+
+def user_progress(db_session, user_id):
+    """Check quiz completion and count songs of a user in one query."""
+    taken = exists().where(Personality.user_id == user_id)
+    songs = db_session.query(func.count(Songs.id_)).filter(Songs.user_id == user_id).as_scalar()
+    taken, songs = db_session.query(taken, songs).one()
+    return {"personality": bool(taken), "songs": songs}
+
+
+def get_progress(store, db_session, user_id):
+    """Return the progress of a user in one query, remembering a taken quiz in their session ``store``.
+
+    A quiz cannot be taken back, but songs may be added from any of the
+    user's sessions, so they are counted on every call.
+    """
+    if store.get(PROGRESS_KEY):
+        songs = db_session.query(func.count(Songs.id_)).filter(Songs.user_id == user_id).scalar()
+        return {"personality": True, "songs": songs}
+    progress = user_progress(db_session, user_id)
+    if progress["personality"]:
+        store[PROGRESS_KEY] = True
+    return progress
+
+
+def invalidate_progress(store):
+    """Drop the cached progress after the user submitted something."""
+    store.pop(PROGRESS_KEY, None)
@@ -1,15 +1,42 @@
 """Quiz."""
 
+TRAITS = ["O", "C", "E", "A", "N"]
+N_QUESTIONS = 50
+MIN_ANSWER, MAX_ANSWER = 1, 5
+
+# Scoring key of the IPIP Big-Five questionnaire: trait scored by every
+# question and whether agreeing raises (+1) or lowers (-1) it.
+KEY = {
+    1: ("E", 1), 2: ("A", -1), 3: ("C", 1), 4: ("N", -1), 5: ("O", 1),
+    6: ("E", -1), 7: ("A", 1), 8: ("C", -1), 9: ("N", 1), 10: ("O", -1),
+    11: ("E", 1), 12: ("A", -1), 13: ("C", 1), 14: ("N", -1), 15: ("O", 1),
+    16: ("E", -1), 17: ("A", 1), 18: ("C", -1), 19: ("N", 1), 20: ("O", -1),
+    21: ("E", 1), 22: ("A", -1), 23: ("C", 1), 24: ("N", -1), 25: ("O", 1),
+    26: ("E", -1), 27: ("A", 1), 28: ("C", -1), 29: ("N", -1), 30: ("O", -1),
+    31: ("E", 1), 32: ("A", -1), 33: ("C", 1), 34: ("N", -1), 35: ("O", 1),
+    36: ("E", -1), 37: ("A", 1), 38: ("C", -1), 39: ("N", -1), 40: ("O", 1),
+    41: ("E", 1), 42: ("A", 1), 43: ("C", 1), 44: ("N", -1), 45: ("O", 1),
+    46: ("E", -1), 47: ("A", 1), 48: ("C", 1), 49: ("N", -1), 50: ("O", 1),
+}
+
+# Weight of every answer in the score of every trait, one row per question
+WEIGHTS = [[KEY[q][1] if KEY[q][0] == trait else 0 for trait in TRAITS] for q in range(1, N_QUESTIONS + 1)]
+
+# Score of every trait when all its answers are zero
+OFFSETS = [8, 14, 20, 14, 38]
+
 
 def score_quiz(score):
     """Score the quiz based on answers."""
-    O = 8 + score[5] - score[10] + score[15] - score[20] + score[25] - score[30] + score[35] + score[40] + score[45] + score[50]
-    C = 14 + score[3] - score[8] + score[13] - score[18] + score[23] - score[28] + score[33] - score[38] + score[43] + score[48]
-    E = 20 + score[1] - score[6] + score[11] - score[16] + score[21] - score[26] + score[31] - score[36] + score[41] - score[46]
-    A = 14 - score[2] + score[7] - score[12] + score[17] - score[22] + score[27] - score[32] + score[37] + score[42] + score[47]
-    N = 38 - score[4] + score[9] - score[14] + score[19] - score[24] - score[29] - score[34] - score[39] - score[44] - score[49]
-
-    return [O, C, E, A, N]
+    answers = [score[q] for q in range(1, N_QUESTIONS + 1)]
+    invalid = [str(q) for q, a in enumerate(answers, 1) if a not in range(MIN_ANSWER, MAX_ANSWER + 1)]
+    if invalid:
+        raise ValueError("answers out of range for questions {}".format(", ".join(invalid)))
+    totals = list(OFFSETS)
+    for answer, weights in zip(answers, WEIGHTS):
+        for i, weight in enumerate(weights):
+            totals[i] += weight * answer
+    return [int(t) for t in totals]
 
 quiz = {
             1: "I am the life of the party.",
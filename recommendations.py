@@ -0,0 +1,174 @@
+"""Genres listened to by the users with the most similar personality.
+
+Every worker keeps a KD-tree over the standardized OCEAN scores of the
+users who took the quiz, next to their normalized genre profiles. The index
+is built on the first request, so workers that never serve one do not
+import numpy or scipy.
+
+Before a query the index catches up with the database when the data
+version changed: users with a new quiz are added to a small buffer that is
+searched by brute force, and only the genre profiles marked with a newer
+version are reloaded. The tree is rebuilt once the buffer outgrows
+``NEIGHBOUR_BUFFER_FRACTION`` of it, so adding a respondent never waits for
+a full rebuild. The arrays behind the index grow geometrically, so additions
+take amortized constant time.
+
+Quizzes are only ever added by users, so when fewer quiz rows remain than
+were indexed plus added, users were cleaned or merged away and the whole
+index is built again.
+"""
+import threading
+
+from sqlalchemy import func
+
+from db import chunks
+from models import GenreProf, Personality, get_data_version
+from settings import NEIGHBOURS, MAX_NEIGHBOURS, NEIGHBOUR_BUFFER_FRACTION
+
+
+class NeighbourIndex(object):
+    """KD-tree of personality vectors with a brute-force buffer of recent additions."""
+
+    def __init__(self):
+        """Create new instance."""
+        self.lock = threading.Lock()
+        self.version = None
+        self.max_personality_id = 0
+        self.quizzes = 0
+        self.tree = None
+        self.size = 0
+
+    @property
+    def points(self):
+        """Standardized OCEAN scores, one row per indexed user."""
+        return self._points[:self.size]
+
+    @property
+    def genres(self):
+        """Normalized genre profiles without Others, one row per indexed user."""
+        return self._genres[:self.size]
+
+    @property
+    def user_id(self):
+        """User id of every row."""
+        return self._user_id[:self.size]
+
+    def _append(self, points, genres, user_id):
+        """Add rows, doubling the capacity of the arrays when they are full."""
+        import numpy as np
+
+        size = self.size + len(points)
+        if size > len(self._points):
+            capacity = max(size, 2 * len(self._points), 16)
+            for name in ["_points", "_genres", "_user_id"]:
+                old = getattr(self, name)
+                new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:self.size] = old[:self.size]
+                setattr(self, name, new)
+        self._points[self.size:size] = points
+        self._genres[self.size:size] = genres
+        self._user_id[self.size:size] = user_id
+        self.size = size
+
+    def build(self, session):
+        """Index every user who took the quiz."""
+        import numpy as np
+        from analytics.dataset import load_dataset
+
+        version = get_data_version(session)
+        max_personality_id, quizzes = session.query(func.max(Personality.id_), func.count(Personality.id_)).one()
+        data = load_dataset(session)
+        data = data.subset(data.has_traits)
+        traits = data.traits.astype(float)
+        self.mean = traits.mean(axis=0) if len(data) else np.zeros(traits.shape[1])
+        self.scale = traits.std(axis=0) if len(data) else np.ones(traits.shape[1])
+        self.scale[self.scale == 0] = 1
+        self._points = (traits - self.mean) / self.scale
+        self._genres = data.normalized_genres()
+        self._user_id = np.asarray(data.user_id)
+        self.size = len(data)
+        self.rows = dict((int(u), i) for i, u in enumerate(self.user_id))
+        self._rebuild()
+        self.version = version
+        self.max_personality_id = max_personality_id or 0
+        self.quizzes = quizzes
+
+    def _rebuild(self):
+        """Put every point in the tree and empty the buffer."""
+        from scipy.spatial import cKDTree
+        self.tree = cKDTree(self.points) if len(self.points) else None
+        self.in_tree = len(self.points)
+
+    def update(self, session):
+        """Catch up with the changes since the index was built or last updated."""
+        import numpy as np
+        from analytics.dataset import dataset_query, _from_rows
+
+        version = get_data_version(session)
+        if version == self.version:
+            return
+        max_personality_id, quizzes = session.query(func.max(Personality.id_), func.count(Personality.id_)).one()
+        quiz_users = [u for u, in session.query(Personality.user_id)
+                      .filter(Personality.id_ > self.max_personality_id)]
+        if quizzes < self.quizzes + len(quiz_users):
+            self.build(session)
+            return
+        new_users = sorted(set(quiz_users))
+        rows = []
+        for ids in chunks(new_users):
+            rows.extend(dataset_query(session, ids).all())
+        added = _from_rows(rows)
+        added = added.subset(added.has_traits & np.array([int(u) not in self.rows for u in added.user_id], dtype=bool))
+        if len(added):
+            self.rows.update((int(u), self.size + i) for i, u in enumerate(added.user_id))
+            self._append((added.traits - self.mean) / self.scale, added.normalized_genres(), added.user_id)
+
+        changed = session.query(GenreProf.user_id, *[getattr(GenreProf, g) for g in GenreProf.genres]) \
+            .filter(GenreProf.version > (self.version or 0))
+        for row in changed:
+            if row[0] in self.rows:
+                counts = np.array(row[1:-1], dtype=float)
+                total = counts.sum() + (row[-1] or 0)
+                self.genres[self.rows[row[0]]] = counts / total if total else 0
+
+        if len(self.points) - self.in_tree > max(NEIGHBOUR_BUFFER_FRACTION * self.in_tree, 100):
+            self._rebuild()
+        self.version = version
+        self.max_personality_id = max_personality_id or 0
+        self.quizzes = quizzes
+
+    def neighbours(self, user_id, k):
+        """Rows of the ``k`` users closest to ``user_id``, excluding the user."""
+        import numpy as np
+
+        row = self.rows[user_id]
+        point = self.points[row]
+        candidates = []
+        if self.tree is not None:
+            distances, rows = self.tree.query(point, k=min(k + 1, self.in_tree))
+            candidates.extend(zip(np.atleast_1d(distances), np.atleast_1d(rows)))
+        if len(self.points) > self.in_tree:
+            buffer = self.points[self.in_tree:]
+            distances = np.sqrt(((buffer - point) ** 2).sum(axis=1))
+            candidates.extend(zip(distances, np.arange(self.in_tree, len(self.points))))
+        candidates.sort()
+        return [int(r) for _, r in candidates if r != row][:k]
+
+    def recommend(self, session, user_id, k=NEIGHBOURS):
+        """Mean genre profile of the ``k`` nearest neighbours of a user, or None without a quiz."""
+        with self.lock:
+            if self.version is None:
+                self.build(session)
+            else:
+                self.update(session)
+            if user_id not in self.rows:
+                return None
+            rows = self.neighbours(user_id, max(1, min(k, MAX_NEIGHBOURS)))
+            genres = self.genres[rows]
+        with_genres = genres.sum(axis=1) > 0
+        mean = genres[with_genres].mean(axis=0) if with_genres.any() else genres.sum(axis=0)
+        return {"neighbours": len(rows), "with_genres": int(with_genres.sum()),
+                "genres": dict(zip(GenreProf.genres[:-1], [float(v) for v in mean]))}
+
+
+index = NeighbourIndex()
@@ -0,0 +1,283 @@
+"""Running correlation statistics of the research data.
+
+Usage:
+    python running_stats.py [--check] [--db URL]
+
+The correlation and contingency analyses are computed from a few sums over
+every user. Those sums are kept in the ``running_stats`` table and updated
+with Welford's method whenever a quiz is taken or songs are labelled: the
+user's old values are removed from every statistic and the new ones added,
+in constant time per changed user.
+
+- ``traits``: OCEAN scores of the users who took the quiz.
+- ``genres``: normalized genre profiles, without Others, of users with a profile.
+- ``traits_genres``: both side by side, for users with a quiz and a profile.
+- ``pair_genres``: genre counts, without Others, per top-two trait pair.
+
+The command recomputes the statistics from the whole dataset, reports how
+far the stored ones drifted and replaces them, or only reports with
+``--check``. The migrations compute them when they are missing, and updates
+are skipped until then.
+"""
+import argparse
+import json
+import math
+
+from sqlalchemy import func
+
+from db import chunks
+from models import GenreProf, Personality, RunningStat, get_data_version, get_debug_session
+from settings import DB_URL
+
+TRAITS = ["O", "C", "E", "A", "N"]
+GENRES = GenreProf.genres[:-1]
+# Unordered trait pairs, in the order of analytics.measures.TRAIT_PAIRS
+TRAIT_PAIRS = [(i, j) for i in range(len(TRAITS)) for j in range(len(TRAITS)) if i < j]
+MOMENTS = {"traits": TRAITS, "genres": GENRES, "traits_genres": TRAITS + GENRES}
+CONTINGENCY = "pair_genres"
+
+
+class Moments(object):
+    """Count, mean and co-moment matrix of a set of vectors that can grow and shrink."""
+
+    def __init__(self, size, count=0, mean=None, comoment=None):
+        """Create new instance."""
+        self.count = count
+        self.mean = mean or [0.0] * size
+        self.comoment = comoment or [[0.0] * size for _ in range(size)]
+
+    def __repr__(self):
+        """Verbose object name."""
+        return "<count='%s', size='%s'>" % (self.count, len(self.mean))
+
+    def add(self, x):
+        """Add a vector."""
+        self.count += 1
+        before = [v - m for v, m in zip(x, self.mean)]
+        self.mean = [m + d / self.count for m, d in zip(self.mean, before)]
+        after = [v - m for v, m in zip(x, self.mean)]
+        for row, b in zip(self.comoment, before):
+            for j, a in enumerate(after):
+                row[j] += b * a
+
+    def remove(self, x):
+        """Remove a vector that was added before."""
+        if self.count <= 1:
+            self.__init__(len(self.mean))
+            return
+        before = [v - m for v, m in zip(x, self.mean)]
+        self.count -= 1
+        self.mean = [m - d / self.count for m, d in zip(self.mean, before)]
+        after = [v - m for v, m in zip(x, self.mean)]
+        for row, a in zip(self.comoment, after):
+            for j, b in enumerate(before):
+                row[j] -= a * b
+
+    def correlation(self):
+        """Pearson correlation matrix, with None for constant columns."""
+        std = [math.sqrt(max(self.comoment[i][i], 0)) for i in range(len(self.mean))]
+        return [[c / (std[i] * std[j]) if std[i] > 0 and std[j] > 0 else None for j, c in enumerate(row)]
+                for i, row in enumerate(self.comoment)]
+
+
+def pair_code(traits):
+    """Index in ``TRAIT_PAIRS`` of the two highest traits, breaking ties like a stable sort."""
+    order = sorted(range(len(traits)), key=lambda i: traits[i])
+    return TRAIT_PAIRS.index(tuple(sorted(order[-2:])))
+
+
+def observations(traits, genres):
+    """Values a user adds to every statistic, given their latest quiz and genre counts or None."""
+    values = {}
+    if traits is not None:
+        values["traits"] = [float(t) for t in traits]
+    if genres is not None:
+        total = float(sum(genres))
+        values["genres"] = [g / total if total else 0.0 for g in genres[:-1]]
+    if traits is not None and genres is not None:
+        values["traits_genres"] = values["traits"] + values["genres"]
+        values[CONTINGENCY] = (pair_code(traits), genres[:-1])
+    return values
+
+
+def user_states(session, user_ids):
+    """Map user ids to their ``(traits, genres)``: latest quiz and genre counts, or None."""
+    user_ids = list(user_ids)
+    states = dict((uid, (None, None)) for uid in user_ids)
+    trait_columns = [getattr(Personality, t) for t in TRAITS]
+    genre_columns = [getattr(GenreProf, g) for g in GenreProf.genres]
+    for ids in chunks(user_ids):
+        latest = session.query(func.max(Personality.id_)).filter(Personality.user_id.in_(ids)) \
+            .group_by(Personality.user_id)
+        for row in session.query(Personality.user_id, *trait_columns).filter(Personality.id_.in_(latest)):
+            if None not in row:
+                states[row[0]] = (list(row[1:]), None)
+        for row in session.query(GenreProf.user_id, *genre_columns).filter(GenreProf.user_id.in_(ids)):
+            if None not in row:
+                states[row[0]] = (states[row[0]][0], list(row[1:]))
+    return states
+
+
+def _load(row):
+    """Statistic stored in a row."""
+    data = json.loads(row.data)
+    if row.name == CONTINGENCY:
+        return data["table"]
+    return Moments(len(MOMENTS[row.name]), row.count, data["mean"], data["comoment"])
+
+
+def _store(row, stat, count, version):
+    """Write a statistic to its row."""
+    row.count = count
+    if row.name == CONTINGENCY:
+        row.data = json.dumps({"table": stat})
+    else:
+        row.data = json.dumps({"mean": stat.mean, "comoment": stat.comoment})
+    row.version = version
+
+
+def record_changes(session, changes, version):
+    """Update the statistics with changed users, as part of the session's transaction.
+
+    ``changes`` is a list of ``(old, new)`` pairs of ``(traits, genres)``
+    states of a user before and after the change. Call it after
+    ``bump_data_version``, which makes concurrent writers wait for the
+    transaction.
+    """
+    rows = dict((r.name, r) for r in session.query(RunningStat).with_for_update())
+    if len(rows) < len(MOMENTS) + 1:
+        return
+    stats = dict((name, _load(row)) for name, row in rows.items())
+    pairs = rows[CONTINGENCY].count
+    for old, new in changes:
+        for name, value in observations(*old).items():
+            if name == CONTINGENCY:
+                code, genres = value
+                stats[name][code] = [t - g for t, g in zip(stats[name][code], genres)]
+                pairs -= 1
+            else:
+                stats[name].remove(value)
+        for name, value in observations(*new).items():
+            if name == CONTINGENCY:
+                code, genres = value
+                stats[name][code] = [t + g for t, g in zip(stats[name][code], genres)]
+                pairs += 1
+            else:
+                stats[name].add(value)
+    for name, row in rows.items():
+        _store(row, stats[name], pairs if name == CONTINGENCY else stats[name].count, version)
+
+
+def load_stats(session):
+    """Stored statistics by name with their count and version, or None before the first recompute."""
+    rows = session.query(RunningStat).all()
+    if len(rows) < len(MOMENTS) + 1:
+        return None
+    return dict((r.name, {"stat": _load(r), "count": r.count, "version": r.version}) for r in rows)
+
+
+def summary(session):
+    """Means, correlations and the trait pair contingency table for the admin dashboard."""
+    stats = load_stats(session)
+    if stats is None:
+        return None
+    traits_genres = stats["traits_genres"]["stat"].correlation()
+    table = stats[CONTINGENCY]["stat"]
+    chi2, dof = chi2_statistic(table)
+    return {"traits": stats["traits"], "genres": stats["genres"], "traits_genres": stats["traits_genres"],
+            "trait_labels": TRAITS, "genre_labels": GENRES,
+            "trait_corr": stats["traits"]["stat"].correlation(),
+            "genre_corr": stats["genres"]["stat"].correlation(),
+            "trait_genre_corr": [row[len(TRAITS):] for row in traits_genres[:len(TRAITS)]],
+            "pairs": [(TRAITS[i] + "&" + TRAITS[j], row) for (i, j), row in zip(TRAIT_PAIRS, table)],
+            "pair_count": stats[CONTINGENCY]["count"], "chi2": chi2, "dof": dof}
+
+
+def chi2_statistic(table):
+    """Chi-squared statistic and degrees of freedom of a table, without empty rows and columns."""
+    table = [row for row in table if sum(row) > 0]
+    columns = [j for j in range(len(table[0]) if table else 0) if sum(row[j] for row in table) > 0]
+    table = [[row[j] for j in columns] for row in table]
+    total = float(sum(sum(row) for row in table))
+    if not total:
+        return 0.0, 0
+    column_sums = [sum(row[j] for row in table) for j in range(len(columns))]
+    chi2 = 0.0
+    for row in table:
+        row_sum = sum(row)
+        for observed, column_sum in zip(row, column_sums):
+            expected = row_sum * column_sum / total
+            chi2 += (observed - expected) ** 2 / expected
+    return chi2, (len(table) - 1) * (len(columns) - 1)
+
+
+def exact_stats(session):
+    """Statistics computed from the whole dataset, with their counts."""
+    import numpy as np
+    from analytics.dataset import load_dataset
+    from analytics.measures import pair_genre_table
+
+    data = load_dataset(session)
+    traits = data.traits[data.has_traits].astype(float)
+    genres = data.subset(data.has_genres).normalized_genres()
+    complete = data.complete()
+    values = {"traits": traits, "genres": genres,
+              "traits_genres": np.hstack([complete.traits.astype(float), complete.normalized_genres()])}
+    stats = {}
+    for name, x in values.items():
+        mean = x.mean(axis=0) if len(x) else np.zeros(x.shape[1])
+        centered = x - mean
+        stats[name] = (Moments(x.shape[1], len(x), mean.tolist(), (centered.T @ centered).tolist()), len(x))
+    table = pair_genre_table(complete.traits, complete.genres[:, :-1]).astype(int).tolist()
+    stats[CONTINGENCY] = (table, len(complete))
+    return stats
+
+
+def _difference(a, b):
+    """Largest absolute difference between two statistics."""
+    if isinstance(a, Moments):
+        return max([abs(x - y) for x, y in zip(a.mean, b.mean)] +
+                   [abs(x - y) for ra, rb in zip(a.comoment, b.comoment) for x, y in zip(ra, rb)])
+    return max(abs(x - y) for ra, rb in zip(a, b) for x, y in zip(ra, rb))
+
+
+def recompute(session, check=False):
+    """Compare the stored statistics with exact ones, then store the exact ones unless ``check``.
+
+    Returns ``{name: (stored count, exact count, largest difference)}``,
+    with None for statistics that were not stored yet. Does not commit.
+    """
+    RunningStat.__table__.create(session.connection(), checkfirst=True)
+    rows = dict((r.name, r) for r in session.query(RunningStat).with_for_update())
+    version = get_data_version(session)
+    report = {}
+    for name, (stat, count) in exact_stats(session).items():
+        row = rows.get(name)
+        report[name] = (row.count, count, _difference(_load(row), stat)) if row and row.data else (None, count, None)
+        if not check:
+            if row is None:
+                row = RunningStat(name)
+                session.add(row)
+            _store(row, stat, count, version)
+    return report
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Recompute the running statistics of the Genrenome data.")
+    parser.add_argument("--check", action="store_true", help="Only report the drift of the stored statistics")
+    parser.add_argument("--db", default=DB_URL, help="Database URL")
+    args = parser.parse_args()
+
+    session = get_debug_session(args.db)
+    report = recompute(session, args.check)
+    session.commit()
+    for name, (stored, exact, difference) in sorted(report.items()):
+        if stored is None:
+            print("{}: {} users, not stored before".format(name, exact))
+        else:
+            print("{}: {} users stored, {} exact, largest difference {:.3g}".format(name, stored, exact, difference))
+
+
+if __name__ == "__main__":
+    main()
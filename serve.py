@@ -0,0 +1,42 @@
+"""Production entry point.
+
+Usage:
+    python serve.py [--server gevent|threaded] <host address> <port>
+
+The gevent server monkey patches the standard library before the app is
+imported, so every request runs in its own greenlet with its own database
+session.
+"""
+import argparse
+
+from settings import SERVER
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Run the Genrenome server.")
+    parser.add_argument("host", help="Host address to listen on")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--server", choices=["gevent", "threaded"], default=SERVER)
+    args = parser.parse_args()
+
+    if args.server == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+        from gevent.pywsgi import WSGIServer
+        from app import app
+        server = WSGIServer((args.host, args.port), app)
+    else:
+        from werkzeug.serving import make_server
+        from app import app
+        server = make_server(args.host, args.port, app, threaded=True)
+
+    print("Server running on http://{}:{}".format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Exiting server")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
 """Settings file."""
+import os
+
+# Directory of this repository, which relative paths below are resolved against
+ROOT = os.path.dirname(os.path.abspath(__file__))
 
 # Heroku run on Postgres
 # import os
@@ -9,3 +13,51 @@
 DB_URL = 'sqlite:///database.db'
 # DB_URL = 'sqlite:///preon_data.db'
 Key = "sgjngfdfg//23/=+342][234097824-1<><123><!@#$#%^]"
+
+# Number of songs shown per page of the annotation queue
+ANNOTATE_PAGE_SIZE = 50
+
+# bcrypt cost of stored passwords, older hashes are upgraded at login
+BCRYPT_ROUNDS = 12
+# Number of threads hashing passwords concurrently
+HASH_WORKERS = 4
+
+# Server started by serve.py, "gevent" or "threaded"
+SERVER = "gevent"
+
+# Database connection pool
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 20
+# Seconds to wait for a free connection
+DB_POOL_TIMEOUT = 30
+# Seconds after which a connection is replaced
+DB_POOL_RECYCLE = 1800
+# Milliseconds SQLite waits on a locked database before failing
+SQLITE_BUSY_TIMEOUT = 5000
+
+# On-disk cache of analysis results and its size limit in bytes
+ANALYTICS_CACHE_DIR = os.path.join(ROOT, ".cache", "analytics")
+ANALYTICS_CACHE_BYTES = 256 * 1024 * 1024
+
+# Requests slower than this many seconds are logged with their SQL statements
+SLOW_REQUEST_SECONDS = 0.5
+
+# Directory of the memory-mapped snapshot of the research dataset
+SNAPSHOT_DIR = os.path.join(ROOT, ".cache", "snapshot")
+
+# Directory of the saved k-means cluster assignments
+CLUSTER_DIR = os.path.join(ROOT, ".cache", "clusters")
+
+# Number of personality neighbours whose genres are recommended, and the most a request may ask for
+NEIGHBOURS = 25
+MAX_NEIGHBOURS = 200
+# Share of the indexed users that may be added before the KD-tree is rebuilt
+NEIGHBOUR_BUFFER_FRACTION = 0.1
+
+# Seconds browsers may cache fingerprinted static assets
+ASSET_MAX_AGE = 365 * 24 * 3600
+# Largest width or height in pixels of images built by assets.py
+ASSET_MAX_IMAGE_SIZE = 600
+
+# Number of rendered template fragments kept by the fragment cache
+FRAGMENT_CACHE_SIZE = 256
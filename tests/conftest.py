@@ -0,0 +1,79 @@
+"""Shared fixtures: a migrated SQLite database in a temporary directory."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import passwords  # noqa: E402
+from migrate import upgrade  # noqa: E402
+from models import GenreProf, Personality, Songs, User, get_debug_session  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fast_hashing(monkeypatch):
+    """Hash passwords with the lowest bcrypt cost."""
+    monkeypatch.setattr(passwords, "hasher", passwords.bcrypt.using(rounds=4))
+
+
+@pytest.fixture(autouse=True)
+def result_cache(tmp_path, monkeypatch):
+    """Keep cached analysis results in the test's temporary directory."""
+    from analytics import cache
+
+    result_cache = cache.ResultCache(str(tmp_path / "cache"), max_bytes=10 ** 7)
+    monkeypatch.setattr(cache, "cache", result_cache)
+    return result_cache
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    """URL of an empty database migrated to the latest version."""
+    url = "sqlite:///" + str(tmp_path / "genrenome.db")
+    upgrade(url)
+    return url
+
+
+@pytest.fixture
+def session(db_url):
+    """Session on the test database."""
+    session = get_debug_session(db_url)
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_user(session):
+    """Add a user with an optional quiz, genre counts and songs. Returns the user id."""
+    def make(username, traits=None, genres=None, songs=()):
+        user = User(username, "secret", username, username + "@test")
+        session.add(user)
+        session.flush()
+        if traits is not None:
+            session.add(Personality(user.id_, traits))
+        if genres is not None:
+            profile = GenreProf(user.id_)
+            profile.add_genre(**genres)
+            session.add(profile)
+        for title, artist in songs:
+            session.add(Songs(user.id_, title, artist))
+        session.commit()
+        return user.id_
+    return make
+
+
+@pytest.fixture(scope="session")
+def flask_app(tmp_path_factory):
+    """The web app, bound to a migrated database of its own."""
+    import settings
+
+    assert "app" not in sys.modules, "the app binds its database when it is imported"
+    url = "sqlite:///" + str(tmp_path_factory.mktemp("app") / "app.db")
+    upgrade(url)
+    settings.DB_URL = url
+    from app import app
+    app.config["TESTING"] = True
+    return app
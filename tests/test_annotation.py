@@ -0,0 +1,94 @@
+"""Tests of annotation.py."""
+from annotation import annotation_queue, apply_annotations, backlog_size, parse_annotations, submit_songs
+from models import GenreProf, KnownSong, Songs, get_data_version, song_key
+
+
+def _genres(session, user_id):
+    """Genre counts of a user by genre name."""
+    profile = session.query(GenreProf).filter(GenreProf.user_id == user_id).one()
+    return dict(zip(GenreProf.genres, profile.get_vector()))
+
+
+def test_parse_annotations_skips_unknown_slots():
+    form = {"3_1": "Rock", "3_2": "Unknown", "5_1": "Pop", "5_2": "Rap", "7_1": "Unknown", "8_1": "Polka"}
+    assert parse_annotations(form) == {3: ["Rock"], 5: ["Pop", "Rap"]}
+
+
+def test_apply_annotations_labels_songs_and_profiles(session, make_user):
+    alice = make_user("alice", songs=[("Song A", "Artist A"), ("Song B", "Artist B")])
+    bob = make_user("bob", genres={"Rock": 2}, songs=[("Song C", "Artist C")])
+    version = get_data_version(session)
+    a, b, c = [s.id_ for s in session.query(Songs).order_by(Songs.id_)]
+
+    assert apply_annotations(session, {a: ["Pop", "Rap"], b: ["Rock"], c: ["Rock"]}) == 3
+
+    assert dict(session.query(Songs.id_, Songs.genre)) == {a: "Rap", b: "Rock", c: "Rock"}
+    assert _genres(session, alice)["Pop"] == 1
+    assert _genres(session, alice)["Rap"] == 1
+    assert _genres(session, alice)["Rock"] == 1
+    assert _genres(session, bob)["Rock"] == 3
+    assert get_data_version(session) == version + 1
+    versions = set(v for v, in session.query(GenreProf.version))
+    assert versions == {version + 1}
+
+
+def test_apply_annotations_without_labels_writes_nothing(session, make_user):
+    make_user("alice", songs=[("Song A", "Artist A")])
+    version = get_data_version(session)
+    assert apply_annotations(session, {}) == 0
+    assert get_data_version(session) == version
+    assert session.query(GenreProf).count() == 0
+
+
+def test_annotation_queue_pages_by_song_id(session, make_user):
+    make_user("alice", songs=[("Song {}".format(i), "Artist") for i in range(7)])
+    ids = [s.id_ for s in session.query(Songs).order_by(Songs.id_)]
+    session.query(Songs).filter(Songs.id_ == ids[2]).update({Songs.genre: "Rock"})
+    session.commit()
+
+    pages = []
+    after = 0
+    while after is not None:
+        songs, after = annotation_queue(session, after, page_size=2)
+        pages.append([s.id_ for s in songs])
+    unlabelled = [i for i in ids if i != ids[2]]
+    assert pages == [unlabelled[0:2], unlabelled[2:4], unlabelled[4:6]]
+    assert backlog_size(session) == 6
+
+
+def test_annotation_queue_of_empty_backlog(session):
+    assert annotation_queue(session) == ([], None)
+    assert backlog_size(session) == 0
+
+
+def test_song_key_ignores_case_spacing_and_punctuation():
+    assert song_key("Hey, Jude!", "The Beatles") == song_key("hey jude", "the  BEATLES")
+    assert song_key("Hey Jude", "The Beatles") != song_key("Let It Be", "The Beatles")
+    assert song_key("", "The Beatles") is None
+
+
+def test_labels_reach_unlabelled_duplicates(session, make_user):
+    alice = make_user("alice", songs=[("Hey Jude", "The Beatles")])
+    bob = make_user("bob", songs=[("hey jude!", "the beatles"), ("Other", "Band")])
+    first = session.query(Songs).filter(Songs.user_id == alice).one()
+
+    assert apply_annotations(session, {first.id_: ["Rock"]}) == 2
+
+    genres = dict(session.query(Songs.title, Songs.genre))
+    assert genres == {"Hey Jude": "Rock", "hey jude!": "Rock", "Other": "Unknown"}
+    assert _genres(session, bob)["Rock"] == 1
+    assert session.query(KnownSong).one().get_genres() == ["Rock"]
+
+
+def test_submitted_known_songs_skip_the_queue(session, make_user):
+    alice = make_user("alice", songs=[("Hey Jude", "The Beatles")])
+    apply_annotations(session, {session.query(Songs.id_).filter(Songs.user_id == alice).scalar(): ["Pop", "Rock"]})
+    bob = make_user("bob")
+
+    labelled = submit_songs(session, bob, [{"title": "Hey  Jude", "artist": "The Beatles"},
+                                           {"title": "New Song", "artist": "Band"}])
+
+    assert labelled == 1
+    assert [s.title for s in annotation_queue(session)[0]] == ["New Song"]
+    assert _genres(session, bob)["Pop"] == 1
+    assert _genres(session, bob)["Rock"] == 1
@@ -0,0 +1,82 @@
+"""Tests of assets.py."""
+import gzip
+import io
+
+import pytest
+from flask import Flask, url_for
+
+import assets
+
+SCRIPT = b"function hello() { return 'hello'; }\n" * 50
+
+
+@pytest.fixture
+def static(tmp_path):
+    """Static folder with a script, its unminified source and a source map."""
+    folder = tmp_path / "static"
+    (folder / "js").mkdir(parents=True)
+    (folder / "js" / "app.min.js").write_bytes(SCRIPT)
+    (folder / "js" / "app.js").write_bytes(SCRIPT + b"// comments\n")
+    (folder / "js" / "app.min.js.map").write_bytes(b"{}")
+    (folder / "robots.txt").write_bytes(b"User-agent: *\n")
+    (folder / "LICENSE").write_bytes(b"MIT License\n")
+    return folder
+
+
+def test_build_fingerprints_and_compresses(static):
+    manifest = assets.build(str(static))
+    assert sorted(manifest) == ["LICENSE", "js/app.min.js", "robots.txt"]
+    script = manifest["js/app.min.js"]
+    assert script["file"] == "dist/js/app.min.{}.js".format(script["hash"])
+    assert (static / script["file"]).read_bytes() == SCRIPT
+    assert gzip.decompress((static / (script["file"] + ".gz")).read_bytes()) == SCRIPT
+    # Variants that would not be smaller are not written.
+    assert not (static / (manifest["robots.txt"]["file"] + ".gz")).exists()
+    assert assets.build(str(static)) == manifest
+    assert assets.load_manifest(str(static)) == manifest
+
+
+def test_built_assets_are_served_with_long_lived_caching(static):
+    manifest = assets.build(str(static))
+    app = Flask(__name__, static_folder=str(static))
+    assets.init_app(app)
+    with app.test_request_context():
+        url = url_for("static", filename="js/app.min.js")
+        assert url == "/static/" + manifest["js/app.min.js"]["file"]
+    client = app.test_client()
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert gzip.decompress(response.data) == SCRIPT
+    etag = response.headers["ETag"]
+    assert client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+
+    plain = client.get(url)
+    assert plain.data == SCRIPT
+    assert plain.headers["ETag"] != etag
+    assert etag == '"{}-gzip"'.format(manifest["js/app.min.js"]["hash"])
+
+    # Files without an extension get the hash of their content too.
+    with app.test_request_context():
+        url = url_for("static", filename="LICENSE")
+    assert client.get(url).headers["ETag"] == '"{}"'.format(manifest["LICENSE"]["hash"])
+
+    # Files outside the build are still served as before.
+    assert client.get("/static/js/app.js").status_code == 200
+
+
+def test_without_a_build_static_files_are_unchanged(static):
+    app = Flask(__name__, static_folder=str(static))
+    assets.init_app(app)
+    with app.test_request_context():
+        assert url_for("static", filename="js/app.min.js") == "/static/js/app.min.js"
+
+
+def test_large_images_are_scaled_down():
+    Image = pytest.importorskip("PIL.Image")
+    out = io.BytesIO()
+    Image.new("RGB", (3000, 2000), (200, 30, 30)).save(out, format="JPEG")
+    data = assets.optimize("photo.jpg", out.getvalue())
+    assert max(Image.open(io.BytesIO(data)).size) == assets.ASSET_MAX_IMAGE_SIZE
+    assert assets.optimize("notes.txt", b"text") == b"text"
@@ -0,0 +1,64 @@
+"""Tests of bench/synthetic.py and bench/run.py."""
+import hashlib
+
+import numpy as np
+
+from bench.run import ScratchCopy, benchmarks, best_of
+from bench.synthetic import SONGS_PER_USER, generate
+from models import Admin, GenreProf, Personality, Songs, User, get_debug_session
+
+
+def md5(path):
+    """Checksum of a file."""
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def test_synthetic_database(tmp_path):
+    url = "sqlite:///" + str(tmp_path / "synthetic.db")
+    generate(url, 40, duplicates=0.5, labelled=1.0)
+    session = get_debug_session(url)
+    assert session.query(User).count() == 41
+    assert session.query(Admin).count() == 1
+    assert session.query(Personality).count() == 40
+    assert session.query(Songs).count() == 40 * SONGS_PER_USER
+    # Popular songs are submitted more than once and share their key.
+    assert session.query(Songs.song_key).distinct().count() < 40 * SONGS_PER_USER
+    assert session.query(GenreProf).count() == 40
+    session.close()
+
+
+def test_writing_benchmarks_leave_the_database_unchanged(tmp_path):
+    path = str(tmp_path / "synthetic.db")
+    generate("sqlite:///" + path, 30)
+    session = get_debug_session("sqlite:///" + path)
+    # Opening the file switches it to WAL mode.
+    session.query(User).count()
+    checksum = md5(path)
+    for name, func in benchmarks(session, np.random.RandomState(0), path).items():
+        if name == "significance_sweep":
+            continue
+        setup, func = func if isinstance(func, tuple) else (None, func)
+        assert best_of(func, 2, setup) >= 0
+        if setup is not None:
+            setup.close()
+    session.close()
+    assert md5(path) == checksum
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith("scratch_")]
+
+
+def test_best_of_runs_the_setup_outside_the_timing():
+    calls = []
+    assert best_of(calls.append, 3, setup=lambda: len(calls)) >= 0
+    assert calls == [0, 1, 2]
+
+
+def test_scratch_copies_are_fresh(tmp_path):
+    path = str(tmp_path / "synthetic.db")
+    generate("sqlite:///" + path, 5)
+    scratch = ScratchCopy(path)
+    scratch().query(Songs).delete()
+    scratch.session.commit()
+    assert scratch().query(Songs).count() == 5 * SONGS_PER_USER
+    scratch.close()
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith("scratch_")]
@@ -0,0 +1,66 @@
+"""Tests of analytics/cache.py and the data version it is keyed on."""
+import pytest
+
+from analytics.cache import ResultCache, cached
+from migrate import upgrade
+from models import DataVersion, User, bump_data_version, get_data_version, get_debug_session
+
+
+@cached("count_users")
+def count_users(session):
+    """Number of users."""
+    return session.query(User).count()
+
+
+def test_put_get_and_evict(tmp_path):
+    result_cache = ResultCache(str(tmp_path / "cache"), max_bytes=3000)
+    key = result_cache.key("analysis", {"k": 1}, 1)
+    assert result_cache.get(key) == (False, None)
+    result_cache.put(key, [1, 2, 3])
+    assert result_cache.get(key) == (True, [1, 2, 3])
+
+    for i in range(5):
+        result_cache.put(result_cache.key("big", i, 1), b"x" * 1000)
+    assert result_cache.get(key) == (False, None)
+    assert sum(size for _, size, _ in result_cache._entries()) <= 3000
+
+
+def test_results_are_recomputed_after_a_write(session, make_user):
+    make_user("alice")
+    assert count_users(session) == 1
+    session.add(User("bob", "secret", "bob", "bob@test"))
+    session.commit()
+    # Writes that do not bump the version are not seen.
+    assert count_users(session) == 1
+    bump_data_version(session)
+    session.commit()
+    assert count_users(session) == 2
+
+
+def test_databases_at_the_same_version_do_not_share_results(session, make_user, tmp_path):
+    url = "sqlite:///" + str(tmp_path / "other.db")
+    upgrade(url)
+    other = get_debug_session(url)
+    make_user("alice")
+    assert get_data_version(other) == get_data_version(session)
+    assert count_users(session) == 1
+    assert count_users(other) == 0
+    other.close()
+
+
+def test_the_version_row_comes_from_the_migrations(session):
+    assert session.query(DataVersion).count() == 1
+    assert bump_data_version(session) == 1
+    session.query(DataVersion).delete()
+    with pytest.raises(RuntimeError):
+        bump_data_version(session)
+    session.rollback()
+
+
+def test_registration_bumps_the_version(flask_app):
+    from app import db_session
+
+    version = get_data_version(db_session)
+    flask_app.test_client().post("/register", data={"name": "new", "username": "new", "email": "new@test",
+                                                    "password": "secret", "confirm_password": "secret"})
+    assert get_data_version(db_session) == version + 1
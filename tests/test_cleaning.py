@@ -0,0 +1,78 @@
+"""Tests of cleaning.py."""
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from cleaning import clean
+from models import Admin, GenreProf, Personality, Songs, User, get_data_version
+
+
+@pytest.fixture
+def strict_session(db_url):
+    """Session on the test database with foreign keys enforced."""
+    engine = create_engine(db_url)
+
+    @event.listens_for(engine, "connect")
+    def foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def users(make_user, session):
+    """Users covering every rule, by name."""
+    ids = {"complete": make_user("complete", traits=[20] * 5, genres={"Rock": 1}, songs=[("A", "B")]),
+           "no_quiz": make_user("no_quiz", genres={"Pop": 1}, songs=[("C", "D")]),
+           "no_songs": make_user("no_songs", traits=[30] * 5),
+           "blank_song": make_user("blank_song", traits=[20] * 5, songs=[("A", "B"), ("  ", "E")]),
+           "admin": make_user("admin")}
+    session.add(Admin(ids["admin"]))
+    session.commit()
+    return ids
+
+
+def _names(session):
+    """Usernames left."""
+    return sorted(u for u, in session.query(User.username))
+
+
+def test_rules_delete_users_with_their_rows(users, strict_session):
+    report = clean(strict_session, ["no_personality", "no_songs", "invalid_songs"])
+
+    assert report["no_personality.users"] == 1
+    assert report["no_personality.songs (orphaned)"] == 1
+    assert report["no_personality.genre_prof (orphaned)"] == 1
+    assert report["no_songs.users"] == 1
+    assert report["no_songs.personality (orphaned)"] == 1
+    assert report["invalid_songs.songs"] == 1
+    assert _names(strict_session) == ["admin", "blank_song", "complete"]
+    assert strict_session.query(Songs).count() == 2
+    assert strict_session.query(Personality).count() == 2
+    assert strict_session.query(GenreProf).count() == 1
+    assert strict_session.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_dry_run_changes_nothing(users, session):
+    version = get_data_version(session)
+    report = clean(session, ["no_personality", "no_songs"], dry_run=True)
+    assert report["no_personality.users"] == 1
+    assert report["no_songs.users"] == 1
+    assert len(_names(session)) == 5
+    assert get_data_version(session) == version
+
+
+def test_cleaning_bumps_the_data_version(users, session):
+    version = get_data_version(session)
+    clean(session, ["no_songs"])
+    assert get_data_version(session) == version + 1
+
+
+def test_orphans_rule_deletes_rows_without_a_user(users, session):
+    session.execute("DELETE FROM users WHERE username = 'no_quiz'")
+    session.commit()
+    report = clean(session, ["orphans"])
+    assert report["orphans.songs (orphaned)"] == 1
+    assert report["orphans.genre_prof (orphaned)"] == 1
@@ -0,0 +1,68 @@
+"""Tests of analytics/clustering.py."""
+import numpy as np
+import pytest
+
+from analytics import clustering
+
+
+@pytest.fixture
+def blobs():
+    """600 rows around three well separated centers, and their true labels."""
+    rng = np.random.RandomState(0)
+    centers = np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0], [0.0, 10.0, 0.0]])
+    truth = rng.randint(3, size=600)
+    return centers[truth] + rng.normal(0, 0.5, size=(600, 3)), truth
+
+
+def agree(labels, truth):
+    """Whether two labellings split the rows the same way."""
+    pairs = set(zip(labels.tolist(), truth.tolist()))
+    return len(pairs) == len(set(labels.tolist())) == len(set(truth.tolist()))
+
+
+def test_kmeans_finds_the_clusters_deterministically(blobs):
+    X, truth = blobs
+    result = clustering.kmeans(X, 3, seed=1)
+    assert agree(result.labels, truth)
+    again = clustering.kmeans(X, 3, seed=1)
+    assert np.array_equal(again.labels, result.labels)
+    assert again.inertia == result.inertia
+
+
+def test_minibatch_kmeans_finds_the_clusters(blobs):
+    X, truth = blobs
+    result = clustering.minibatch_kmeans(X, 3, seed=1, batch_size=64)
+    assert agree(result.labels, truth)
+    assert result.inertia < 1.5 * clustering.kmeans(X, 3, seed=1).inertia
+
+
+def test_blocks_do_not_change_assignments(blobs):
+    X, _ = blobs
+    centers = X[:4]
+    labels, distances = clustering.assign(X, centers, block_size=7)
+    expected = ((X[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    assert np.array_equal(labels, expected.argmin(axis=1))
+    assert np.allclose(distances, expected.min(axis=1))
+
+
+def test_silhouette_selects_the_true_k(blobs):
+    X, _ = blobs
+    scores = clustering.select_k(X, [2, 3, 4, 5], seed=0)
+    assert max(scores, key=lambda s: s["silhouette"])["k"] == 3
+    assert [s["inertia"] for s in scores] == sorted([s["inertia"] for s in scores], reverse=True)
+
+
+def test_saved_clusters_predict_new_rows(blobs, tmp_path):
+    X, _ = blobs
+    result = clustering.kmeans(X, 3, seed=0)
+    scaling = (np.zeros(3), np.ones(3))
+    clustering.save_clusters(str(tmp_path), "personality", np.arange(len(X)), result, scaling, {"seed": 0})
+    manifest, user_id, labels = clustering.load_clusters(str(tmp_path), "personality")
+    assert np.array_equal(labels, result.labels)
+    assert sum(manifest["sizes"]) == len(user_id) == len(X)
+    assert np.array_equal(clustering.predict(manifest, X[:10]), result.labels[:10])
+
+
+def test_too_few_rows_are_rejected():
+    with pytest.raises(ValueError):
+        clustering.kmeans(np.zeros((2, 5)), 3)
@@ -0,0 +1,36 @@
+"""Tests of db.py."""
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.pool import QueuePool
+
+from db import chunks, make_engine
+from settings import DB_POOL_SIZE, SQLITE_BUSY_TIMEOUT
+
+
+def test_sqlite_files_run_in_wal_mode(db_url):
+    engine = make_engine(db_url)
+    assert isinstance(engine.pool, QueuePool)
+    assert engine.pool.size() == DB_POOL_SIZE
+    assert engine.execute("PRAGMA journal_mode").scalar() == "wal"
+    assert engine.execute("PRAGMA busy_timeout").scalar() == SQLITE_BUSY_TIMEOUT
+
+
+def test_pooled_connections_are_shared_across_threads(db_url):
+    engine = make_engine(db_url)
+
+    def count(_):
+        return engine.execute("SELECT count(*) FROM users").scalar()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert list(pool.map(count, range(8))) == [0] * 8
+
+
+def test_memory_databases_keep_the_default_pool():
+    engine = make_engine("sqlite://")
+    assert not isinstance(engine.pool, QueuePool)
+    assert engine.execute("SELECT 1").scalar() == 1
+
+
+def test_chunks_split_any_iterable():
+    assert list(chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunks(set(), 2)) == []
@@ -0,0 +1,49 @@
+"""Tests of analytics/export.py."""
+import csv
+
+import numpy as np
+
+from analytics.export import export
+
+
+def _rows(path):
+    """Rows of a CSV file."""
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_csv_export_streams_every_user_and_song(session, make_user, tmp_path):
+    make_user("alice", traits=[10, 20, 30, 40, 50], genres={"Rock": 2}, songs=[("A", "B")])
+    for i in range(4):
+        make_user("user{}".format(i), songs=[("Song", "Artist {}".format(i))])
+    prefix = str(tmp_path / "data")
+
+    users, songs = export(session, prefix, "csv", songs=True, chunk_size=2)
+
+    rows = _rows(users)
+    assert rows[0][:10] == ["user_id", "age", "gender", "has_traits", "has_genres", "O", "C", "E", "A", "N"]
+    assert len(rows) == 6
+    alice = dict(zip(rows[0], rows[1]))
+    assert (alice["has_traits"], alice["O"], alice["Rock"]) == ("True", "10", "2")
+    assert len(_rows(songs)) == 6
+
+
+def test_npz_export_matches_csv(session, make_user, tmp_path):
+    for i in range(5):
+        make_user("user{}".format(i), traits=[i, 1, 2, 3, 4])
+    users, = export(session, str(tmp_path / "data"), "npz", chunk_size=2)
+    data = np.load(users)
+    assert data["user_id"].tolist() == [1, 2, 3, 4, 5]
+    assert data["O"].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_empty_tables_keep_their_header(session, tmp_path):
+    users, songs = export(session, str(tmp_path / "empty"), "csv", songs=True)
+    assert _rows(users)[0][:3] == ["user_id", "age", "gender"]
+    assert len(_rows(users)) == 1
+    assert _rows(songs) == [["song_id", "user_id", "title", "artist", "genre"]]
+
+    users, = export(session, str(tmp_path / "empty"), "npz")
+    data = np.load(users)
+    assert data["user_id"].shape == (0,)
+    assert data["Rock"].dtype == np.int64
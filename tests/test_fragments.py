@@ -0,0 +1,55 @@
+"""Tests of fragments.py and the fragments cached by the templates."""
+from jinja2 import DictLoader, Environment
+
+from fragments import FragmentCacheExtension, LRUCache
+
+
+def test_lru_drops_the_least_recently_used_items():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.put("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_fragments_are_keyed_on_their_values_and_template():
+    templates = {"page.html": "{% cache 'items', n %}{{ n }}{{ counter() }}{% endcache %}"}
+    environment = Environment(loader=DictLoader(templates), extensions=[FragmentCacheExtension])
+    calls = []
+
+    def counter():
+        calls.append(1)
+        return len(calls)
+
+    render = environment.get_template("page.html").render
+    assert render(n=1, counter=counter) == "11"
+    assert render(n=1, counter=counter) == "11"
+    assert render(n=2, counter=counter) == "22"
+    assert len(environment.fragment_cache.items) == 2
+
+    # An edited template does not serve the fragments of its older version.
+    templates["page.html"] = "{% cache 'items', n %}<{{ n }}>{% endcache %}"
+    environment.cache.clear()
+    assert environment.get_template("page.html").render(n=1) == "<1>"
+
+
+def test_quiz_answers_are_not_cached(flask_app):
+    cache = flask_app.jinja_env.fragment_cache
+    client = flask_app.test_client()
+    client.post("/register", data={"name": "frag", "username": "frag", "email": "frag@test",
+                                   "password": "secret", "confirm_password": "secret"})
+    client.post("/login", data={"username": "frag", "password": "secret"})
+    cache.clear()
+    page = client.get("/personality").get_data(as_text=True)
+    assert "checked" not in page
+    keys = set(cache.items)
+
+    for answer in range(1, 4):
+        page = client.post("/personality", data={"age": "30", "gender": "F", "1": str(answer)}) \
+            .get_data(as_text=True)
+        assert 'id="1_{}" type="radio" name=1 value={} checked'.format(answer, answer) in page
+    assert set(cache.items) == keys
+    assert "checked" not in client.get("/personality").get_data(as_text=True)
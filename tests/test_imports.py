@@ -0,0 +1,31 @@
+"""Tests that the web app stays apart from the analysis libraries."""
+import numpy as np
+
+from analytics import measures, scoring
+from bench.import_time import probe
+from quiz import KEY, N_QUESTIONS, TRAITS, WEIGHTS
+
+
+def test_web_modules_do_not_import_the_analysis_libraries():
+    for module in ["models", "app"]:
+        assert probe(module)["heavy"] == []
+
+
+def test_weight_table_follows_the_key():
+    assert np.asarray(WEIGHTS).shape == (N_QUESTIONS, len(TRAITS))
+    for q, (trait, sign) in KEY.items():
+        assert WEIGHTS[q - 1][TRAITS.index(trait)] == sign
+        assert sum(abs(w) for w in WEIGHTS[q - 1]) == 1
+    assert np.array_equal(scoring.WEIGHTS, WEIGHTS)
+
+
+def test_trait_pairs():
+    traits = np.array([[30, 10, 40, 20, 0], [10, 10, 10, 10, 10], [0, 5, 0, 5, 1]])
+    pairs = [measures.PAIR_LABELS[code] for code in measures.trait_pair_codes(traits)]
+    assert pairs == ["O&E", "A&N", "C&A"]
+    assert measures.trait_pair_counts(traits).sum() == 3
+
+
+def test_group_means_leave_empty_groups_undefined():
+    means = measures.group_means(np.array([[1.0, 2.0], [3.0, 4.0]]), np.array([0, 0]), 2)
+    assert np.array_equal(means, [[2.0, 3.0], [np.nan, np.nan]], equal_nan=True)
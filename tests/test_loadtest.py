@@ -0,0 +1,53 @@
+"""Tests of bench/loadtest.py."""
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.loadtest import PASSWORD, SONGS_PER_SESSION, AppClient, Recorder, annotator, percentile, volunteer
+from models import Admin, Personality, Songs, User
+
+
+class LockedClient(object):
+    """Client whose requests time out on a database lock."""
+
+    def request(self, method, path, data=None):
+        """Fail like a locked SQLite database."""
+        raise Exception("(sqlite3.OperationalError) database is locked")
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert [percentile(values, q) for q in (0.5, 0.95, 0.99, 1.0)] == [50, 95, 99, 100]
+    assert percentile([3], 0.99) == 3
+    assert percentile([], 0.5) == 0.0
+
+
+def test_lock_timeouts_are_counted_apart():
+    recorder = Recorder()
+    assert recorder.request(LockedClient(), "GET", "/songs?page=2") is None
+    assert recorder.routes["GET /songs"]["locked"] == 1
+    assert recorder.routes["GET /songs"]["error"] == 0
+
+
+def test_concurrent_volunteers_complete_the_flow(flask_app):
+    from app import db_session
+
+    recorder = Recorder()
+
+    def session(number):
+        return volunteer(AppClient(flask_app), recorder, "volunteer{}".format(number), random.Random(number))
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert all(pool.map(session, range(8)))
+    users = [u for u, in db_session.query(User.id_).filter(User.username.like("volunteer%"))]
+    assert len(users) == 8
+    assert db_session.query(Personality).filter(Personality.user_id.in_(users)).count() == 8
+    assert db_session.query(Songs).filter(Songs.user_id.in_(users)).count() == 8 * SONGS_PER_SESSION
+    assert all(stats["error"] == stats["locked"] == 0 for stats in recorder.routes.values())
+    assert len(recorder.routes["POST /register"]["seconds"]) == 8
+
+    db_session.add(Admin(db_session.query(User.id_).filter(User.username == "volunteer0").scalar()))
+    db_session.commit()
+    db_session.remove()
+    annotator(AppClient(flask_app), recorder, "volunteer0", PASSWORD, 2, random.Random(0))
+    assert len(recorder.routes["POST /annotate"]["seconds"]) == 2
+    assert db_session.query(Songs).filter(Songs.user_id.in_(users), Songs.genre != "Unknown").count() > 0
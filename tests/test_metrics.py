@@ -0,0 +1,37 @@
+"""Tests of metrics.py and the admin metrics pages."""
+from metrics import LATENCY_BUCKETS, EndpointStats
+
+STATE = {"queries": [("SELECT 1", 0.001)] * 3, "query_seconds": 0.003, "hashes": 1, "hash_seconds": 0.2}
+
+
+def test_endpoint_totals():
+    stats = EndpointStats()
+    for seconds in [0.001] * 90 + [0.3] * 10:
+        stats.add(seconds, 200, STATE)
+    stats.add(20.0, 500, STATE)
+    totals = stats.as_dict()
+    assert totals["requests"] == 101
+    assert totals["errors"] == 1
+    assert totals["queries"] == 303
+    assert totals["max_queries"] == 3
+    assert totals["hashes"] == 101
+    assert totals["p50_seconds"] == LATENCY_BUCKETS[0]
+    assert totals["p95_seconds"] == 0.5
+    assert totals["max_seconds"] == 20.0
+    assert sum(totals["histogram"].values()) == 101
+    assert totals["histogram"]["inf"] == 1
+
+
+def test_requests_are_counted_per_endpoint(flask_app):
+    client = flask_app.test_client()
+    client.get("/login")
+    client.post("/login", data={"username": "nobody", "password": "wrong"})
+    # Only admins see the metrics.
+    assert client.get("/admin/metrics.json").status_code == 302
+    with client.session_transaction() as session:
+        session["admin"] = True
+    endpoints = client.get("/admin/metrics.json").get_json()["endpoints"]
+    assert endpoints["login"]["requests"] >= 2
+    assert endpoints["login"]["queries"] >= 1
+    assert endpoints["admin_metrics_json"]["requests"] >= 1
+    assert client.get("/admin/metrics").status_code == 200
@@ -0,0 +1,62 @@
+"""Tests of migrate.py."""
+import sqlite3
+
+import pytest
+
+import migrate
+from models import DataVersion, KnownSong, Personality, RunningStat, Songs, get_data_version, get_debug_session
+from running_stats import MOMENTS, recompute
+
+
+def test_empty_databases_get_the_current_schema(db_url, capsys):
+    session = get_debug_session(db_url)
+    assert session.query(DataVersion).count() == 1
+    assert session.query(RunningStat).count() == len(MOMENTS) + 1
+    session.close()
+    assert migrate.upgrade(db_url) == []
+    migrate.status(db_url)
+    assert capsys.readouterr().out.count("applied") == migrate.HEAD
+
+
+def test_first_release_databases_are_upgraded(db_url):
+    assert migrate.downgrade(db_url, 0) == list(range(migrate.HEAD, 0, -1))
+    path = db_url[len("sqlite:///"):]
+    with sqlite3.connect(path) as connection:
+        assert "data_version" not in [n for n, in connection.execute("SELECT name FROM sqlite_master")]
+        connection.execute("INSERT INTO users (id_, username, name, email) VALUES (1, 'old', 'old', 'old@test')")
+        connection.executemany("INSERT INTO songs (user_id, title, artist, genre) VALUES (1, ?, ?, ?)",
+                               [("Hey Jude", "The Beatles", "Rock"), ("hey jude", "the beatles ", "Unknown")])
+        # Before migration 6 a user could take the quiz twice.
+        connection.executemany("INSERT INTO personality (user_id, O, C, E, A, N) VALUES (1, ?, 20, 20, 20, 20)",
+                               [(10,), (30,)])
+    connection.close()
+
+    assert migrate.upgrade(db_url) == list(range(1, migrate.HEAD + 1))
+    session = get_debug_session(db_url)
+    keys = [k for k, in session.query(Songs.song_key)]
+    assert keys[0] is not None and keys == [keys[0]] * 2
+    assert [(k.key, k.genres) for k in session.query(KnownSong)] == [(keys[0], "Rock")]
+    assert [p.O for p in session.query(Personality)] == [30]
+    # Deleting the older quiz changed the research data.
+    assert get_data_version(session) == 1
+    report = recompute(session, check=True)
+    assert report["traits"][:2] == (1, 1)
+    assert all(difference == pytest.approx(0) for _, _, difference in report.values())
+    session.close()
+
+
+def test_downgrade_and_upgrade_again(db_url):
+    assert migrate.downgrade(db_url, 3) == [6, 5, 4]
+    session = get_debug_session(db_url)
+    assert get_data_version(session) == 0
+    session.close()
+    assert migrate.upgrade(db_url, 5) == [4, 5]
+    assert migrate.upgrade(db_url) == [6]
+
+
+def test_audit_needs_the_latest_schema(db_url, capsys):
+    assert migrate.audit(db_url) >= 0
+    assert "full table scans" in capsys.readouterr().out
+    migrate.downgrade(db_url, migrate.HEAD - 1)
+    with pytest.raises(ValueError):
+        migrate.audit(db_url)
@@ -0,0 +1,50 @@
+"""Tests of passwords.py."""
+import threading
+
+import passwords
+from models import User
+
+
+def test_hash_and_verify():
+    hashed = passwords.hash_password("secret")
+    assert passwords.verify_password("secret", hashed)
+    assert not passwords.verify_password("wrong", hashed)
+    assert not passwords.needs_rehash(hashed)
+
+
+def test_hashes_of_another_cost_need_rehash():
+    assert passwords.needs_rehash(passwords.bcrypt.using(rounds=5).hash("secret"))
+
+
+def test_concurrent_first_use_creates_one_pool(monkeypatch):
+    monkeypatch.setattr(passwords, "_pools", {})
+    pools = []
+    start = threading.Barrier(8)
+
+    def first_use():
+        start.wait()
+        pools.append(passwords._pool("threads"))
+
+    threads = [threading.Thread(target=first_use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(map(id, pools))) == 1
+    assert list(passwords._pools) == ["threads"]
+
+
+def test_login_upgrades_hashes_of_another_cost(flask_app):
+    from app import db_session
+
+    user = User("rehash", "secret", "rehash", "rehash@test")
+    user.password = passwords.bcrypt.using(rounds=5).hash("secret")
+    db_session.add(user)
+    db_session.commit()
+
+    response = flask_app.test_client().post("/login", data={"username": "rehash", "password": "secret"})
+
+    assert response.status_code == 302
+    hashed = db_session.query(User.password).filter(User.username == "rehash").scalar()
+    assert not passwords.needs_rehash(hashed)
+    assert passwords.verify_password("secret", hashed)
@@ -0,0 +1,70 @@
+"""Tests of progress.py and the quiz route that relies on it."""
+from models import Personality, Songs, User
+from progress import PROGRESS_KEY, get_progress, invalidate_progress, user_progress
+from quiz import quiz
+
+
+def test_user_progress(session, make_user):
+    new = make_user("new")
+    done = make_user("done", traits=[20, 20, 20, 20, 20], songs=[("A", "B"), ("C", "D")])
+    assert user_progress(session, new) == {"personality": False, "songs": 0}
+    assert user_progress(session, done) == {"personality": True, "songs": 2}
+
+
+def test_only_a_taken_quiz_is_cached_in_the_session_store(session, make_user):
+    user_id = make_user("alice")
+    store = {}
+    assert get_progress(store, session, user_id) == {"personality": False, "songs": 0}
+    assert PROGRESS_KEY not in store
+    session.add(Personality(user_id, [20, 20, 20, 20, 20]))
+    session.commit()
+    assert get_progress(store, session, user_id)["personality"] is True
+    assert store[PROGRESS_KEY] is True
+
+    # Songs added from another session are counted.
+    session.add(Songs(user_id, "A", "B"))
+    session.commit()
+    assert get_progress(store, session, user_id) == {"personality": True, "songs": 1}
+    invalidate_progress(store)
+    assert PROGRESS_KEY not in store
+
+
+def test_songs_from_a_second_session_show_on_the_index(flask_app):
+    first, second = flask_app.test_client(), flask_app.test_client()
+    first.post("/register", data={"name": "songs", "username": "songs", "email": "songs@test",
+                                  "password": "secret", "confirm_password": "secret"})
+    for client in (first, second):
+        client.post("/login", data={"username": "songs", "password": "secret"})
+    first.post("/personality", data=_answers())
+    first.get("/")
+    songs = dict(("title_{}".format(i), "Song {}".format(i)) for i in range(5))
+    songs.update(("artist_{}".format(i), "Artist") for i in range(5))
+    second.post("/songs", data=songs)
+    assert 'fa-check"></i><br>Choose songs' in first.get("/").get_data(as_text=True)
+
+
+def _answers():
+    """Form of a complete quiz."""
+    answers = dict((str(k), "3") for k in quiz)
+    answers.update(age="30", gender="F")
+    return answers
+
+
+def test_quiz_from_a_second_session_shows_it_was_taken(flask_app):
+    from app import db_session
+
+    first, second = flask_app.test_client(), flask_app.test_client()
+    first.post("/register", data={"name": "twice", "username": "twice", "email": "twice@test",
+                                  "password": "secret", "confirm_password": "secret"})
+    for client in (first, second):
+        client.post("/login", data={"username": "twice", "password": "secret"})
+        # Caches the progress of a user who did not take the quiz yet
+        assert client.get("/personality").status_code == 200
+
+    assert first.post("/personality", data=_answers()).status_code == 302
+    response = second.post("/personality", data=_answers())
+
+    assert response.status_code == 200
+    assert "You have already taken the quiz." in response.get_data(as_text=True)
+    user_id = db_session.query(User.id_).filter(User.username == "twice").scalar()
+    assert db_session.query(Personality).filter(Personality.user_id == user_id).count() == 1
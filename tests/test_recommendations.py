@@ -0,0 +1,81 @@
+"""Tests of recommendations.py."""
+import numpy as np
+
+from models import Personality, User, bump_data_version
+from recommendations import NeighbourIndex
+
+
+def add_users(make_user, session, n, rng, prefix="user"):
+    """Add ``n`` users with random quizzes and genres and bump the version. Returns their ids."""
+    ids = [make_user("{}{}".format(prefix, i), traits=[int(t) for t in rng.randint(10, 40, size=5)],
+                     genres={"Rock": int(rng.randint(5)), "Pop": int(rng.randint(5)), "Blues": 1})
+           for i in range(n)]
+    bump_data_version(session)
+    session.commit()
+    return ids
+
+
+def brute_force(index, user_id, k):
+    """Rows of the ``k`` nearest users by exhaustive search."""
+    distances = np.sqrt(((index.points - index.points[index.rows[user_id]]) ** 2).sum(axis=1))
+    distances[index.rows[user_id]] = np.inf
+    return sorted(np.argsort(distances, kind="stable")[:k].tolist())
+
+
+def test_new_quizzes_are_added_without_a_rebuild(session, make_user):
+    rng = np.random.RandomState(0)
+    users = add_users(make_user, session, 20, rng)
+    index = NeighbourIndex()
+    result = index.recommend(session, users[0], k=5)
+    assert result["neighbours"] == 5
+    assert abs(sum(result["genres"].values()) - 1) < 1e-9
+    tree = index.tree
+
+    users += add_users(make_user, session, 5, rng, prefix="late")
+    index.recommend(session, users[0], k=5)
+    assert index.tree is tree
+    assert index.size == 25
+    assert index.in_tree == 20
+    for user in users:
+        assert sorted(index.neighbours(user, 5)) == brute_force(index, user, 5)
+
+
+def test_arrays_grow_geometrically(session, make_user):
+    rng = np.random.RandomState(1)
+    users = add_users(make_user, session, 3, rng)
+    index = NeighbourIndex()
+    index.recommend(session, users[0])
+    capacities = set()
+    for i in range(40):
+        add_users(make_user, session, 1, rng, prefix="late{}_".format(i))
+        index.recommend(session, users[0])
+        capacities.add(len(index._points))
+    assert index.size == 43
+    assert len(capacities) <= 3
+    assert np.array_equal(index.user_id, sorted(index.user_id))
+
+
+def test_removed_users_rebuild_the_index(session, make_user):
+    rng = np.random.RandomState(2)
+    users = add_users(make_user, session, 10, rng)
+    index = NeighbourIndex()
+    index.recommend(session, users[0])
+    # A deletion and an addition in one version leave the number of quizzes unchanged.
+    session.query(Personality).filter(Personality.user_id == users[1]).delete()
+    session.query(User).filter(User.id_ == users[1]).delete()
+    session.commit()
+    late = add_users(make_user, session, 1, rng, prefix="late")
+    assert index.recommend(session, users[1]) is None
+    assert users[1] not in index.user_id
+    assert late[0] in index.rows
+    assert index.size == 10
+    assert index.recommend(session, users[0])["neighbours"] == 9
+
+
+def test_users_without_a_quiz_get_no_recommendation(session, make_user):
+    rng = np.random.RandomState(3)
+    users = add_users(make_user, session, 3, rng)
+    no_quiz = make_user("no_quiz", genres={"Rock": 1})
+    index = NeighbourIndex()
+    assert index.recommend(session, no_quiz) is None
+    assert index.recommend(session, users[0], k=10)["neighbours"] == 2
@@ -0,0 +1,23 @@
+"""Tests of analytics/report.py."""
+import os
+
+from analytics.report import MANIFEST, figures, render
+from models import bump_data_version
+
+
+def test_figures_are_drawn_once_per_data_change(session, make_user, tmp_path):
+    for i in range(6):
+        make_user("user{}".format(i), traits=[10 + 5 * i, 20, 30, 20, 10], genres={"Rock": i, "Pop": 1})
+    output = str(tmp_path / "analysis")
+
+    drawn = render(session, output, workers=1)
+    assert sorted(os.path.basename(path) for path in drawn) == sorted(figures(session))
+    assert all(os.path.getsize(path) > 0 for path in drawn)
+    assert os.path.exists(os.path.join(output, MANIFEST))
+    assert render(session, output, workers=1) == []
+
+    make_user("late", traits=[40, 40, 40, 40, 40], genres={"Blues": 5})
+    bump_data_version(session)
+    session.commit()
+    assert len(render(session, output, workers=1)) > 0
+    assert len(render(session, output, workers=1, force=True)) == len(figures(session))
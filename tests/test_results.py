@@ -0,0 +1,65 @@
+"""Tests of analytics/results.py and the array operations of analytics/measures.py."""
+import numpy as np
+import pytest
+
+from analytics import results
+from analytics.measures import PAIR_LABELS
+from models import User
+
+# Genre columns: Blues, Contemporary, Country, Electronic, Rap, Pop, Reggae, Rock
+GENRE_GROUPS = ([0, 2, 5, 6], [3, 4, 1, 7])
+
+
+@pytest.fixture
+def users(session, make_user):
+    """Five users whose results are worked out by hand below."""
+    rows = [("u1", 18, "F", [30, 10, 40, 20, 0], {"Blues": 1, "Rock": 3}),
+            ("u2", 25, "M", [10, 35, 10, 30, 20], {"Rap": 2, "Pop": 2}),
+            ("u3", 40, "F", [5, 5, 5, 30, 31], {"Country": 1, "Others": 1}),
+            ("u4", 0, "U", [30, 10, 40, 20, 0], None),
+            # The original analysis counted any gender sorting before "F" as female.
+            ("u5", 22, "", None, {"Reggae": 1})]
+    for name, age, gender, traits, genres in rows:
+        user = session.query(User).get(make_user(name, traits=traits, genres=genres))
+        user.age = age
+        user.gender = gender
+    session.commit()
+
+
+def test_trait_pair_histogram(session, users):
+    counts = dict(zip(PAIR_LABELS, results.trait_pair_histogram(session)))
+    assert counts == {"O&C": 0, "O&E": 2, "O&A": 0, "O&N": 0, "C&E": 0, "C&A": 1, "C&N": 0, "E&A": 0, "E&N": 0,
+                      "A&N": 1}
+
+
+def test_genre_profile(session, users):
+    sums, corr = results.genre_profile(session)
+    assert np.allclose(sums, [0.25, 0, 0.5, 0, 0.5, 0.5, 1, 0.75])
+    assert corr.shape == (8, 8)
+
+
+def test_age_genre_means(session, users):
+    means = results.age_genre_means(session)
+    assert np.allclose(means, [[0.25, 0, 0, 0, 0, 0, 0, 0.75],
+                               [0, 0, 0, 0, 0.25, 0.25, 0.5, 0],
+                               [0, 0, 0.5, 0, 0, 0, 0, 0]])
+
+
+def test_gender_genre_means(session, users):
+    means = results.gender_genre_means(session)
+    assert np.allclose(means, [[0, 0, 0, 0, 0.5, 0.5, 0, 0],
+                               [0.125, 0, 0.25, 0, 0, 0, 0, 0.375]])
+
+
+def test_dominant_personality_table(session, users):
+    table = results.dominant_personality_table(session, ([0, 1, 2], [3, 4]), GENRE_GROUPS)
+    # u1 and u2 lean to O, C and E; u2's genre groups tie, which counts for the second group.
+    assert np.array_equal(table, [[0, 2], [1, 0]])
+
+
+def test_pair_genre_counts(session, users):
+    table = dict(zip(PAIR_LABELS, results.pair_genre_counts(session).tolist()))
+    assert table["O&E"] == [1, 0, 0, 0, 0, 0, 0, 3]
+    assert table["C&A"] == [0, 0, 0, 0, 2, 2, 0, 0]
+    assert table["A&N"] == [0, 0, 1, 0, 0, 0, 0, 0]
+    assert sum(sum(row) for row in table.values()) == 9
@@ -0,0 +1,74 @@
+"""Tests of running_stats.py."""
+import numpy as np
+import pytest
+
+import running_stats
+from analytics.measures import trait_pair_codes
+from models import GenreProf, Personality, bump_data_version
+from running_stats import Moments, load_stats, record_changes, recompute, user_states
+
+
+def test_moments_match_the_exact_values():
+    rng = np.random.RandomState(0)
+    x = rng.normal(5, 2, size=(60, 4))
+    moments = Moments(4)
+    for row in x:
+        moments.add(row.tolist())
+    for row in x[40:]:
+        moments.remove(row.tolist())
+    kept = x[:40]
+    centered = kept - kept.mean(axis=0)
+    assert moments.count == 40
+    assert np.allclose(moments.mean, kept.mean(axis=0))
+    assert np.allclose(moments.comoment, centered.T @ centered)
+    assert np.allclose(moments.correlation(), np.corrcoef(kept.T))
+
+
+def test_removing_the_last_vector_resets():
+    moments = Moments(2)
+    moments.add([1.0, 2.0])
+    moments.remove([1.0, 2.0])
+    assert (moments.count, moments.mean, moments.comoment) == (0, [0.0, 0.0], [[0.0, 0.0], [0.0, 0.0]])
+    moments.add([3.0, 3.0])
+    assert moments.correlation() == [[None, None], [None, None]]
+
+
+def test_pair_codes_match_the_analyses():
+    traits = np.random.RandomState(1).randint(10, 15, size=(200, 5))
+    assert [running_stats.pair_code(row.tolist()) for row in traits] == trait_pair_codes(traits).tolist()
+
+
+def test_recorded_changes_match_a_recompute(session, make_user):
+    assert load_stats(session) is not None
+    rng = np.random.RandomState(2)
+    users = []
+    for i in range(12):
+        traits = [int(t) for t in rng.randint(10, 40, size=5)]
+        genres = {"Rock": int(rng.randint(4)), "Pop": int(rng.randint(4)), "Rap": 1}
+        user = make_user("user{}".format(i))
+        old = user_states(session, [user])[user]
+        session.add(Personality(user, traits))
+        profile = GenreProf(user)
+        profile.add_genre(**genres)
+        session.add(profile)
+        session.flush()
+        record_changes(session, [(old, user_states(session, [user])[user])], bump_data_version(session))
+        session.commit()
+        users.append(user)
+
+    # A user's genres change and another user is removed.
+    old = user_states(session, users[:2])
+    session.query(GenreProf).filter(GenreProf.user_id == users[0]).one().add_genre(Blues=2)
+    session.query(Personality).filter(Personality.user_id == users[1]).delete()
+    session.query(GenreProf).filter(GenreProf.user_id == users[1]).delete()
+    session.flush()
+    new = user_states(session, users[:2])
+    record_changes(session, [(old[u], new[u]) for u in users[:2]], bump_data_version(session))
+    session.commit()
+
+    report = recompute(session, check=True)
+    for name, (stored, exact, difference) in report.items():
+        assert stored == exact
+        assert difference == pytest.approx(0, abs=1e-9), name
+    assert report["traits"][1] == 11
+    assert running_stats.summary(session)["pair_count"] == 11
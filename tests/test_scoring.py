@@ -0,0 +1,61 @@
+"""Tests of quiz scoring in quiz.py and analytics/scoring.py."""
+import numpy as np
+import pytest
+
+from analytics.scoring import score_batch, validate_responses
+from quiz import N_QUESTIONS, score_quiz
+
+
+def baseline_score(score):
+    """Scores of the original hand-written formula."""
+    O = (8 + score[5] - score[10] + score[15] - score[20] + score[25]
+         - score[30] + score[35] + score[40] + score[45] + score[50])
+    C = (14 + score[3] - score[8] + score[13] - score[18] + score[23]
+         - score[28] + score[33] - score[38] + score[43] + score[48])
+    E = (20 + score[1] - score[6] + score[11] - score[16] + score[21]
+         - score[26] + score[31] - score[36] + score[41] - score[46])
+    A = (14 - score[2] + score[7] - score[12] + score[17] - score[22]
+         + score[27] - score[32] + score[37] + score[42] + score[47])
+    N = (38 - score[4] + score[9] - score[14] + score[19] - score[24]
+         - score[29] - score[34] - score[39] - score[44] - score[49])
+    return [O, C, E, A, N]
+
+
+@pytest.fixture
+def responses():
+    """Random complete answers of 200 users."""
+    return np.random.RandomState(0).randint(1, 6, size=(200, N_QUESTIONS))
+
+
+def test_score_quiz_matches_the_baseline(responses):
+    for row in responses:
+        answers = dict((q, int(a)) for q, a in enumerate(row, 1))
+        assert score_quiz(answers) == baseline_score(answers)
+
+
+def test_score_batch_matches_score_quiz(responses):
+    scores, errors = score_batch(responses)
+    assert errors == {}
+    expected = [score_quiz(dict((q, int(a)) for q, a in enumerate(row, 1))) for row in responses]
+    assert np.array_equal(scores, np.array(expected))
+
+
+def test_score_quiz_rejects_out_of_range_answers():
+    answers = dict((q, 3) for q in range(1, N_QUESTIONS + 1))
+    answers[7] = 6
+    with pytest.raises(ValueError, match="7"):
+        score_quiz(answers)
+    del answers[7]
+    with pytest.raises(KeyError):
+        score_quiz(answers)
+
+
+def test_invalid_rows_are_reported_and_scored_as_nan(responses):
+    responses = responses[:3].astype(float)
+    responses[1, 4] = np.nan
+    responses[2, 9] = 0
+    scores, errors = score_batch(responses)
+    assert errors == {1: "missing answers to questions 5", 2: "answers out of range for questions 10"}
+    assert not np.isnan(scores[0]).any()
+    assert np.isnan(scores[1:]).all()
+    assert validate_responses(responses) == errors
@@ -0,0 +1,57 @@
+"""Tests of analytics/significance.py."""
+import numpy as np
+import pytest
+
+from analytics import significance
+from analytics.dataset import Dataset, empty_dataset
+
+
+@pytest.fixture
+def data():
+    """300 complete users whose Rock counts follow their extraversion."""
+    rng = np.random.RandomState(1)
+    n = 300
+    traits = rng.randint(10, 40, size=(n, 5))
+    genres = rng.randint(0, 4, size=(n, 9))
+    genres[:, 7] += (traits[:, 2] > 25) * 6
+    return Dataset(np.arange(1, n + 1), np.full(n, 30), np.array(["F"] * n), traits, genres,
+                   np.ones(n, dtype=bool), np.ones(n, dtype=bool))
+
+
+def test_splits_list_every_partition_once():
+    assert len(significance.splits(5)) == 2 ** 4 - 1
+    assert ([0], [1, 2]) in significance.splits(3)
+
+
+def test_adjusted_pvalues():
+    pvalues = [0.01, 0.04, np.nan, 0.03]
+    assert np.allclose(significance.adjust_pvalues(pvalues, "bonferroni"), [0.03, 0.12, np.nan, 0.09],
+                       equal_nan=True)
+    assert np.allclose(significance.adjust_pvalues(pvalues, "fdr_bh"), [0.03, 0.04, np.nan, 0.04],
+                       equal_nan=True)
+
+
+def test_sweep_finds_the_planted_association(data):
+    results = significance.sweep(data, n_permutations=200, workers=1)
+    assert len(results) == 15 * 127
+    pvalues = np.array([r["p_value"] for r in results])
+    assert pvalues[0] == pytest.approx(1 / 201.0)
+    assert (np.diff(pvalues[~np.isnan(pvalues)]) >= 0).all()
+    assert results[0]["table"].sum() == len(data)
+
+
+def test_results_do_not_depend_on_the_memory_budget(data, monkeypatch):
+    sweep = significance.sweep(data, n_permutations=60, workers=1)
+    pair = significance.pair_genre_test(data, n_permutations=60, workers=1)
+    monkeypatch.setattr(significance, "PERMUTATION_BYTES", 1)
+    again = significance.sweep(data, n_permutations=60, workers=1)
+    assert np.array_equal([r["p_value"] for r in again], [r["p_value"] for r in sweep], equal_nan=True)
+    assert significance.pair_genre_test(data, n_permutations=60, workers=1) == pair
+
+
+def test_empty_tests_are_rejected(data):
+    for test in (significance.sweep, significance.pair_genre_test):
+        with pytest.raises(ValueError):
+            test(data, n_permutations=0, workers=1)
+        with pytest.raises(ValueError):
+            test(empty_dataset(), n_permutations=10, workers=1)
@@ -0,0 +1,45 @@
+"""Tests of analytics/snapshot.py."""
+import numpy as np
+
+from analytics import load_dataset, open_snapshot
+from analytics.snapshot import refresh
+from models import GenreProf, Personality, User, bump_data_version
+
+COLUMNS = ["user_id", "age", "gender", "traits", "genres", "has_traits", "has_genres"]
+
+
+def assert_same(snapshot, data):
+    """Check that two datasets hold the same rows."""
+    for column in COLUMNS:
+        assert np.array_equal(getattr(snapshot, column), getattr(data, column)), column
+
+
+def test_refresh_replaces_only_changed_users(session, make_user, tmp_path):
+    directory = str(tmp_path / "snapshot")
+    users = [make_user("user{}".format(i), traits=[10 + i, 20, 30, 20, 10], genres={"Rock": i}) for i in range(5)]
+    manifest = refresh(session, directory)
+    assert manifest["rows"] == manifest["changed"] == 5
+    snapshot = open_snapshot(directory)
+    assert isinstance(snapshot.traits, np.memmap)
+    assert_same(snapshot, load_dataset(session))
+    assert refresh(session, directory)["changed"] == 0
+
+    # A new user, a quiz of a user without one, a new genre count and a deletion.
+    new = make_user("new", genres={"Pop": 2})
+    session.add(Personality(new, [40, 40, 40, 40, 40]))
+    profile = session.query(GenreProf).filter(GenreProf.user_id == users[1]).one()
+    profile.add_genre(Blues=3)
+    profile.version = bump_data_version(session)
+    session.query(Personality).filter(Personality.user_id == users[4]).delete()
+    session.query(GenreProf).filter(GenreProf.user_id == users[4]).delete()
+    session.query(User).filter(User.id_ == users[4]).delete()
+    session.commit()
+
+    manifest = refresh(session, directory)
+    assert manifest["generation"] == 2
+    assert manifest["changed"] == 2
+    assert_same(open_snapshot(directory), load_dataset(session))
+    assert refresh(session, directory, full=True)["changed"] == 5
+    assert_same(open_snapshot(directory), load_dataset(session))
+    # Only the files of the last two generations are kept.
+    assert len([p for p in (tmp_path / "snapshot").iterdir() if p.suffix == ".npy"]) == 2 * len(COLUMNS)